@@ -0,0 +1,25 @@
+import { type NextRequest, NextResponse } from "next/server"
+import { cacheHeaders, fetchFlask } from "@/lib/flask"
+
+export async function GET(request: NextRequest) {
+  const searchParams = request.nextUrl.searchParams
+  const prefix = searchParams.get("prefix")
+  const limit = searchParams.get("limit") || "8"
+
+  if (!prefix) {
+    return NextResponse.json({ suggestions: [] })
+  }
+
+  try {
+    const response = await fetchFlask(
+      `/api/autocomplete?prefix=${encodeURIComponent(prefix)}&limit=${encodeURIComponent(limit)}`,
+    )
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    return NextResponse.json(response.data, { headers: cacheHeaders(response) })
+  } catch (error) {
+    console.error("Error fetching suggestions:", error)
+    return NextResponse.json({ error: "Failed to fetch suggestions" }, { status: 500 })
+  }
+}
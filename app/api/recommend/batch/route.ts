@@ -0,0 +1,26 @@
+import { type NextRequest, NextResponse } from "next/server"
+import { FLASK_API_URL } from "@/lib/flask"
+
+export async function POST(request: NextRequest) {
+  const body = await request.json().catch(() => null)
+
+  if (!body || !Array.isArray(body.movies) || body.movies.length === 0) {
+    return NextResponse.json({ error: "A non-empty movies list is required" }, { status: 400 })
+  }
+
+  try {
+    const response = await fetch(`${FLASK_API_URL}/api/recommend/batch`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ movies: body.movies, n: body.n ?? 3 }),
+    })
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    const data = await response.json()
+    return NextResponse.json(data)
+  } catch (error) {
+    console.error("Error fetching batch recommendations:", error)
+    return NextResponse.json({ error: "Failed to fetch recommendations" }, { status: 500 })
+  }
+}
@@ -1,7 +1,5 @@
 import { type NextRequest, NextResponse } from "next/server"
-
-// Mock data for development - replace with actual API calls
-const FLASK_API_URL = process.env.FLASK_API_URL || "http://localhost:5000"
+import { cacheHeaders, fetchFlask } from "@/lib/flask"
 
 export async function GET(request: NextRequest) {
   const searchParams = request.nextUrl.searchParams
@@ -13,11 +11,11 @@ export async function GET(request: NextRequest) {
   }
 
   try {
-    const response = await fetch(`${FLASK_API_URL}/api/recommend?movie=${encodeURIComponent(movie)}&n=${n}`)
+    const response = await fetchFlask(`/api/recommend?movie=${encodeURIComponent(movie)}&n=${n}`)
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`)
     }
-    const data = await response.json()
+    const data = response.data
     return NextResponse.json({
       matched_movie: {
         title: data.match,
@@ -33,7 +31,7 @@ export async function GET(request: NextRequest) {
         director: rec.director,
         poster: rec.poster
       }))
-    })
+    }, { headers: cacheHeaders(response) })
   } catch (error) {
     console.error("Error fetching recommendations:", error)
     return NextResponse.json({ error: "Failed to fetch recommendations" }, { status: 500 })
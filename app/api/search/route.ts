@@ -1,6 +1,5 @@
 import { type NextRequest, NextResponse } from "next/server"
-
-const FLASK_API_URL = process.env.FLASK_API_URL || "http://localhost:5000"
+import { cacheHeaders, fetchFlask } from "@/lib/flask"
 
 export async function GET(request: NextRequest) {
   const searchParams = request.nextUrl.searchParams
@@ -12,12 +11,11 @@ export async function GET(request: NextRequest) {
   }
 
   try {
-    const response = await fetch(`${FLASK_API_URL}/api/search?q=${encodeURIComponent(query)}`)
+    const response = await fetchFlask(`/api/search?q=${encodeURIComponent(query)}`)
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`)
     }
-    const data = await response.json()
-    return NextResponse.json(data)
+    return NextResponse.json(response.data, { headers: cacheHeaders(response) })
   } catch (error) {
     console.error("Error searching movies:", error)
     return NextResponse.json({ error: "Failed to search movies" }, { status: 500 })
@@ -1,182 +1,392 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import pandas as pd
-import json
-from fuzzywuzzy import process
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import os
+
+from catalog import check_token
+from features import movie_from_payload
+from filters import parse_filters
+import http_cache
+from listing import parse_listing
+import metrics
+from metrics import request_phase
+from model import MAX_BATCH_SIZE, MAX_RECOMMENDATIONS
+from model_holder import READY, STARTUP_RETRY_AFTER, ModelHolder
+from precompute import PRECOMPUTED_STORE, SERVING_MODE, RecommendationStore
+from result_cache import ResultCache, request_key
 
 app = Flask(__name__)
 CORS(app)
+# Registered first so request timings include the readiness check
+metrics.instrument(app)
 
 print("Starting Flask server...")
 
 # -------------------------
-# Load datasets
+# Load model snapshot
 # -------------------------
-def load_data():
-    try:
-        print("Loading movie datasets...")
-        movies = pd.read_csv("tmdb_5000_movies.csv")
-        credits = pd.read_csv("tmdb_5000_credits.csv")
-        print("Merging datasets...")
-        df = movies.merge(credits, left_on='id', right_on='movie_id')
-        return df
-    except Exception as e:
-        print(f"Error loading data: {str(e)}")
-        return None
+# The model loads on a background thread so the server answers /api/status
+# right away. Handlers read model_holder.current once per request, so a reload
+# swapping in a new model never changes the model under a request already running
+model_holder = ModelHolder()
+
+# In precomputed mode /api/recommend is answered from the offline store and
+# the model (with its similarity data) is never loaded
+store = RecommendationStore(PRECOMPUTED_STORE) if SERVING_MODE == 'precomputed' else None
+if store is None:
+    model_holder.start()
+
+result_cache = ResultCache()
+
+# Endpoints that answer before the model is ready
+READY_EXEMPT = {'get_status', 'get_metrics', 'reload_model'}
+
+# Endpoints served in precomputed mode
+PRECOMPUTED_ENDPOINTS = {'get_status', 'get_metrics', 'get_recommendations'}
+
+@app.before_request
+def require_model():
+    if store is not None:
+        if request.method == 'OPTIONS' or request.endpoint is None or request.endpoint in PRECOMPUTED_ENDPOINTS:
+            store.check()
+            return None
+        return jsonify({'error': 'Not available in precomputed mode'}), 501
+
+    model = model_holder.current
+    if model is None:
+        if request.method == 'OPTIONS' or request.endpoint in READY_EXEMPT:
+            return None
+        response = jsonify(model_holder.not_ready())
+        response.headers['Retry-After'] = str(STARTUP_RETRY_AFTER)
+        return response, 503
+
+    # Pick up catalog updates made through other worker processes, and new data
+    model_holder.check()
+
+def served_version():
+    return store.tag if store is not None else model_holder.current.tag
+
+# Endpoints whose responses depend only on the request and the served version.
+# Registered after require_model, so conditional GETs are answered once the data
+# is current and before any matching or ranking
+CACHEABLE_ENDPOINTS = {'search_movies', 'autocomplete', 'get_recommendations', 'list_movies'}
+http_cache.enable(app, served_version, CACHEABLE_ENDPOINTS)
 
 # -------------------------
-# JSON parsing
+# Response payloads
 # -------------------------
-def parse_json_column(col, key=None, top_n=None):
-    parsed = []
-    for item in col:
-        try:
-            if pd.isna(item):
-                parsed.append("")
-                continue
-            data = json.loads(str(item).replace("'", '"'))
-            if isinstance(data, list):
-                if key:
-                    data = [d.get(key, '') for d in data]
-                if top_n:
-                    data = data[:top_n]
-                parsed.append(" ".join(filter(None, data)))
-            else:
-                parsed.append(str(data))
-        except:
-            parsed.append("")
-    return parsed
-
-# Load data
-df = load_data()
-
-if df is not None:
-    print("Processing movie data...")
-    # Process columns
-    df['genres'] = parse_json_column(df['genres'], key='name')
-    df['keywords'] = parse_json_column(df['keywords'], key='name')
-    df['production_companies'] = parse_json_column(df['production_companies'], key='name')
-    df['cast'] = parse_json_column(df['cast'], key='name', top_n=3)
-    
-    # Extract director from crew
-    def get_director(crew_data):
-        try:
-            crew = json.loads(str(crew_data).replace("'", '"'))
-            directors = [member['name'] for member in crew if member['job'] == 'Director']
-            return ' '.join(directors) if directors else ''
-        except:
-            return ''
-    
-    df['director'] = df['crew'].apply(get_director)
-    
-    # Combine features for similarity calculation
-    df['combined_features'] = df['genres'].fillna('') + ' ' + \
-                             df['keywords'].fillna('') + ' ' + \
-                             df['production_companies'].fillna('') + ' ' + \
-                             df['cast'].fillna('') + ' ' + \
-                             df['director'].fillna('')
-
-    # Add poster URL if available
-    df['poster_url'] = "https://image.tmdb.org/t/p/w500" + df['poster_path'].fillna("")
-
-    # Compute similarity
-    print("Computing similarity matrix...")
-    cv = CountVectorizer(stop_words='english')
-    vectors = cv.fit_transform(df['combined_features'])
-    similarity = cosine_similarity(vectors)
-    print("Setup complete!")
-else:
-    print("Failed to load movie data!")
-    similarity = None
+def search_payload(record, score):
+    return {
+        'id': record['id'],
+        'title': record['title'],
+        'genres': record['genres'],
+        'poster': record['poster_url'],
+        'rating': record['rating'],
+        'year': record['year'],
+        'score': score
+    }
+
+def suggestion_payload(record):
+    return {
+        'id': record['id'],
+        'title': record['title'],
+        'year': record['year'],
+        'poster': record['poster_url']
+    }
+
+def listing_payload(record):
+    return {
+        'id': record['id'],
+        'title': record['title'],
+        'genres': record['genres'],
+        'poster': record['poster_url'],
+        'rating': record['rating'],
+        'popularity': record['popularity'],
+        'releaseDate': record['release_date'],
+        'year': record['year']
+    }
+
+def recommendation_payload(record, score):
+    return {
+        'id': record['id'],
+        'title': record['title'],
+        'genres': record['genres'],
+        'rating': record['rating'],
+        'overview': record['overview'],
+        'releaseDate': record['release_date'],
+        'homepage': record['homepage'],
+        'cast': record['cast'],
+        'director': record['director'],
+        'poster': record['poster_url'],
+        'similarity': float(score)
+    }
 
 # -------------------------
 # API endpoints
 # -------------------------
 @app.route('/api/search', methods=['GET'])
 def search_movies():
-    if df is None:
-        return jsonify({'error': 'Movie database not loaded'}), 500
+    model = model_holder.current
 
     query = request.args.get('q', '')
     if not query:
         return jsonify([])
     
-    try:
-        all_titles = df['original_title'].tolist()
-        matches = process.extract(query, all_titles, limit=5)
-        results = []
-        
-        for title, score in matches:
-            movie = df[df['original_title'] == title].iloc[0]
-            results.append({
-                'title': title,
-                'genres': movie['genres'],
-                'poster': movie['poster_url'],
-                'rating': float(movie['vote_average']) if pd.notna(movie['vote_average']) else None,
-                'year': movie['release_date'][:4] if pd.notna(movie['release_date']) else None,
-                'score': score
-            })
-        
+    key = request_key('search', query)
+    results = result_cache.get(key, model.tag)
+    if results is not None:
         return jsonify(results)
+    
+    try:
+        with request_phase('match'):
+            matches = model.title_index.search(query, limit=5)
+        with request_phase('serialize'):
+            results = [search_payload(model.records[row], score) for _, score, row in matches]
+            result_cache.put(key, results, model.tag)
+            return jsonify(results)
     except Exception as e:
         print(f"Search error: {str(e)}")
         return jsonify({'error': f'Error searching movies: {str(e)}'}), 500
 
+@app.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    model = model_holder.current
+
+    prefix = request.args.get('prefix', '')
+    try:
+        limit = max(1, int(request.args.get('limit', 8)))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not prefix.strip():
+        return jsonify({'prefix': prefix, 'suggestions': [], 'fuzzy': False})
+
+    # Prefix matches come from the precomputed index; fuzzy search only when there are none
+    with request_phase('match'):
+        rows, fuzzy = model.autocomplete(prefix, limit)
+    with request_phase('serialize'):
+        return jsonify({
+            'prefix': prefix,
+            'suggestions': [suggestion_payload(model.records[row]) for row in rows],
+            'fuzzy': fuzzy
+        })
+
+def precomputed_recommendations(movie_name, movie_id, filters):
+    """/api/recommend answered from the precomputed store with one keyed read"""
+    if filters:
+        return jsonify({'error': 'Filters are not available in precomputed mode'}), 400
+    with request_phase('match'):
+        found = store.lookup(name=movie_name, movie_id=movie_id or None)
+    if not found or found[1] < 60:
+        return jsonify({'error': 'Movie not found'}), 404
+
+    entry, match_score = found
+    with request_phase('serialize'):
+        matched = entry['movie']
+        return jsonify({
+            'match': matched['title'],
+            'matchId': matched['id'],
+            'matchScore': match_score,
+            'recommendations': [recommendation_payload(record, score)
+                                for record, score in entry['recommendations'][:6]]
+        })
+
+@app.route('/api/movies', methods=['GET'])
+def list_movies():
+    model = model_holder.current
+
+    try:
+        page = parse_listing(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'year, year_from, year_to and min_rating must be numbers'}), 400
+
+    # Keyset pages: pass nextCursor back as cursor, so deep pages cost the same as the first
+    try:
+        with request_phase('rank'):
+            rows, next_cursor, total = model.list_movies(filters=filters, **page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with request_phase('serialize'):
+        return jsonify({
+            'movies': [listing_payload(model.records[row]) for row in rows],
+            'total': total,
+            'nextCursor': next_cursor,
+            'sort': page['sort'],
+            'order': 'desc' if page['descending'] else 'asc'
+        })
+
 @app.route('/api/recommend', methods=['GET'])
 def get_recommendations():
-    if df is None or similarity is None:
-        return jsonify({'error': 'Movie database not loaded'}), 500
+    model = model_holder.current
 
     movie_name = request.args.get('movie', '')
-    if not movie_name:
-        return jsonify({'error': 'Movie name is required'}), 400
+    movie_id = request.args.get('id')
+    if not movie_name and not movie_id:
+        return jsonify({'error': 'Movie name or id is required'}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'year, year_from, year_to and min_rating must be numbers'}), 400
+    if store is not None:
+        return precomputed_recommendations(movie_name, movie_id, filters)
+    
+    key = request_key('recommend', movie_name, movie_id, tuple(sorted(filters.items())))
+    payload = result_cache.get(key, model.tag)
+    if payload is not None:
+        return jsonify(payload)
     
     try:
-        all_titles = df['original_title'].tolist()
-        closest_match = process.extractOne(movie_name, all_titles)
+        with request_phase('match'):
+            closest_match = model.resolve(name=movie_name, movie_id=movie_id or None)
         if not closest_match or closest_match[1] < 60:  # If match score is less than 60%
             return jsonify({'error': 'Movie not found'}), 404
             
-        movie_idx = df[df['original_title'] == closest_match[0]].index[0]
-        sim_scores = list(enumerate(similarity[movie_idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+        movie_idx, match_score = closest_match
         
-        recommended = []
-        for i, score in sim_scores[1:7]:  # Get top 6 recommendations
-            movie_data = df.iloc[i]
-            recommended.append({
-                'title': movie_data['original_title'],
-                'genres': movie_data['genres'],
-                'rating': float(movie_data['vote_average']) if pd.notna(movie_data['vote_average']) else None,
-                'overview': movie_data['overview'] if pd.notna(movie_data['overview']) else None,
-                'releaseDate': movie_data['release_date'] if pd.notna(movie_data['release_date']) else None,
-                'homepage': movie_data['homepage'] if pd.notna(movie_data['homepage']) else None,
-                'cast': movie_data['cast'],
-                'director': movie_data['director'],
-                'poster': movie_data['poster_url'],
-                'similarity': float(score)
-            })
-        
-        return jsonify({
-            'match': closest_match[0],
-            'matchScore': closest_match[1],
-            'recommendations': recommended
-        })
+        with request_phase('rank'):
+            ranked = model.recommend(movie_idx, 6, filters)  # Get top 6 recommendations
+        with request_phase('serialize'):
+            recommended = [recommendation_payload(model.records[i], score) for i, score in ranked]
+            matched = model.records[movie_idx]
+            
+            payload = {
+                'match': matched['title'],
+                'matchId': matched['id'],
+                'matchScore': match_score,
+                'recommendations': recommended
+            }
+            result_cache.put(key, payload, model.tag)
+            return jsonify(payload)
     except Exception as e:
         print(f"Recommendation error: {str(e)}")
         return jsonify({'error': f'Error getting recommendations: {str(e)}'}), 500
 
+@app.route('/api/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    model = model_holder.current
+
+    body = request.get_json(silent=True) or {}
+    seeds = body.get('movies')
+    if not isinstance(seeds, list) or not seeds:
+        return jsonify({'error': 'A non-empty list of movies is required'}), 400
+    if len(seeds) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} movies per batch'}), 400
+    try:
+        n = int(body.get('n', 6))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'n must be an integer'}), 400
+    if not 0 <= n <= MAX_RECOMMENDATIONS:
+        return jsonify({'error': f'n must be between 0 and {MAX_RECOMMENDATIONS}'}), 400
+
+    try:
+        # Drop weak fuzzy matches, then rank all remaining seeds together
+        with request_phase('match'):
+            matches = [match if match and match[1] >= 60 else None for match in model.resolve_many(seeds)]
+        with request_phase('rank'):
+            ranked = iter(model.recommend_batch([match[0] for match in matches if match], n))
+
+        with request_phase('serialize'):
+            results = []
+            for seed, match in zip(seeds, matches):
+                if match is None:
+                    results.append({'query': seed, 'error': 'Movie not found'})
+                    continue
+                matched = model.records[match[0]]
+                results.append({
+                    'query': seed,
+                    'match': matched['title'],
+                    'matchId': matched['id'],
+                    'matchScore': match[1],
+                    'recommendations': [recommendation_payload(model.records[i], score)
+                                        for i, score in next(ranked)]
+                })
+
+            return jsonify({'results': results})
+    except Exception as e:
+        print(f"Batch recommendation error: {str(e)}")
+        return jsonify({'error': f'Error getting recommendations: {str(e)}'}), 500
+
+# -------------------------
+# Catalog updates
+# -------------------------
+def catalog_write(op, movie_id, body=None):
+    """Validate, journal and apply one catalog update; returns a Flask response"""
+    if not check_token(request.headers):
+        return jsonify({'error': 'Invalid catalog token'}), 403
+
+    movie = None
+    if op != 'remove':
+        if isinstance(body, dict) and movie_id is not None:
+            body = dict(body, id=movie_id)
+        try:
+            movie = movie_from_payload(body)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        movie_id = movie['id']
+
+    with model_holder.update_lock:
+        model = model_holder.sync_journal()
+        exists = model.movie_lookup.by_id(movie_id) is not None
+        if op == 'add' and exists:
+            return jsonify({'error': f'Movie {movie_id} already exists'}), 409
+        if op != 'add' and not exists:
+            return jsonify({'error': 'Movie not found'}), 404
+        try:
+            model = model_holder.commit_update(op, movie_id, movie)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': str(e)}), 409
+
+    if op == 'remove':
+        return jsonify({'removed': movie_id, 'revision': model.revision})
+    record = model.records[model.movie_lookup.by_id(movie_id)]
+    return jsonify(dict(search_payload(record, 100), revision=model.revision)), 201 if op == 'add' else 200
+
+@app.route('/api/catalog/movies', methods=['POST'])
+def add_movie():
+    return catalog_write('add', None, request.get_json(silent=True))
+
+@app.route('/api/catalog/movies/<int:movie_id>', methods=['PUT'])
+def update_movie(movie_id):
+    return catalog_write('update', movie_id, request.get_json(silent=True))
+
+@app.route('/api/catalog/movies/<int:movie_id>', methods=['DELETE'])
+def remove_movie(movie_id):
+    return catalog_write('remove', movie_id)
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_model():
+    if not check_token(request.headers):
+        return jsonify({'error': 'Invalid catalog token'}), 403
+    if not model_holder.reload():
+        return jsonify({'error': 'A reload is already running'}), 409
+    return jsonify({'reloading': True}), 202
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
+    model = model_holder.current
+    if store is not None:
+        return jsonify({
+            'status': READY,
+            'mode': SERVING_MODE,
+            'database_loaded': False,
+            'similarity_computed': False,
+            'movie_count': store.meta.get('movie_count', 0),
+            'precomputed': store.info()
+        })
     return jsonify({
-        'status': 'ok',
-        'database_loaded': df is not None,
-        'similarity_computed': similarity is not None,
-        'movie_count': len(df) if df is not None else 0
+        'status': model_holder.state,
+        'mode': SERVING_MODE,
+        'database_loaded': model is not None,
+        'similarity_computed': model is not None,
+        'movie_count': len(model) if model is not None else 0,
+        'model': model_holder.status(),
+        'cache': result_cache.stats()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(model_holder, result_cache), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
\ No newline at end of file
@@ -1,84 +1,51 @@
 # app.py
 
-import pandas as pd
-import json
 import streamlit as st
-from fuzzywuzzy import process
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import os
 
-# -------------------------
-# Load datasets
-# -------------------------
-@st.cache_data
-def load_data():
-    movies = pd.read_csv("tmdb_5000_movies.csv")
-    credits = pd.read_csv("tmdb_5000_credits.csv")
-    df = movies.merge(credits, left_on='id', right_on='movie_id')
-    return df
-
-df = load_data()
+from model_holder import ModelHolder
+from snapshot import dataset_fingerprint
 
 # -------------------------
-# JSON parsing
+# Load model snapshot
 # -------------------------
-def parse_json_column(col, key=None, top_n=None):
-    parsed = []
-    for item in col:
-        try:
-            data = json.loads(item.replace("'", '"'))
-            if isinstance(data, list):
-                if key:
-                    data = [d.get(key, '') for d in data]
-                if top_n:
-                    data = data[:top_n]
-                parsed.append(" ".join(data))
-            else:
-                parsed.append(str(data))
-        except:
-            parsed.append("")
-    return parsed
-
-df['genres'] = parse_json_column(df['genres'], key='name')
-df['keywords'] = parse_json_column(df['keywords'], key='name')
-df['production_companies'] = parse_json_column(df['production_companies'], key='name')
-df['cast'] = parse_json_column(df['cast'], key='name', top_n=3)
-df['director'] = parse_json_column(df['crew'], key='name')
-df['combined_features'] = df['genres'] + " " + df['keywords'] + " " + df['production_companies'] + " " + df['cast'] + " " + df['director']
+# Streamlit reruns this script on every interaction. The model is a
+# process-wide resource shared by all sessions, built once per dataset
+# fingerprint; max_entries=1 releases the old model when the CSVs change.
+@st.cache_resource(max_entries=1, show_spinner="Loading movie model...")
+def get_model_holder(fingerprint):
+    holder = ModelHolder(check_interval=0)
+    holder.load()
+    return holder
 
-# Add poster URL if available
-df['poster_url'] = "https://image.tmdb.org/t/p/w500" + df['poster_path'].fillna("")
-
-# -------------------------
-# Compute similarity
-# -------------------------
-cv = CountVectorizer(stop_words='english')
-vectors = cv.fit_transform(df['combined_features'])
-similarity = cosine_similarity(vectors)
+# Catalog updates journalled by the API servers, checked at most once a second,
+# arrive as a new model; each rerun uses the model that was current when it started
+model_holder = get_model_holder(dataset_fingerprint())
+model_holder.check()
+model = model_holder.current
 
 # -------------------------
 # Recommendation function
 # -------------------------
 def get_movie_recommendations(movie_name, n=3):
-    all_titles = df['original_title'].tolist()
-    closest_match = process.extractOne(movie_name, all_titles)[0]
-    movie_idx = df[df['original_title'] == closest_match].index[0]
-    sim_scores = list(enumerate(similarity[movie_idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+    match = model.resolve(name=movie_name)
+    if match is None:
+        raise ValueError(f"no title resembles '{movie_name}'")
+    movie_idx = match[0]
+    closest_match = model.records[movie_idx]['title']
     
     recommended = []
-    for i, score in sim_scores[1:n+1]:
+    for i, score in model.recommend(movie_idx, n):
+        record = model.records[i]
         recommended.append({
-            'Title': df.iloc[i]['original_title'],
-            'Genres': df.iloc[i]['genres'],
-            'Rating': df.iloc[i]['vote_average'],
-            'Overview': df.iloc[i]['overview'],
-            'Release Date': df.iloc[i]['release_date'],
-            'Homepage': df.iloc[i]['homepage'] if pd.notna(df.iloc[i]['homepage']) else "N/A",
-            'Cast': df.iloc[i]['cast'],
-            'Director': df.iloc[i]['director'],
-            'Poster': df.iloc[i]['poster_url']
+            'Title': record['title'],
+            'Genres': record['genres'],
+            'Rating': record['rating'],
+            'Overview': record['overview'],
+            'Release Date': record['release_date'],
+            'Homepage': record['homepage'] or "N/A",
+            'Cast': record['cast'],
+            'Director': record['director'],
+            'Poster': record['poster_url']
         })
     return closest_match, recommended
 
@@ -99,7 +66,7 @@ if movie_input:
         for rec in recommendations:
             col1, col2 = st.columns([1, 3])
             with col1:
-                if rec['Poster'] != "https://image.tmdb.org/t/p/w500":
+                if rec['Poster']:
                     st.image(rec['Poster'], use_column_width=True)
             with col2:
                 st.markdown(f"### {rec['Title']}")
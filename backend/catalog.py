@@ -0,0 +1,116 @@
+"""
+Incremental catalog updates for the movie recommender
+Adds, updates and removals are appended to a JSONL journal; every server
+process replays new entries into its running model, and the next full
+snapshot build folds them in (picking up new vocabulary terms too).
+
+Usage:
+    python backend/catalog.py add movie.json [--url URL]
+    python backend/catalog.py update ID movie.json [--url URL]
+    python backend/catalog.py remove ID [--url URL]
+"""
+
+import argparse
+import hmac
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+CATALOG_JOURNAL = os.environ.get('CATALOG_JOURNAL', 'catalog_updates.jsonl')
+
+# Shared secret for the catalog and admin endpoints; unset disables them
+CATALOG_API_TOKEN = os.environ.get('CATALOG_API_TOKEN')
+
+OPS = ('add', 'update', 'remove')
+
+
+def append_entry(entry, path=CATALOG_JOURNAL):
+    """Append one {'op', 'id', 'movie'} entry to the journal; returns the (start, end) offsets of its line"""
+    line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+    with open(path, 'ab') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+        end = f.tell()
+    return end - len(line), end
+
+
+def journal_size(path=CATALOG_JOURNAL):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def read_entries(path=CATALOG_JOURNAL, offset=0):
+    """Journal entries after a byte offset, and the offset just past the last complete line"""
+    entries = []
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # another process is still writing it
+                offset += len(line)
+                if line.strip():
+                    entries.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return entries, offset
+
+
+def check_token(headers):
+    """True when the request carries the configured catalog token; always False when none is configured"""
+    if not CATALOG_API_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get('X-Catalog-Token', '').encode(), CATALOG_API_TOKEN.encode())
+
+
+def _request(method, url, token, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    if token:
+        req.add_header('X-Catalog-Token', token)
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add, update or remove movies in a running recommender")
+    parser.add_argument('--url', default='http://localhost:5000', help="base URL of the API server")
+    parser.add_argument('--token', default=CATALOG_API_TOKEN, help="value for the X-Catalog-Token header")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    add = sub.add_parser('add', help="add a movie from a JSON file")
+    add.add_argument('file')
+    update = sub.add_parser('update', help="replace a movie's details from a JSON file")
+    update.add_argument('id', type=int)
+    update.add_argument('file')
+    remove = sub.add_parser('remove', help="remove a movie")
+    remove.add_argument('id', type=int)
+
+    args = parser.parse_args()
+    endpoint = args.url.rstrip('/') + '/api/catalog/movies'
+
+    if args.command == 'remove':
+        status, body = _request('DELETE', f"{endpoint}/{args.id}", args.token)
+    else:
+        with open(args.file) as f:
+            movie = json.load(f)
+        if args.command == 'add':
+            status, body = _request('POST', endpoint, args.token, movie)
+        else:
+            status, body = _request('PUT', f"{endpoint}/{args.id}", args.token, movie)
+
+    print(json.dumps(body, indent=2))
+    if status >= 400:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Disk-backed display catalog for the movie recommender
+Each movie's display record (overview, cast, homepage, ...) lives in an
+embedded SQLite file keyed by row and TMDB id, and is read only for the
+rows a request returns. The few fields the in-memory indexes need (title,
+id, ranking and filter attributes) are stored as plain columns and read
+once at load. Snapshots ship the file, so every worker shares it through
+the OS page cache instead of holding its own copy of the catalog.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+try:
+    import orjson
+
+    def _dumps(value):
+        return orjson.dumps(value).decode()
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(value):
+        return json.dumps(value, separators=(',', ':'))
+    _loads = json.loads
+
+# Record fields also kept as columns, loaded into memory for the title, filter and ranking indexes
+INDEX_FIELDS = ('id', 'title', 'release_date', 'rating', 'vote_count', 'popularity', 'original_language')
+
+# Rows per insert batch and per read batch when iterating
+CATALOG_BATCH_ROWS = 1000
+
+SCHEMA = """
+CREATE TABLE movies (
+    row INTEGER PRIMARY KEY,
+    id INTEGER NOT NULL,
+    title TEXT,
+    release_date TEXT,
+    rating REAL,
+    vote_count REAL,
+    popularity REAL,
+    original_language TEXT,
+    genre_list TEXT,
+    record TEXT NOT NULL
+);
+"""
+
+
+def write_catalog(path, rows):
+    """Write (record, genre_list) pairs, in row order, to a new catalog file at path"""
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        insert = (f"INSERT INTO movies (row, {', '.join(INDEX_FIELDS)}, genre_list, record) "
+                  f"VALUES ({', '.join('?' * (len(INDEX_FIELDS) + 3))})")
+        batch = []
+        for row, (record, genre_list) in enumerate(rows):
+            batch.append((row, *(record[field] for field in INDEX_FIELDS), genre_list, _dumps(record)))
+            if len(batch) == CATALOG_BATCH_ROWS:
+                connection.executemany(insert, batch)
+                batch = []
+        connection.executemany(insert, batch)
+        connection.execute("CREATE INDEX movies_id ON movies (id)")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _close(connection, path=None, pid=None):
+    connection.close()
+    if path is not None and os.getpid() == pid:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _CatalogFile:
+    """Read-only connection to a catalog file, shared by a store and its copies
+
+    A temporary file is deleted once the last store using it is garbage
+    collected. Forked processes (precompute workers) open their own
+    connection on first read.
+    """
+
+    def __init__(self, path, temporary=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+        weakref.finalize(self, _close, self._connection, path if temporary else None, os.getpid())
+
+    def _connect(self):
+        self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._pid = os.getpid()
+
+    def query(self, sql, params=()):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            return self._connection.execute(sql, params).fetchall()
+
+    def backup(self, target):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connect()
+            self._connection.backup(target)
+
+
+class CatalogStore:
+    """Read-only sequence of display records (None for removed movies) backed by a catalog file
+
+    Catalog updates applied by the running model go to an in-memory overlay,
+    never to the file, which stays identical to the snapshot it came from.
+    A temporary store deletes its file once garbage collected.
+    """
+
+    def __init__(self, path, temporary=False):
+        self.path = path
+        self._file = _CatalogFile(path, temporary)
+        self._stored = self._query("SELECT COUNT(*) FROM movies")[0][0]
+        self._length = self._stored
+        self._overlay = {}
+
+    def _query(self, sql, params=()):
+        return self._file.query(sql, params)
+
+    def copy(self):
+        """A store sharing this one's file, whose updates leave this one untouched"""
+        store = copy.copy(self)
+        store._overlay = dict(self._overlay)
+        return store
+
+    @classmethod
+    def temporary(cls, rows):
+        """Store over a new temporary file holding (record, genre_list) pairs"""
+        fd, path = tempfile.mkstemp(prefix='catalog-', suffix='.sqlite')
+        os.close(fd)
+        try:
+            write_catalog(path, rows)
+        except BaseException:
+            os.remove(path)
+            raise
+        return cls(path, temporary=True)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        if row in self._overlay:
+            return self._overlay[row]
+        if not 0 <= row < self._stored:
+            raise IndexError(row)
+        return _loads(self._query("SELECT record FROM movies WHERE row = ?", (row,))[0][0])
+
+    def __setitem__(self, row, record):
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        self._overlay[row] = record
+
+    def append(self, record):
+        self._overlay[self._length] = record
+        self._length += 1
+
+    def __iter__(self):
+        for start in range(0, self._stored, CATALOG_BATCH_ROWS):
+            batch = self._query("SELECT row, record FROM movies WHERE row >= ? AND row < ? ORDER BY row",
+                                (start, start + CATALOG_BATCH_ROWS))
+            for row, text in batch:
+                yield self._overlay[row] if row in self._overlay else _loads(text)
+        for row in range(self._stored, self._length):
+            yield self._overlay[row]
+
+    def columns(self):
+        """INDEX_FIELDS and genre_list as lists in row order, as stored (before any overlay)"""
+        names = INDEX_FIELDS + ('genre_list',)
+        rows = self._query(f"SELECT {', '.join(names)} FROM movies ORDER BY row")
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        return {name: list(column) for name, column in zip(names, values)}
+
+    def save(self, path):
+        """Copy the stored catalog (without the overlay) to path"""
+        target = sqlite3.connect(path)
+        try:
+            self._file.backup(target)
+        finally:
+            target.close()
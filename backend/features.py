@@ -0,0 +1,320 @@
+"""
+Feature extraction for the movie recommender
+Streams the raw TMDB movies/credits CSVs in chunks and keeps only the text
+features we vectorize and the display fields we serve
+"""
+
+import ast
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from metrics import StageTimer
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+MOVIES_CSV = os.environ.get('MOVIES_CSV', 'tmdb_5000_movies.csv')
+CREDITS_CSV = os.environ.get('CREDITS_CSV', 'tmdb_5000_credits.csv')
+
+# Processes used to parse the JSON columns; 0 or 1 parses in-process
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', '0'))
+
+# CSV rows read per chunk while ingesting
+INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', '20000'))
+
+# 'count' learns a vocabulary over the whole catalog; 'hashing' needs no vocabulary,
+# so very large catalogs vectorize chunk by chunk in bounded memory
+VECTORIZER = os.environ.get('FEATURE_VECTORIZER', 'count')
+HASHING_FEATURES = int(os.environ.get('HASHING_FEATURES', str(2 ** 20)))
+
+POSTER_BASE_URL = "https://image.tmdb.org/t/p/w500"
+
+# Columns kept after feature extraction; the raw JSON columns are dropped
+DISPLAY_COLUMNS = [
+    'id', 'original_title', 'genres', 'genre_list', 'keywords', 'production_companies', 'cast', 'director',
+    'overview', 'release_date', 'homepage', 'poster_path',
+    'vote_average', 'vote_count', 'popularity', 'original_language',
+]
+
+# Raw CSV columns read while ingesting; the rest are skipped by the CSV parser
+MOVIE_CSV_COLUMNS = {
+    'id', 'original_title', 'genres', 'keywords', 'production_companies', 'overview', 'release_date',
+    'homepage', 'poster_path', 'vote_average', 'vote_count', 'popularity', 'original_language',
+}
+CREDIT_CSV_COLUMNS = {'movie_id', 'cast', 'crew'}
+
+
+def _loads(text):
+    """Parse one JSON cell; falls back to Python literal syntax (single quotes)"""
+    try:
+        return _json_loads(text)
+    except ValueError:
+        return ast.literal_eval(text)
+
+
+def _join_names(items, top_n=None):
+    if not isinstance(items, list):
+        return str(items)
+    names = [item.get('name') for item in items if isinstance(item, dict)]
+    if top_n:
+        names = names[:top_n]
+    return " ".join(filter(None, names))
+
+
+def _genre_list(items):
+    """Genre names joined with '|' so multi-word genres stay intact for filtering"""
+    if not isinstance(items, list):
+        return ""
+    return "|".join(filter(None, (item.get('name') for item in items if isinstance(item, dict))))
+
+
+def _directors(crew):
+    if not isinstance(crew, list):
+        return ""
+    names = [member.get('name') for member in crew
+             if isinstance(member, dict) and member.get('job') == 'Director']
+    return " ".join(filter(None, names))
+
+
+def _top_cast(items):
+    return _join_names(items, top_n=3)
+
+
+# Raw column -> [(output column, extractor applied to the parsed cell)]
+JSON_FEATURES = {
+    'genres': [('genres', _join_names), ('genre_list', _genre_list)],
+    'keywords': [('keywords', _join_names)],
+    'production_companies': [('production_companies', _join_names)],
+    'cast': [('cast', _top_cast)],
+    'crew': [('director', _directors)],
+}
+
+
+def parse_json_features(columns):
+    """Parse every JSON column once and extract the text features
+
+    columns maps raw column name to a list of cells. Returns the extracted
+    features (output column -> list of strings) and the number of cells
+    per raw column that could not be parsed.
+    """
+    features = {}
+    errors = {}
+    for raw, outputs in JSON_FEATURES.items():
+        if raw not in columns:
+            continue
+        values = [[] for _ in outputs]
+        failed = 0
+        for cell in columns[raw]:
+            parsed = None
+            if isinstance(cell, str) and cell:
+                try:
+                    parsed = _loads(cell)
+                except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                    failed += 1
+            for column, (_, extract) in zip(values, outputs):
+                column.append(extract(parsed) if parsed is not None else "")
+        for (output, _), column in zip(outputs, values):
+            features[output] = column
+        errors[raw] = failed
+    return features, errors
+
+
+def parse_json_columns(df, workers=None, chunk_size=2000, raw_columns=None):
+    """Run parse_json_features over a DataFrame, optionally in a process pool"""
+    raw_columns = list(raw_columns or JSON_FEATURES)
+    columns = {raw: df[raw].tolist() if raw in df.columns else [""] * len(df) for raw in raw_columns}
+
+    if not workers or workers <= 1 or len(df) <= chunk_size:
+        return parse_json_features(columns)
+
+    chunks = [{raw: values[start:start + chunk_size] for raw, values in columns.items()}
+              for start in range(0, len(df), chunk_size)]
+    features = {output: [] for raw in raw_columns for output, _ in JSON_FEATURES[raw]}
+    errors = {raw: 0 for raw in raw_columns}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_features, chunk_errors in pool.map(parse_json_features, chunks):
+            for output, values in chunk_features.items():
+                features[output].extend(values)
+            for raw, failed in chunk_errors.items():
+                errors[raw] += failed
+    return features, errors
+
+
+def _credit_features(credits_path, chunk_rows, workers, timer):
+    """TMDB id -> (top cast, director) strings, streamed so the raw crew JSON is never held whole"""
+    credits = {}
+    errors = {'cast': 0, 'crew': 0}
+    reader = pd.read_csv(credits_path, usecols=lambda column: column in CREDIT_CSV_COLUMNS, chunksize=chunk_rows)
+    for chunk in timer.iterate(reader, 'csv_load'):
+        with timer.stage('json_parse'):
+            features, chunk_errors = parse_json_columns(chunk, workers=workers, raw_columns=('cast', 'crew'))
+        for movie_id, cast, director in zip(chunk['movie_id'].tolist(), features['cast'], features['director']):
+            credits.setdefault(int(movie_id), (cast, director))
+        for raw, failed in chunk_errors.items():
+            errors[raw] += failed
+    return credits, errors
+
+
+def stream_catalog(movies_path=MOVIES_CSV, credits_path=CREDITS_CSV, chunk_rows=INGEST_CHUNK_ROWS,
+                   workers=PARSE_WORKERS, timer=None):
+    """Load, merge and extract features chunk by chunk
+
+    Credits are reduced to their cast/director strings first, then the
+    movies CSV is streamed and joined against them (movies without credits
+    are dropped, as in an inner merge). Only DISPLAY_COLUMNS plus
+    combined_features are kept, so memory follows the extracted catalog
+    rather than the raw CSVs. Returns the DataFrame and the per-column count
+    of unparseable JSON cells. Reading, JSON parsing and merging are timed
+    as the 'csv_load', 'json_parse' and 'merge' stages of timer, if given.
+    """
+    timer = timer or StageTimer()
+    credits, parse_errors = _credit_features(credits_path, chunk_rows, workers, timer)
+    movie_raw_columns = ('genres', 'keywords', 'production_companies')
+    parse_errors.update({raw: 0 for raw in movie_raw_columns})
+
+    credit_ids = pd.Index(list(credits))
+    frames = []
+    reader = pd.read_csv(movies_path, usecols=lambda column: column in MOVIE_CSV_COLUMNS, chunksize=chunk_rows)
+    for chunk in timer.iterate(reader, 'csv_load'):
+        with timer.stage('merge'):
+            chunk = chunk[chunk['id'].isin(credit_ids)].reset_index(drop=True)
+        with timer.stage('json_parse'):
+            features, chunk_errors = parse_json_columns(chunk, workers=workers, raw_columns=movie_raw_columns)
+            for output, values in features.items():
+                chunk[output] = values
+        for raw, failed in chunk_errors.items():
+            parse_errors[raw] += failed
+
+        with timer.stage('merge'):
+            people = [credits[int(movie_id)] for movie_id in chunk['id'].tolist()]
+            chunk['cast'] = [cast for cast, _ in people]
+            chunk['director'] = [director for _, director in people]
+            chunk['combined_features'] = chunk['genres'] + ' ' + \
+                                         chunk['keywords'] + ' ' + \
+                                         chunk['production_companies'] + ' ' + \
+                                         chunk['cast'] + ' ' + \
+                                         chunk['director']
+
+            # Poster paths are optional in the TMDB export
+            if 'poster_path' not in chunk.columns:
+                chunk['poster_path'] = None
+            frames.append(chunk[DISPLAY_COLUMNS + ['combined_features']])
+
+    if not frames:
+        return pd.DataFrame(columns=DISPLAY_COLUMNS + ['combined_features']), parse_errors
+    with timer.stage('merge'):
+        return pd.concat(frames, ignore_index=True), parse_errors
+
+
+def make_vectorizer(kind=VECTORIZER, vocabulary=None, n_features=HASHING_FEATURES):
+    """CountVectorizer (fitted, or fixed to a vocabulary) or a stateless HashingVectorizer
+
+    Both count raw term occurrences (no sign flipping or normalisation) so
+    cosine scores mean the same thing either way.
+    """
+    # scikit-learn is only needed to build, keep it off the snapshot load path
+    from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+
+    if kind == 'hashing':
+        return HashingVectorizer(stop_words='english', n_features=n_features, alternate_sign=False, norm=None)
+    return CountVectorizer(stop_words='english', vocabulary=vocabulary)
+
+
+def _names_field(value, extract):
+    """Catalog API list field: plain names, TMDB {'name': ...} objects or a JSON string of either"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        try:
+            value = _loads(value)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            return value
+    if isinstance(value, list):
+        value = [item if isinstance(item, dict) else {'name': str(item)} for item in value]
+    return extract(value)
+
+
+def movie_from_payload(payload):
+    """One catalog row (DISPLAY_COLUMNS plus combined_features) from a catalog API body
+
+    id and original_title (or title) are required; raises ValueError otherwise.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("movie must be a JSON object")
+    try:
+        movie_id = int(payload['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("movie needs an integer 'id'")
+    title = payload.get('original_title') or payload.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("movie needs an 'original_title' or 'title'")
+
+    if payload.get('director') is not None:
+        director = str(payload['director'])
+    else:
+        director = _names_field(payload.get('crew'), _directors)
+
+    movie = {
+        'id': movie_id,
+        'original_title': title.strip(),
+        'genres': _names_field(payload.get('genres'), _join_names),
+        'genre_list': _names_field(payload.get('genres'), _genre_list),
+        'keywords': _names_field(payload.get('keywords'), _join_names),
+        'production_companies': _names_field(payload.get('production_companies'), _join_names),
+        'cast': _names_field(payload.get('cast'), _top_cast),
+        'director': director,
+    }
+    for column in ('overview', 'release_date', 'homepage', 'poster_path', 'original_language'):
+        value = payload.get(column)
+        movie[column] = str(value) if value is not None else None
+    for column in ('vote_average', 'vote_count', 'popularity'):
+        try:
+            movie[column] = float(payload[column]) if payload.get(column) is not None else None
+        except (TypeError, ValueError):
+            raise ValueError(f"'{column}' must be a number")
+
+    movie['combined_features'] = ' '.join(
+        movie[column] for column in ('genres', 'keywords', 'production_companies', 'cast', 'director'))
+    return movie
+
+
+def fold_catalog_updates(df, entries):
+    """Apply catalog journal entries to an extracted DataFrame before vectorizing
+
+    Updated movies keep their row; added movies are appended and removed
+    movies dropped, so a full rebuild matches the incrementally updated model.
+    """
+    rows = {movie_id: position for position, movie_id in enumerate(df['id'].tolist())}
+    updated = {}
+    removed = set()
+    added = []
+    for entry in entries:
+        movie_id = int(entry['id'])
+        if entry['op'] == 'remove':
+            removed.add(movie_id)
+            continue
+        removed.discard(movie_id)
+        if movie_id in rows:
+            updated[rows[movie_id]] = entry['movie']
+        else:
+            rows[movie_id] = len(df) + len(added)
+            added.append(entry['movie'])
+
+    columns = [column for column in DISPLAY_COLUMNS + ['combined_features'] if column in df.columns]
+    df = df[columns].reset_index(drop=True)
+    for position, movie in updated.items():
+        if position < len(df):
+            df.loc[position, columns] = [movie.get(column) for column in columns]
+        else:
+            added[position - len(df)] = movie
+    if added:
+        df = pd.concat([df, pd.DataFrame(added)[columns]], ignore_index=True)
+    if removed:
+        df = df[~df['id'].isin(removed)].reset_index(drop=True)
+    return df
@@ -0,0 +1,186 @@
+"""
+Attribute indexes for filtered recommendations
+Genre and language bitmaps plus sorted year/rating arrays, built once at load
+and updated one row at a time by catalog updates
+"""
+
+import copy
+
+import numpy as np
+
+
+def parse_filters(args):
+    """Filters from request query parameters; raises ValueError on bad numbers
+
+    genre takes a comma-separated list and a movie must have all of them;
+    year is shorthand for year_from and year_to both set to it.
+    """
+    filters = {}
+    genre = args.get('genre')
+    if genre:
+        filters['genres'] = tuple(sorted({name.strip().lower() for name in genre.split(',') if name.strip()}))
+    if args.get('year'):
+        filters['year_from'] = filters['year_to'] = int(args['year'])
+    if args.get('year_from'):
+        filters['year_from'] = int(args['year_from'])
+    if args.get('year_to'):
+        filters['year_to'] = int(args['year_to'])
+    if args.get('min_rating'):
+        filters['min_rating'] = float(args['min_rating'])
+    if args.get('language'):
+        filters['language'] = args['language'].strip().lower()
+    return filters
+
+
+def _year(date):
+    """Release year of a TMDB date string, or -1"""
+    return int(date[:4]) if isinstance(date, str) and date[:4].isdigit() else -1
+
+
+def _sorted_position(order, sorted_values, value, row):
+    """Where (value, row) sits in a value-sorted order whose ties are in row order"""
+    lo = np.searchsorted(sorted_values, value, side='left')
+    hi = np.searchsorted(sorted_values, value, side='right')
+    return lo + int(np.searchsorted(order[lo:hi], row))
+
+
+def _sorted_range_mask(order, sorted_values, low, high, size):
+    """Rows whose value lies in [low, high], found by binary search on the sorted copy"""
+    start = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+    stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side='right')
+    mask = np.zeros(size, dtype=bool)
+    mask[order[start:stop]] = True
+    return mask
+
+
+class AttributeIndex:
+    """Precomputed per-attribute row sets for genre, release year, rating and language"""
+
+    def __init__(self, genre_lists, release_dates, ratings, languages):
+        self.size = len(ratings)
+
+        self.genres = {}
+        for row, names in enumerate(genre_lists):
+            for name in names:
+                bitmap = self.genres.get(name)
+                if bitmap is None:
+                    bitmap = self.genres[name] = np.zeros(self.size, dtype=bool)
+                bitmap[row] = True
+
+        self.languages = {}
+        for row, language in enumerate(languages):
+            if language:
+                bitmap = self.languages.get(language)
+                if bitmap is None:
+                    bitmap = self.languages[language] = np.zeros(self.size, dtype=bool)
+                bitmap[row] = True
+
+        # Movies without a year or rating never match a range filter, so they are left out
+        self.years = np.array([_year(date) for date in release_dates], dtype=np.int32)
+        known = np.flatnonzero(self.years >= 0)
+        self.year_order = known[np.argsort(self.years[known], kind='stable')]
+        self.sorted_years = self.years[self.year_order]
+
+        self.ratings = np.asarray(ratings, dtype=np.float64)
+        known = np.flatnonzero(~np.isnan(self.ratings))
+        self.rating_order = known[np.argsort(self.ratings[known], kind='stable')]
+        self.sorted_ratings = self.ratings[self.rating_order]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """An index from the arrays() of another"""
+        index = cls.__new__(cls)
+        index.years = np.asarray(arrays['years'])
+        index.size = index.years.shape[0]
+        for name in ('genres', 'languages'):
+            bitmaps = np.asarray(arrays[f"{name}_bitmaps"])
+            setattr(index, name, dict(zip(np.asarray(arrays[f"{name}_names"]).tolist(), bitmaps)))
+        for name in ('year_order', 'sorted_years', 'ratings', 'rating_order', 'sorted_ratings'):
+            setattr(index, name, np.asarray(arrays[name]))
+        return index
+
+    def arrays(self):
+        """The bitmaps (one matrix per attribute) and sorted arrays, for from_arrays"""
+        arrays = {}
+        for name, bitmaps in (('genres', self.genres), ('languages', self.languages)):
+            names = sorted(bitmaps)
+            arrays[f"{name}_names"] = np.array(names, dtype=str)
+            arrays[f"{name}_bitmaps"] = (np.stack([bitmaps[key] for key in names]) if names
+                                         else np.zeros((0, self.size), dtype=bool))
+        for name in ('years', 'year_order', 'sorted_years', 'ratings', 'rating_order', 'sorted_ratings'):
+            arrays[name] = getattr(self, name)
+        return arrays
+
+    def copy(self):
+        """An index set_row can change without affecting this one"""
+        index = copy.copy(self)
+        index.genres = dict(self.genres)
+        index.languages = dict(self.languages)
+        return index
+
+    def set_row(self, row, genres=(), release_date=None, rating=np.nan, language=None):
+        """Index a new row (row == size) or replace an existing row's attributes
+
+        Only the bitmaps and sorted entries the row leaves or enters change,
+        and each is replaced by an updated array rather than modified in
+        place, so a copy() taken before shares all the others. A removed movie
+        is set with no attributes and matches no filter.
+        """
+        if row == self.size:
+            self.size += 1
+            self.genres = {name: np.append(bitmap, False) for name, bitmap in self.genres.items()}
+            self.languages = {name: np.append(bitmap, False) for name, bitmap in self.languages.items()}
+            self.years = np.append(self.years, np.int32(-1))
+            self.ratings = np.append(self.ratings, np.nan)
+
+        for bitmaps, names in ((self.genres, set(genres)), (self.languages, {language} if language else set())):
+            for name in names | {name for name, bitmap in bitmaps.items() if bitmap[row]}:
+                bitmap = bitmaps.get(name)
+                if bitmap is not None and bitmap[row] == (name in names):
+                    continue
+                bitmap = np.zeros(self.size, dtype=bool) if bitmap is None else bitmap.copy()
+                bitmap[row] = name in names
+                bitmaps[name] = bitmap
+
+        year, old_year = _year(release_date), int(self.years[row])
+        if year != old_year:
+            if old_year >= 0:
+                position = _sorted_position(self.year_order, self.sorted_years, old_year, row)
+                self.year_order = np.delete(self.year_order, position)
+                self.sorted_years = np.delete(self.sorted_years, position)
+            if year >= 0:
+                position = _sorted_position(self.year_order, self.sorted_years, year, row)
+                self.year_order = np.insert(self.year_order, position, row)
+                self.sorted_years = np.insert(self.sorted_years, position, year)
+            self.years = self.years.copy()
+            self.years[row] = year
+
+        rating, old_rating = float(rating), float(self.ratings[row])
+        if not (rating == old_rating or (np.isnan(rating) and np.isnan(old_rating))):
+            if not np.isnan(old_rating):
+                position = _sorted_position(self.rating_order, self.sorted_ratings, old_rating, row)
+                self.rating_order = np.delete(self.rating_order, position)
+                self.sorted_ratings = np.delete(self.sorted_ratings, position)
+            if not np.isnan(rating):
+                position = _sorted_position(self.rating_order, self.sorted_ratings, rating, row)
+                self.rating_order = np.insert(self.rating_order, position, row)
+                self.sorted_ratings = np.insert(self.sorted_ratings, position, rating)
+            self.ratings = self.ratings.copy()
+            self.ratings[row] = rating
+
+    def mask(self, genres=(), year_from=None, year_to=None, min_rating=None, language=None):
+        """Boolean row mask for the given filters, or None when nothing is filtered"""
+        mask = None
+
+        def narrow(current, other):
+            return other if current is None else current & other
+
+        for name in genres:
+            mask = narrow(mask, self.genres.get(name, np.zeros(self.size, dtype=bool)))
+        if language:
+            mask = narrow(mask, self.languages.get(language, np.zeros(self.size, dtype=bool)))
+        if year_from is not None or year_to is not None:
+            mask = narrow(mask, _sorted_range_mask(self.year_order, self.sorted_years, year_from, year_to, self.size))
+        if min_rating is not None:
+            mask = narrow(mask, _sorted_range_mask(self.rating_order, self.sorted_ratings, min_rating, None, self.size))
+        return mask
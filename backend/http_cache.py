@@ -0,0 +1,98 @@
+"""
+HTTP caching for the Flask APIs
+Read endpoints answer the same way until the model (or precomputed store)
+changes, so their strong ETags are a hash of the served version and the
+request parameters. A matching If-None-Match is answered 304 right after
+the readiness check, before any matching or ranking. Large JSON responses
+are compressed with brotli (when installed) or gzip.
+"""
+
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Seconds clients and proxies may reuse a response without revalidating; 0 makes them revalidate every time
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', '30'))
+
+# JSON responses at least this large (bytes) are compressed when the client accepts it
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+# Fast settings: responses are compressed per request
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def request_etag(version, method, path, args):
+    """Strong ETag (unquoted) for a request under a model version"""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in (str(version), method, path, *(f"{key}={value}" for key, value in sorted(args.items(multi=True)))):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def cache_control():
+    return f"public, max-age={HTTP_CACHE_MAX_AGE}" if HTTP_CACHE_MAX_AGE > 0 else "no-cache"
+
+
+def compress(data, coding):
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def enable(app, version, endpoints):
+    """ETags and conditional GETs for endpoints, and compression of every large JSON response
+
+    version() returns the tag of the data being served. Call after
+    registering the readiness check, so it only runs once data is loaded.
+    Compressed bodies get their coding appended to the ETag, as each
+    encoding is a different representation.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def answer_not_modified():
+        if request.method != 'GET' or request.endpoint not in endpoints:
+            return None
+        etag = g.etag = request_etag(version(), request.method, request.path, request.args)
+        if not request.if_none_match:
+            return None
+        for candidate in (etag, *(f"{etag}-{coding}" for coding in CODINGS)):
+            if request.if_none_match.contains_weak(candidate):
+                response = Response(status=304)
+                response.set_etag(candidate)
+                response.headers['Cache-Control'] = cache_control()
+                response.vary.add('Accept-Encoding')
+                return response
+        return None
+
+    @app.after_request
+    def cache_and_compress(response):
+        etag = g.pop('etag', None)
+        if response.status_code != 200:
+            return response
+        if etag is not None:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control()
+
+        if (response.direct_passthrough or response.mimetype != 'application/json'
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        coding = request.accept_encodings.best_match(CODINGS)
+        if len(data) < COMPRESS_MIN_BYTES or coding is None:
+            return response
+        response.set_data(compress(data, coding))
+        response.headers['Content-Encoding'] = coding
+        if etag is not None:
+            response.set_etag(f"{etag}-{coding}")
+        return response
@@ -0,0 +1,276 @@
+"""
+Sorted, keyset-paginated catalog listing for /api/movies
+One ascending permutation of the catalog per sort field is built from the
+model's in-memory columns. A page is found by binary search on the last
+(value, row) seen, so deep pages cost the same as the first, then filled
+by scanning forward through the permutation under the filter mask. Catalog
+updates move a single row within each permutation.
+"""
+
+import base64
+import copy
+import json
+import os
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from title_index import normalize_title, pack_keys, unpack_keys
+
+# 'catalog' is row order: the CSV order, then movies added by catalog updates
+SORT_FIELDS = ('catalog', 'popularity', 'rating', 'release_date', 'title')
+# How sort_values keys are stored in a snapshot
+KEY_DTYPES = {'catalog': np.int64, 'popularity': np.float64, 'rating': np.float64, 'release_date': np.int64,
+              'title': str}
+DEFAULT_SORT = 'catalog'
+# Sorts listed ascending unless order says otherwise
+ASCENDING_SORTS = ('catalog', 'title')
+
+# Default and largest page /api/movies returns
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '500'))
+
+# Permutation entries checked per step while filling a filtered page
+SCAN_CHUNK_ROWS = 4096
+
+
+def _date_key(date):
+    """YYYYMMDD integer for a TMDB release date (missing month/day as 00), or None"""
+    if not isinstance(date, str):
+        return None
+    parts = date.split('-')
+    if not parts[0].isdigit():
+        return None
+    month, day = (part if part.isdigit() else '0' for part in (parts + ['0', '0'])[1:3])
+    return int(parts[0]) * 10000 + min(int(month), 99) * 100 + min(int(day), 99)
+
+
+def sort_values(columns, field):
+    """Per-row sort key for a SORT_FIELDS field (None sorts last), from MovieModel.columns"""
+    if field == 'catalog':
+        return list(range(len(columns['id'])))
+    if field == 'title':
+        return [normalize_title(title) if title is not None else None for title in columns['title']]
+    if field == 'release_date':
+        return [_date_key(date) for date in columns['release_date']]
+    return [float(value) if value is not None and value == value else None for value in columns[field]]
+
+
+def sort_key(field, value):
+    """Sort key of a single column value, as sort_values computes it"""
+    return sort_values({field: [value]}, field)[0]
+
+
+def parse_listing(args):
+    """sort, descending, limit, cursor and offset from request query parameters
+
+    sort defaults to catalog order. order is 'asc' or 'desc' (default:
+    descending, except in catalog and title order).
+    Raises ValueError with a message for the client on bad values.
+    """
+    sort = args.get('sort') or DEFAULT_SORT
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+    order = args.get('order') or ('asc' if sort in ASCENDING_SORTS else 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    try:
+        limit = min(max(1, int(args.get('limit', DEFAULT_PAGE_SIZE))), MAX_PAGE_SIZE)
+        offset = max(0, int(args.get('offset', 0)))
+    except ValueError:
+        raise ValueError("limit and offset must be integers")
+    return {'sort': sort, 'descending': order == 'desc', 'limit': limit,
+            'cursor': args.get('cursor') or None, 'offset': offset}
+
+
+def encode_cursor(sort, descending, value, row):
+    text = json.dumps([sort, 'desc' if descending else 'asc', value, row], separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort, descending, value, row) from a cursor; raises ValueError if malformed"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, order, value, row = json.loads(text)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    if sort not in SORT_FIELDS or order not in ('asc', 'desc') or not isinstance(row, int):
+        raise ValueError("invalid cursor")
+    if value is not None and not isinstance(value, str if sort == 'title' else (int, float)):
+        raise ValueError("invalid cursor")
+    return sort, order == 'desc', value, row
+
+
+class SortOrder:
+    """Active rows ascending by one key (ties by row), plus the rows without a key
+
+    Descending pages walk the same permutation backwards; rows without a key
+    come last either way, in row order.
+    """
+
+    def __init__(self, keys, active):
+        known = [row for row, key in enumerate(keys) if key is not None and active[row]]
+        known.sort(key=keys.__getitem__)
+        self.keys = keys
+        self.rows = np.asarray(known, dtype=np.int64)
+        self.sorted_keys = [keys[row] for row in known]
+        self.missing = np.asarray([row for row, key in enumerate(keys) if key is None and active[row]],
+                                  dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """A sort order from the arrays() of another"""
+        order = cls.__new__(cls)
+        order.keys = unpack_keys(arrays['keys'], arrays['key_missing'])
+        order.rows = np.asarray(arrays['rows'])
+        order.sorted_keys = np.asarray(arrays['keys'])[order.rows].tolist()
+        order.missing = np.asarray(arrays['missing'])
+        return order
+
+    def arrays(self, dtype):
+        """The keys (as dtype) and both row arrays, for from_arrays"""
+        keys, key_missing = pack_keys(self.keys, dtype)
+        return {'keys': keys, 'key_missing': key_missing, 'rows': self.rows, 'missing': self.missing}
+
+    def __len__(self):
+        return self.rows.shape[0] + self.missing.shape[0]
+
+    def copy(self):
+        """A sort order set_row can change without affecting this one"""
+        order = copy.copy(self)
+        order.keys = list(self.keys)
+        order.sorted_keys = list(self.sorted_keys)
+        return order
+
+    def _position(self, key, row):
+        """Where (key, row) sits among the rows with a key"""
+        lo = bisect_left(self.sorted_keys, key)
+        hi = bisect_right(self.sorted_keys, key, lo)
+        return lo + int(np.searchsorted(self.rows[lo:hi], row))
+
+    def set_row(self, row, key, was_active, active):
+        """Move one row (row == len(keys) for a new one) to where its new key sorts, by bisection
+
+        The row arrays are replaced rather than modified.
+        """
+        if was_active:
+            old = self.keys[row]
+            if old is None:
+                self.missing = np.delete(self.missing, np.searchsorted(self.missing, row))
+            else:
+                position = self._position(old, row)
+                self.rows = np.delete(self.rows, position)
+                del self.sorted_keys[position]
+        if row == len(self.keys):
+            self.keys.append(None)
+        self.keys[row] = key
+        if active:
+            if key is None:
+                self.missing = np.insert(self.missing, np.searchsorted(self.missing, row), row)
+            else:
+                position = self._position(key, row)
+                self.rows = np.insert(self.rows, position, row)
+                self.sorted_keys.insert(position, key)
+
+    def _segments(self, descending, after):
+        """Row arrays to visit, in order, for the page following the (key, row) cursor after"""
+        if after is None:
+            return [self.rows[::-1] if descending else self.rows, self.missing]
+        key, row = after
+        if key is None:
+            return [self.missing[np.searchsorted(self.missing, row, side='right'):]]
+        lo = bisect_left(self.sorted_keys, key)
+        hi = bisect_right(self.sorted_keys, key, lo)
+        if descending:
+            end = lo + int(np.searchsorted(self.rows[lo:hi], row, side='left'))
+            return [self.rows[:end][::-1], self.missing]
+        start = lo + int(np.searchsorted(self.rows[lo:hi], row, side='right'))
+        return [self.rows[start:], self.missing]
+
+    def page(self, limit, descending=False, mask=None, after=None, offset=0):
+        """Up to limit rows passing mask (boolean by row), skipping offset of them, after the cursor"""
+        wanted = offset + limit
+        found = []
+        for segment in self._segments(descending, after):
+            for start in range(0, segment.shape[0], SCAN_CHUNK_ROWS):
+                chunk = segment[start:start + SCAN_CHUNK_ROWS]
+                if mask is not None:
+                    chunk = chunk[mask[chunk]]
+                found.extend(chunk[:wanted - len(found)].tolist())
+                if len(found) >= wanted:
+                    return found[offset:]
+        return found[offset:]
+
+    def cursor_key(self, row):
+        return self.keys[row], row
+
+
+class CatalogListing:
+    """A SortOrder per SORT_FIELDS field over the model's in-memory columns; removed movies are left out"""
+
+    def __init__(self, columns):
+        self.active = [movie_id is not None for movie_id in columns['id']]
+        self.orders = {field: SortOrder(sort_values(columns, field), self.active) for field in SORT_FIELDS}
+        self.total = sum(self.active)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """A listing from the arrays() of another; each order's arrays are prefixed with its field"""
+        listing = cls.__new__(cls)
+        listing.active = np.asarray(arrays['active']).tolist()
+        listing.orders = {field: SortOrder.from_arrays({name[len(field) + 1:]: values
+                                                        for name, values in arrays.items()
+                                                        if name.startswith(field + '_')})
+                          for field in SORT_FIELDS}
+        listing.total = sum(listing.active)
+        return listing
+
+    def arrays(self):
+        """The active rows and every sort order as arrays, for from_arrays"""
+        arrays = {'active': np.array(self.active, dtype=bool)}
+        for field, order in self.orders.items():
+            arrays.update({f"{field}_{name}": values for name, values in order.arrays(KEY_DTYPES[field]).items()})
+        return arrays
+
+    def copy(self):
+        """A listing set_row can change without affecting this one"""
+        listing = copy.copy(self)
+        listing.active = list(self.active)
+        listing.orders = {field: order.copy() for field, order in self.orders.items()}
+        return listing
+
+    def set_row(self, row, columns):
+        """Re-sort one row (row == len for a new one) after its MovieModel.columns values changed"""
+        was_active = row < len(self.active) and self.active[row]
+        active = columns['id'][row] is not None
+        if row == len(self.active):
+            self.active.append(active)
+        else:
+            self.active[row] = active
+        for field, order in self.orders.items():
+            key = row if field == 'catalog' else sort_key(field, columns[field][row])
+            order.set_row(row, key, was_active, active)
+        self.total += active - was_active
+
+    def page(self, sort=DEFAULT_SORT, descending=True, limit=DEFAULT_PAGE_SIZE, mask=None, cursor=None, offset=0):
+        """(rows, next cursor or None, total matching) for one page
+
+        cursor is a value from a previous page's next cursor and must use the
+        same sort and direction; raises ValueError otherwise.
+        """
+        order = self.orders[sort]
+        after = None
+        if cursor:
+            cursor_sort, cursor_descending, key, row = decode_cursor(cursor)
+            if (cursor_sort, cursor_descending) != (sort, descending):
+                raise ValueError("cursor belongs to a different sort order")
+            after, offset = (key, row), 0
+
+        rows = order.page(limit + 1, descending, mask, after, offset)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(sort, descending, *order.cursor_key(rows[-1]))
+        total = self.total if mask is None else int(np.count_nonzero(mask))
+        return rows, next_cursor, total
@@ -0,0 +1,210 @@
+"""
+Approximate neighbor build with MinHash/LSH
+Each movie's set of feature terms gets a MinHash signature; movies sharing a
+band of the signature land in the same bucket, and only bucket-mates are
+scored with the exact cosine. The result is the same top-K NeighborIndex the
+exact build produces.
+
+Not served (NEIGHBOR_BACKEND is always 'exact'): no catalog size measured has
+it paying off. Each movie can have up to LSH_BANDS * LSH_MAX_BUCKET (19,200)
+candidates, and they are scored pair by pair, while the exact build scores
+whole blocks with one sparse product. With the default settings and K=50 on
+synthetic TMDB-like catalogs (one CPU):
+
+    movies   exact    lsh      lsh recall@50
+    5,000    0.7s     6.0s     0.96
+    20,000   11.6s    46s      0.91
+    50,000   ~75s     180s     0.75
+
+Extrapolating the exact build's quadratic growth against this build's linear
+one puts break-even beyond 100,000 movies, at recall well below 0.9.
+"""
+
+import os
+
+import numpy as np
+
+from neighbors import BLOCK_CELLS, NeighborIndex, l2_normalize, select_top_n
+
+# One MinHash per band by default: movies become candidates when any single
+# hash agrees, which suits the low set overlap between similar TMDB movies
+LSH_PERMUTATIONS = int(os.environ.get('LSH_PERMUTATIONS', '64'))
+LSH_BANDS = int(os.environ.get('LSH_BANDS', '64'))
+
+# Buckets larger than this are skipped: they come from terms most movies share
+# (genres, "pictures") and act like stop words
+LSH_MAX_BUCKET = int(os.environ.get('LSH_MAX_BUCKET', '300'))
+
+# Movies sampled to measure recall against the exact cosine neighbors
+LSH_RECALL_SAMPLE = int(os.environ.get('LSH_RECALL_SAMPLE', '200'))
+
+# Rows hashed per block, and the most candidate pairs scored at once
+LSH_BLOCK_ROWS = 4096
+LSH_PAIR_BUDGET = 4_000_000
+
+_PRIME = (1 << 31) - 1
+
+
+def minhash_signatures(normed, num_perm=LSH_PERMUTATIONS, seed=0):
+    """MinHash signature (num_perm values) of each row's set of non-zero columns
+
+    Empty rows get the all-_PRIME signature and are excluded from the tables.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+
+    n_rows = normed.shape[0]
+    signatures = np.full((n_rows, num_perm), _PRIME, dtype=np.int64)
+    for start in range(0, n_rows, LSH_BLOCK_ROWS):
+        block = normed[start:start + LSH_BLOCK_ROWS]
+        lengths = np.diff(block.indptr)
+        filled = np.flatnonzero(lengths)
+        if not filled.shape[0]:
+            continue
+        columns = block.indices.astype(np.int64)
+        hashed = (columns[:, None] * a[None, :] + b[None, :]) % _PRIME
+        signatures[start + filled] = np.minimum.reduceat(hashed, block.indptr[filled], axis=0)
+    return signatures
+
+
+def band_keys(signatures, bands=LSH_BANDS, seed=1):
+    """One bucket key per (row, band), shape (rows, bands)
+
+    Single-hash bands use the MinHash value itself; wider bands are mixed into 64 bits.
+    """
+    rows_per_band = signatures.shape[1] // bands
+    if rows_per_band < 1:
+        raise ValueError("LSH_BANDS cannot exceed LSH_PERMUTATIONS")
+    if rows_per_band == 1:
+        return signatures[:, :bands].astype(np.uint32)
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 1 << 62, size=rows_per_band, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+    keys = np.zeros((signatures.shape[0], bands), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for band in range(bands):
+            part = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+            keys[:, band] = (part * multipliers).sum(axis=1)
+    return keys
+
+
+class LSHTables:
+    """Per-band sorted bucket keys; a bucket is the run of rows sharing a key"""
+
+    def __init__(self, keys, active):
+        self.rows = []
+        self.keys = []
+        members = np.flatnonzero(active)
+        for band in range(keys.shape[1]):
+            band_keys_ = keys[members, band]
+            order = np.argsort(band_keys_, kind='stable')
+            self.rows.append(members[order].astype(np.int32))
+            self.keys.append(band_keys_[order])
+
+    def candidate_pairs(self, seeds, seed_keys, max_bucket=LSH_MAX_BUCKET):
+        """(seed row, candidate row) pairs from every band, deduplicated and without self pairs"""
+        pair_seeds = []
+        pair_rows = []
+        for band, (rows, keys) in enumerate(zip(self.rows, self.keys)):
+            lo = np.searchsorted(keys, seed_keys[:, band], side='left')
+            counts = np.searchsorted(keys, seed_keys[:, band], side='right') - lo
+            counts[counts > max_bucket] = 0
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Expand each [lo, hi) range into positions without a Python loop
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            pair_seeds.append(np.repeat(seeds, counts))
+            pair_rows.append(rows[np.repeat(lo, counts) + offsets])
+
+        if not pair_seeds:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pair_seeds = np.concatenate(pair_seeds).astype(np.int64)
+        pair_rows = np.concatenate(pair_rows).astype(np.int64)
+        keep = pair_seeds != pair_rows
+        codes = np.unique(pair_seeds[keep] * (1 << 32) + pair_rows[keep])
+        return codes >> 32, codes & 0xFFFFFFFF
+
+
+def _pair_scores(normed, seeds, rows):
+    """Cosine score of each (seed, row) pair of unit-length rows"""
+    if not seeds.shape[0]:
+        return np.empty(0)
+    return np.asarray(normed[seeds].multiply(normed[rows]).sum(axis=1)).ravel()
+
+
+def build_lsh_neighbor_index(vectors, k, num_perm=LSH_PERMUTATIONS, bands=LSH_BANDS,
+                             max_bucket=LSH_MAX_BUCKET, recall_sample=LSH_RECALL_SAMPLE):
+    """Approximate top-k neighbors of every row via MinHash/LSH candidate buckets
+
+    Rows whose buckets hold fewer than k candidates are scored exactly
+    against the whole catalog, so every row still gets a full list.
+    """
+    n_rows = vectors.shape[0]
+    k = max(0, min(k, n_rows - 1))
+    normed = l2_normalize(vectors)
+
+    keys = band_keys(minhash_signatures(normed, num_perm), bands)
+    tables = LSHTables(keys, np.diff(normed.indptr) > 0)
+
+    indices = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float32)
+    short = []
+    # Enough seeds per block to fill the pair budget even if every band hits a full bucket
+    block_size = max(1, LSH_PAIR_BUDGET // (bands * max_bucket))
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        seeds = np.arange(start, stop)
+        pair_seeds, pair_rows = tables.candidate_pairs(seeds, keys[start:stop], max_bucket)
+        pair_scores = _pair_scores(normed, pair_seeds, pair_rows)
+
+        # Best first within each seed, ties by row as in the exact build
+        order = np.lexsort((pair_rows, -pair_scores, pair_seeds))
+        pair_seeds, pair_rows, pair_scores = pair_seeds[order], pair_rows[order], pair_scores[order]
+        counts = np.bincount(pair_seeds - start, minlength=stop - start)
+        firsts = np.cumsum(counts) - counts
+
+        full = np.flatnonzero(counts >= k)
+        picks = firsts[full, None] + np.arange(k)[None, :]
+        indices[start + full] = pair_rows[picks]
+        scores[start + full] = pair_scores[picks]
+        short.extend((start + np.flatnonzero(counts < k)).tolist())
+
+    index = NeighborIndex(indices, scores, normed)
+    if short:
+        index.refresh(short, indices, scores)
+
+    index.info = {
+        'backend': 'lsh',
+        'permutations': num_perm,
+        'bands': bands,
+        'max_bucket': max_bucket,
+        'exact_fallback_rows': len(short),
+        'recall': measure_recall(index, recall_sample),
+        'recall_sample': min(recall_sample, n_rows),
+    }
+    return index
+
+
+def measure_recall(index, sample=LSH_RECALL_SAMPLE, seed=0):
+    """Mean recall@k of the stored neighbors against exact cosine on a row sample
+
+    A stored neighbor counts as a hit when its score reaches the exact k-th
+    best score, so ties at the cut-off are not penalised.
+    """
+    n_rows = len(index)
+    if not n_rows or not index.k:
+        return 1.0
+    rows = np.sort(np.random.default_rng(seed).choice(n_rows, size=min(sample, n_rows), replace=False))
+
+    hits = 0
+    block_size = max(1, BLOCK_CELLS // max(n_rows, 1))
+    for start in range(0, rows.shape[0], block_size):
+        chunk = rows[start:start + block_size]
+        block = index.score_rows(chunk)
+        for position, row in enumerate(chunk):
+            kth = block[position, select_top_n(block[position], index.k)[-1]]
+            stored = block[position, index.indices[row]]
+            hits += int((stored >= kth - 1e-6).sum())
+    return round(hits / (rows.shape[0] * index.k), 4)
@@ -0,0 +1,348 @@
+"""
+Build and request instrumentation for the recommender
+Build stages record wall time and resident memory; API requests record
+latency histograms per endpoint, split into fuzzy match, ranking and
+serialization. Everything is rendered in the Prometheus text format for
+/api/metrics. An opt-in sampling profiler writes folded stacks of slow requests.
+"""
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Requests slower than this (ms) get their sampled stacks written to PROFILE_DIR; 0 disables profiling
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_END = object()
+
+
+def rss_bytes():
+    """Current resident set size of this process (0 where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# -------------------------
+# Build stages
+# -------------------------
+class StageTimer:
+    """Wall time and resident memory per build stage
+
+    A stage can be entered many times (once per CSV chunk); its time adds up
+    and its memory is the largest RSS seen when it finished.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.rss = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.rss[name] = max(self.rss.get(name, 0), rss_bytes())
+
+    def iterate(self, iterable, name):
+        """Yield from iterable, timing each step (e.g. reading the next CSV chunk) as stage name"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    def summary(self):
+        return ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.seconds.items())
+
+
+class BuildMetrics:
+    """Stage timings of the most recent model build or snapshot load"""
+
+    def __init__(self):
+        self.stages = {}
+        self.completed = 0
+        self.finished_at = None
+
+    def record(self, timer):
+        self.stages = {name: (timer.seconds[name], timer.rss.get(name, 0)) for name in timer.seconds}
+        self.completed += 1
+        self.finished_at = time.time()
+
+
+# -------------------------
+# Requests
+# -------------------------
+class Histogram:
+    """Cumulative-bucket histogram per label tuple"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self, name, label_names):
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in sorted(self.series.items())]
+        lines = []
+        for labels, counts, total in snapshot:
+            base = _labels(zip(label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{base}}} {total:.6f}')
+            lines.append(f'{name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+class RequestTimer:
+    """Per-request stopwatch; handlers wrap each phase in timer.phase(name)"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.requests = Counter()
+        self.duration = Histogram()
+        self.phases = Histogram()
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, status, timer):
+        elapsed = time.perf_counter() - timer.start
+        with self._lock:
+            self.requests[(endpoint, str(status))] += 1
+        self.duration.observe((endpoint,), elapsed)
+        for phase, seconds in timer.phases.items():
+            self.phases.observe((endpoint, phase), seconds)
+        return elapsed
+
+
+# -------------------------
+# Slow request profiler
+# -------------------------
+def _fold(frame):
+    """Collapsed stack, root first, as used by flamegraph.pl and speedscope"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight request threads and keeps those of slow requests
+
+    One daemon thread polls sys._current_frames() every interval while any
+    request is being profiled; requests finishing under the threshold discard
+    their samples.
+    """
+
+    def __init__(self, threshold_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_INTERVAL_MS, out_dir=PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self.slow = Counter()
+        self.written = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def begin(self):
+        """Start sampling the calling thread"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return thread_id
+
+    def end(self, thread_id, label, seconds):
+        """Stop sampling; write the folded stacks if the request was slow and return the file path"""
+        with self._lock:
+            stacks = self._active.pop(thread_id, None)
+        if not stacks or seconds < self.threshold:
+            return None
+        self.slow[label] += 1
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{seconds * 1000:.0f}ms-{thread_id}.folded"
+        path = os.path.join(self.out_dir, name)
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written += 1
+        return path
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_fold(frame)] += 1
+
+
+build_metrics = BuildMetrics()
+request_metrics = RequestMetrics()
+profiler = SamplingProfiler()
+
+
+# -------------------------
+# Flask integration
+# -------------------------
+def instrument(app):
+    """Time every request of a Flask app; call before registering other before_request hooks"""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.request_timer = RequestTimer()
+        if profiler.enabled:
+            g.profile_thread = profiler.begin()
+
+    @app.after_request
+    def record_request(response):
+        timer = g.pop('request_timer', None)
+        if timer is not None:
+            endpoint = request.endpoint or 'unmatched'
+            elapsed = request_metrics.observe(endpoint, response.status_code, timer)
+            thread_id = g.pop('profile_thread', None)
+            if thread_id is not None:
+                profiler.end(thread_id, endpoint, elapsed)
+        return response
+
+
+def request_phase(name):
+    """Context manager timing part of the current request as fuzzy 'match', 'rank' or 'serialize'"""
+    from flask import g
+
+    timer = g.get('request_timer')
+    return timer.phase(name) if timer is not None else nullcontext()
+
+
+# -------------------------
+# Prometheus text format
+# -------------------------
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _metric(lines, name, kind, help_text, samples):
+    """Append one metric family; samples are (label pairs, value)"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{{{_labels(labels)}}} {value}" if labels else f"{name} {value}")
+
+
+def render(holder=None, cache=None):
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    stages = build_metrics.stages
+    _metric(lines, 'movie_build_stage_seconds', 'gauge',
+            "Wall time of each stage of the last model build or snapshot load",
+            [((('stage', name),), f"{seconds:.6f}") for name, (seconds, _) in stages.items()])
+    _metric(lines, 'movie_build_stage_resident_bytes', 'gauge',
+            "Process resident memory at the end of each stage of the last build or load",
+            [((('stage', name),), rss) for name, (_, rss) in stages.items()])
+    _metric(lines, 'movie_builds_total', 'counter', "Model builds and snapshot loads completed",
+            [((), build_metrics.completed)])
+    _metric(lines, 'movie_process_resident_bytes', 'gauge', "Current resident memory", [((), rss_bytes())])
+    _metric(lines, 'movie_process_peak_resident_bytes', 'gauge', "Peak resident memory", [((), peak_rss_bytes())])
+
+    if holder is not None:
+        model = holder.current
+        _metric(lines, 'movie_model_ready', 'gauge', "1 once a model is loaded",
+                [((), int(model is not None))])
+        _metric(lines, 'movie_model_reloads_total', 'counter', "Models swapped in after the first",
+                [((), holder.reloads)])
+        if model is not None:
+            _metric(lines, 'movie_model_movies', 'gauge', "Movies in the served catalog", [((), len(model))])
+            _metric(lines, 'movie_model_info', 'gauge', "Served model version and neighbor backend",
+                    [((('version', model.tag), ('neighbors', model.neighbor_index.info.get('backend'))), 1)])
+
+    if cache is not None:
+        stats = cache.stats()
+        for field in ('hits', 'misses', 'evictions', 'expirations', 'invalidations'):
+            _metric(lines, f'movie_result_cache_{field}_total', 'counter', f"Result cache {field}",
+                    [((), stats[field])])
+        _metric(lines, 'movie_result_cache_entries', 'gauge', "Result cache entries", [((), stats['size'])])
+
+    with request_metrics._lock:
+        requests = sorted(request_metrics.requests.items())
+    _metric(lines, 'movie_api_requests_total', 'counter', "API requests by endpoint and status",
+            [((('endpoint', endpoint), ('status', status)), count) for (endpoint, status), count in requests])
+    lines.append("# HELP movie_api_request_duration_seconds API request latency")
+    lines.append("# TYPE movie_api_request_duration_seconds histogram")
+    lines.extend(request_metrics.duration.render('movie_api_request_duration_seconds', ('endpoint',)))
+    lines.append("# HELP movie_api_request_phase_seconds API request time spent in fuzzy match, ranking and serialization")
+    lines.append("# TYPE movie_api_request_phase_seconds histogram")
+    lines.extend(request_metrics.phases.render('movie_api_request_phase_seconds', ('endpoint', 'phase')))
+
+    if profiler.enabled:
+        _metric(lines, 'movie_api_slow_requests_total', 'counter',
+                f"Requests slower than {profiler.threshold * 1000:g} ms, profiled to {profiler.out_dir}",
+                [((('endpoint', endpoint),), count) for endpoint, count in sorted(profiler.slow.items())])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,387 @@
+"""
+Recommender model shared by the Flask APIs, the Streamlit app and the CLI
+Bundles the display catalog (on disk), the neighbor index and the title lookups
+"""
+
+import copy
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from catalog import CATALOG_JOURNAL, journal_size, read_entries
+from catalog_store import CATALOG_BATCH_ROWS, INDEX_FIELDS, CatalogStore
+from features import (INGEST_CHUNK_ROWS, POSTER_BASE_URL, VECTORIZER, fold_catalog_updates, make_vectorizer,
+                      stream_catalog)
+from filters import AttributeIndex
+from listing import DEFAULT_PAGE_SIZE, CatalogListing
+from metrics import StageTimer, build_metrics
+from neighbors import DEFAULT_K, NEIGHBOR_BACKEND, build_neighbor_index, l2_normalize
+from title_index import MovieLookup, PrefixIndex, TitleIndex, resolve_movie
+
+# Build stages reported through the progress callback of build_model/load_model.
+# The CSVs are parsed chunk by chunk while streaming, so reading and JSON parsing
+# are one 'load' stage (with the catalog journal fold). The finer timings in
+# metrics split it into csv_load, json_parse, merge and journal
+BUILD_STAGES = ('load', 'vectorize', 'index')
+
+# Largest number of seeds accepted by the batch recommendation endpoints
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+
+# Most recommendations a request can ask for per movie
+MAX_RECOMMENDATIONS = int(os.environ.get('MAX_RECOMMENDATIONS', '100'))
+
+
+def _column(df, name):
+    """Column as a plain Python list with missing values as None"""
+    if name not in df.columns:
+        return [None] * len(df)
+    return [None if pd.isna(value) else value for value in df[name].tolist()]
+
+
+def build_records(df):
+    """Per-movie payload dicts, built once so requests never touch pandas"""
+    columns = {
+        'id': [int(value) for value in df['id'].tolist()],
+        'title': _column(df, 'original_title'),
+        'genres': _column(df, 'genres'),
+        'overview': _column(df, 'overview'),
+        'release_date': _column(df, 'release_date'),
+        'homepage': _column(df, 'homepage'),
+        'cast': _column(df, 'cast'),
+        'director': _column(df, 'director'),
+        'rating': _column(df, 'vote_average'),
+        'vote_count': _column(df, 'vote_count'),
+        'popularity': _column(df, 'popularity'),
+        'original_language': _column(df, 'original_language'),
+    }
+    poster_paths = _column(df, 'poster_path')
+    columns['poster_url'] = [POSTER_BASE_URL + path if path else None for path in poster_paths]
+    columns['year'] = [date[:4] if isinstance(date, str) and date else None for date in columns['release_date']]
+
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def genre_lists(values):
+    """Lower-cased genre names per movie from '|'-joined genre_list values"""
+    return [[name.lower() for name in value.split('|') if name] if isinstance(value, str) else []
+            for value in values]
+
+
+def catalog_rows(df):
+    """(record, genre_list) pairs for writing a catalog store, built chunk by chunk"""
+    for start in range(0, len(df), CATALOG_BATCH_ROWS):
+        chunk = df.iloc[start:start + CATALOG_BATCH_ROWS]
+        yield from zip(build_records(chunk), _column(chunk, 'genre_list'))
+
+
+def parse_seed(query):
+    """(title, TMDB id) for one batch seed; the unused half is None"""
+    if isinstance(query, dict):
+        if query.get('id') is not None:
+            return None, query['id']
+        name = query.get('title') or query.get('movie')
+        return (name, None) if isinstance(name, str) else (None, None)
+    if isinstance(query, bool):
+        return None, None
+    if isinstance(query, int):
+        return None, query
+    if isinstance(query, str):
+        return query, None
+    return None, None
+
+
+class MovieModel:
+    """Everything needed to answer search and recommendation requests
+
+    records is the display catalog, a CatalogStore read from disk per row;
+    only the INDEX_FIELDS columns (and genres, in the filter index) are held in memory. Records,
+    the indexes and the neighbor lists reflect catalog updates applied since
+    the build (removed movies leave a None record behind until the next full build).
+    A model is never modified once requests can see it: updated() returns a new one.
+    """
+
+    def __init__(self, records, neighbor_index, vocabulary, version=None, built_at=None, journal_offset=0,
+                 indexes=None):
+        """indexes, if given, are the index_arrays() of a model over the same records (from a snapshot)"""
+        self.records = records
+        self.neighbor_index = neighbor_index
+        self.vocabulary = vocabulary
+        self.version = version
+        self.built_at = built_at if built_at is not None else time.time()
+
+        self.columns = records.columns()
+        genre_list = self.columns.pop('genre_list')
+        titles = self.columns['title']
+        if indexes is not None:
+            self.attributes = AttributeIndex.from_arrays(indexes['attributes'])
+            self.title_index = TitleIndex.from_arrays(titles, indexes['title_index'])
+            self.movie_lookup = MovieLookup.from_arrays(indexes['movie_lookup'])
+            self.prefix_index = PrefixIndex.from_arrays(indexes['prefix_index'])
+            self.listing = CatalogListing.from_arrays(indexes['listing'])
+        else:
+            self._index_attributes(genre_lists(genre_list))
+            self.title_index = TitleIndex(titles)
+            self.movie_lookup = MovieLookup(titles, self.columns['id'], self.columns['popularity'],
+                                            self.columns['vote_count'])
+            self.prefix_index = PrefixIndex(titles, self.columns['popularity'], self.columns['vote_count'])
+            self.listing = CatalogListing(self.columns)
+
+        # Catalog journal bytes folded in so far, and updates applied since the build
+        self.journal_offset = journal_offset
+        self.revision = 0
+        self._vectorizer = None
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def tag(self):
+        """Model version plus the number of catalog updates applied, for cache invalidation"""
+        return f"{self.version}+{self.revision}" if self.revision else self.version
+
+    def _index_attributes(self, genres):
+        """Build the filter indexes from the in-memory columns and genre lists; removed movies match no filter"""
+        columns = self.columns
+        self.attributes = AttributeIndex(
+            genres,
+            columns['release_date'],
+            [rating if rating is not None else np.nan for rating in columns['rating']],
+            [(language or '').lower() for language in columns['original_language']],
+        )
+
+    def index_arrays(self):
+        """Arrays of every title, filter and listing index, by index name, for saving with a snapshot"""
+        return {
+            'attributes': self.attributes.arrays(),
+            'title_index': self.title_index.arrays(),
+            'movie_lookup': self.movie_lookup.arrays(),
+            'prefix_index': self.prefix_index.arrays(),
+            'listing': self.listing.arrays(),
+        }
+
+    def _index_row(self, row, genres):
+        """Move one row within the filter indexes and listing orders after its columns and genres changed"""
+        columns = self.columns
+        rating = columns['rating'][row]
+        self.attributes.set_row(row, genres, columns['release_date'][row],
+                                rating if rating is not None else np.nan,
+                                (columns['original_language'][row] or '').lower())
+        self.listing.set_row(row, columns)
+
+    def _set_columns(self, row, record):
+        if row == len(self.columns['id']):
+            for values in self.columns.values():
+                values.append(None)
+        for field in INDEX_FIELDS:
+            self.columns[field][row] = record[field] if record is not None else None
+
+    def list_movies(self, sort, descending=True, limit=DEFAULT_PAGE_SIZE, filters=None, cursor=None, offset=0):
+        """(rows, next cursor, total) for one listing page; filters are AttributeIndex.mask keyword arguments"""
+        mask = self.attributes.mask(**filters) if filters else None
+        return self.listing.page(sort, descending, limit, mask, cursor, offset)
+
+    def resolve(self, name=None, movie_id=None):
+        """(row, match score) for an id or title, or None"""
+        return resolve_movie(self.movie_lookup, self.title_index, name=name, movie_id=movie_id)
+
+    def recommend(self, movie_idx, n, filters=None):
+        """Up to n (row, score) pairs; filters are AttributeIndex.mask keyword arguments"""
+        mask = self.attributes.mask(**filters) if filters else None
+        if mask is None:
+            return self.neighbor_index.recommend(movie_idx, n)
+        return self.neighbor_index.recommend_filtered(movie_idx, n, mask)
+
+    def autocomplete(self, prefix, limit=10):
+        """Rows for a typeahead prefix, most popular first, and whether fuzzy search supplied them
+
+        Fuzzy search only runs when no title (or word in one) starts with the prefix.
+        """
+        rows = self.prefix_index.suggest(prefix, limit)
+        if rows:
+            return rows, False
+        return [row for _, _, row in self.title_index.search(prefix, limit=limit)], True
+
+    def resolve_many(self, queries):
+        """Resolve a list of seeds in one pass
+
+        Each seed is a title string, an integer TMDB id or a dict with
+        'id' or 'title'/'movie'. Returns (row, match score) or None per seed;
+        repeated seeds are only resolved once.
+        """
+        resolved = {}
+        results = []
+        for query in queries:
+            name, movie_id = parse_seed(query)
+            key = (name, movie_id)
+            if key not in resolved:
+                resolved[key] = self.resolve(name=name, movie_id=movie_id)
+            results.append(resolved[key])
+        return results
+
+    def recommend_batch(self, movie_idxs, n):
+        return self.neighbor_index.recommend_batch(movie_idxs, n)
+
+    # -------------------------
+    # Catalog updates
+    # -------------------------
+    def prepare_updates(self):
+        """Build the vectorizer catalog updates use now, so the first update does not wait for it
+
+        Models built with the hashing vectorizer have no vocabulary and hash
+        into the same number of features.
+        """
+        if self._vectorizer is None:
+            if self.vocabulary is None:
+                vectorizer = make_vectorizer('hashing', n_features=self.neighbor_index.normed.shape[1])
+            else:
+                vectorizer = make_vectorizer('count', vocabulary=self.vocabulary)
+            # A fixed vocabulary is checked on the first transform
+            vectorizer.transform([''])
+            self._vectorizer = vectorizer
+        return self
+
+    def _vectorize(self, movie):
+        """Feature row for one movie against the built vocabulary (new terms wait for a rebuild)"""
+        return l2_normalize(self.prepare_updates()._vectorizer.transform([movie['combined_features']]))
+
+    def updated(self, entries, journal_offset=None, skip_invalid=False):
+        """A new model with catalog journal entries applied; this one is left untouched
+
+        Requests may be reading this model on other threads, so updates never
+        modify it. The new model gets copies of the indexes (whose large
+        arrays stay shared until an update replaces them), and the caller
+        publishes it with a single reference assignment. An entry that cannot
+        be applied raises KeyError or ValueError, or with skip_invalid is
+        reported and skipped (entries already journalled cannot be refused).
+        """
+        model = copy.copy(self)
+        model.records = self.records.copy()
+        model.columns = {field: list(values) for field, values in self.columns.items()}
+        model.attributes = self.attributes.copy()
+        model.title_index = self.title_index.copy()
+        model.movie_lookup = self.movie_lookup.copy()
+        model.prefix_index = self.prefix_index.copy()
+        model.listing = self.listing.copy()
+        model.neighbor_index = self.neighbor_index.copy()
+        for entry in entries:
+            try:
+                model._apply(entry)
+            except (KeyError, ValueError) as e:
+                if not skip_invalid:
+                    raise
+                print(f"Skipping catalog update for id {entry.get('id')}: {e}")
+        model.revision = self.revision + len(entries)
+        if journal_offset is not None:
+            model.journal_offset = journal_offset
+        return model
+
+    def synced(self, path=CATALOG_JOURNAL):
+        """This model if nothing was journalled since it was built or synced, else an updated() one"""
+        if journal_size(path) <= self.journal_offset:
+            return self
+        entries, offset = read_entries(path, self.journal_offset)
+        return self.updated(entries, offset, skip_invalid=True)
+
+    def _apply(self, entry):
+        """Apply one journal entry in place, for updated(); adds and updates of the same id are upserts
+
+        Everything that can fail is checked before anything changes.
+        """
+        row = self.movie_lookup.by_id(entry['id'])
+        if entry['op'] == 'remove':
+            if row is None:
+                return
+            self.neighbor_index.remove_row(row)
+            self.records[row] = None
+            self._set_columns(row, None)
+            self.title_index.set_title(row, None)
+            self.movie_lookup.remove(row)
+            self.prefix_index.set_row(row, None)
+            genres = []
+        else:
+            movie = entry['movie']
+            vector = self._vectorize(movie)
+            record = build_records(pd.DataFrame([movie]))[0]
+            genres = genre_lists([movie.get('genre_list')])[0]
+            title, movie_id = movie['original_title'], int(movie['id'])
+            if row is None:
+                row = self.neighbor_index.add_row(vector)
+                self.records.append(None)
+            else:
+                self.neighbor_index.update_row(row, vector)
+
+            self.records[row] = record
+            self._set_columns(row, record)
+            self.title_index.set_title(row, title)
+            self.movie_lookup.set_row(row, title, movie_id, movie.get('popularity'), movie.get('vote_count'))
+            self.prefix_index.set_row(row, title, movie.get('popularity'), movie.get('vote_count'))
+        self._index_row(row, genres)
+
+
+def build_model(movies_path, credits_path, k=DEFAULT_K, version=None, journal=CATALOG_JOURNAL, progress=None,
+                vectorizer=VECTORIZER, neighbor_backend=NEIGHBOR_BACKEND, timer=None):
+    """Run the full pipeline: load and parse, vectorize and index
+
+    The CSVs are streamed in chunks and only the served fields are kept.
+    Catalog journal entries are folded in before vectorizing, so movies
+    added since the last build contribute their new vocabulary terms.
+    progress, if given, is called with each BUILD_STAGES name as it starts.
+    Stage timings and memory go to timer; without one they are published to
+    metrics.build_metrics here, otherwise the caller publishes them.
+    neighbor_backend='lsh' builds approximate lists with lsh.py, for
+    benchmarking only: served models always use the exact build.
+    """
+    progress = progress or (lambda stage: None)
+    publish = timer is None
+    timer = timer or StageTimer()
+
+    print("Loading and processing movie datasets...")
+    progress('load')
+    df, parse_errors = stream_catalog(movies_path, credits_path, timer=timer)
+    for column, failed in parse_errors.items():
+        if failed:
+            print(f"Warning: {failed} of {len(df)} '{column}' values could not be parsed")
+
+    with timer.stage('journal'):
+        entries, journal_offset = read_entries(journal)
+        if entries:
+            print(f"Applying {len(entries)} catalog updates...")
+            df = fold_catalog_updates(df, entries)
+
+    print("Vectorizing features...")
+    progress('vectorize')
+    with timer.stage('vectorize'):
+        cv = make_vectorizer(vectorizer)
+        if vectorizer == 'hashing':
+            # Stateless, so each chunk is vectorized on its own
+            texts = df['combined_features']
+            vectors = sp.vstack([cv.transform(texts.iloc[start:start + INGEST_CHUNK_ROWS])
+                                 for start in range(0, len(texts), INGEST_CHUNK_ROWS)], format='csr')
+            vocabulary = None
+        else:
+            vectors = cv.fit_transform(df['combined_features'])
+            vocabulary = {term: int(col) for term, col in cv.vocabulary_.items()}
+
+    print("Building neighbor index...")
+    progress('index')
+    with timer.stage('index'):
+        if neighbor_backend == 'lsh':
+            from lsh import build_lsh_neighbor_index
+            neighbor_index = build_lsh_neighbor_index(vectors, k)
+            print(f"Approximate neighbors: recall@{neighbor_index.k} {neighbor_index.info['recall']:.1%} "
+                  f"against exact cosine on {neighbor_index.info['recall_sample']} movies")
+        else:
+            neighbor_index = build_neighbor_index(vectors, k)
+
+    with timer.stage('catalog'):
+        # Display records go to disk, so the DataFrame is not kept past the build
+        records = CatalogStore.temporary(catalog_rows(df))
+        model = MovieModel(records, neighbor_index, vocabulary, version=version, journal_offset=journal_offset)
+    if publish:
+        build_metrics.record(timer)
+    print(f"Build stages: {timer.summary()}")
+    return model
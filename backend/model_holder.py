@@ -0,0 +1,249 @@
+"""
+Live model reference for the Flask backends
+The first load and every reload build the model on a background thread and
+publish it with a single reference assignment, so the server can accept
+connections (and answer readiness probes) immediately, and requests that
+already read the old model finish against it while new requests see the new one.
+Catalog updates are published the same way, as a new model with them applied.
+"""
+
+import os
+import threading
+import time
+
+from catalog import CATALOG_JOURNAL, append_entry, journal_size
+from features import CREDITS_CSV, MOVIES_CSV
+from model import BUILD_STAGES
+from neighbors import DEFAULT_K
+from snapshot import CURRENT_FILE, SNAPSHOT_DIR, load_model, source_fingerprints
+
+# Seconds between checks for new CSVs or a newly published snapshot; 0 disables
+RELOAD_CHECK_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '30'))
+
+# Seconds between per-request checks of the catalog journal for other processes' updates
+JOURNAL_CHECK_INTERVAL = 1.0
+
+# Retry-After (seconds) sent with 503s while the first model is still loading
+STARTUP_RETRY_AFTER = int(os.environ.get('STARTUP_RETRY_AFTER', '5'))
+
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp)) if timestamp else None
+
+
+class ModelHolder:
+    """Owns the model that requests are served from
+
+    Handlers read holder.current once and use that object for the whole
+    request; the reference is only ever replaced, never mutated into a
+    half-built state. update_lock serialises everything that derives the
+    next model from the current one (journal syncs and catalog writes).
+    """
+
+    def __init__(self, movies_path=MOVIES_CSV, credits_path=CREDITS_CSV, root=SNAPSHOT_DIR, k=DEFAULT_K,
+                 journal=CATALOG_JOURNAL, check_interval=RELOAD_CHECK_INTERVAL):
+        self.sources = (movies_path, credits_path)
+        self.root = root
+        self.k = k
+        self.journal = journal
+        self.check_interval = check_interval
+
+        self.current = None
+        self.state = LOADING
+        self.stages = {}
+        self.loaded_at = None
+        self.reloads = 0
+        self.last_error = None
+
+        self.update_lock = threading.RLock()
+        self._fingerprint = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._journal_checked = 0.0
+
+    def _source_fingerprint(self):
+        try:
+            return source_fingerprints(self.sources)
+        except OSError:
+            return None
+
+    def _published_version(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _progress(self, stage):
+        """Mark stage as running and the one before it as done"""
+        now = time.perf_counter()
+        stages = dict(self.stages)
+        for name, info in stages.items():
+            if info['state'] == 'running':
+                stages[name] = {'state': 'done', 'seconds': round(now - info['started'], 3)}
+        if stage is not None:
+            stages[stage] = {'state': 'running', 'started': now}
+        self.stages = stages
+
+    def _build(self):
+        self.stages = {stage: {'state': 'pending'} for stage in BUILD_STAGES}
+        # CSVs are fingerprinted before loading so edits made during a build are not missed;
+        # the snapshot pointer after, since loading may publish a new snapshot itself
+        sources = self._source_fingerprint()
+        model = load_model(*self.sources, root=self.root, k=self.k, journal=self.journal, progress=self._progress)
+        # Off the request path: importing scikit-learn alone takes about a second
+        model.prepare_updates()
+        self._progress(None)
+        # A snapshot load skips the later stages
+        self.stages = {name: info if info['state'] != 'pending' else {'state': 'skipped'}
+                       for name, info in self.stages.items()}
+        return model, (sources, self._published_version())
+
+    def _publish(self, model, fingerprint):
+        with self.update_lock:
+            # Catch up on catalog updates journalled while the replacement was building
+            model = model.synced(self.journal)
+            if self.current is not None:
+                self.reloads += 1
+            self.current = model
+        self.state = READY
+        self._fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+    def _fail(self, error):
+        self.stages = {name: {'state': 'failed'} if info['state'] == 'running' else info
+                       for name, info in self.stages.items()}
+        self.last_error = str(error)
+        # A failed reload keeps serving the previous model
+        if self.current is None:
+            self.state = FAILED
+
+    def load(self):
+        """Load the model in the calling thread"""
+        try:
+            self._publish(*self._build())
+        except Exception as e:
+            self._fail(e)
+            raise
+        return self.current
+
+    def start(self):
+        """Load the first model on a background thread; the server can bind meanwhile"""
+        return self.reload()
+
+    def reload(self):
+        """Start a background (re)build; False if one is already running"""
+        with self._lock:
+            if self.reloading:
+                return False
+            if self.current is None:
+                self.state = LOADING
+            self._thread = threading.Thread(target=self._reload, name='model-reload', daemon=True)
+            self._thread.start()
+            return True
+
+    def _reload(self):
+        start = time.perf_counter()
+        try:
+            model, fingerprint = self._build()
+        except Exception as e:
+            self._fail(e)
+            print(f"Model load failed: {e}")
+            return
+        self._publish(model, fingerprint)
+        self.last_error = None
+        print(f"Loaded model {model.version} in {time.perf_counter() - start:.1f}s")
+
+    def sync_journal(self, min_interval=0.0):
+        """Publish a new model with the catalog updates journalled (by any process) since the current one
+
+        Returns the current model. min_interval throttles the journal size
+        check for per-request use; throttled callers also return at once
+        rather than wait while another thread is deriving a model.
+        """
+        model = self.current
+        now = time.monotonic()
+        if model is None or now - self._journal_checked < min_interval:
+            return model
+        self._journal_checked = now
+        if journal_size(self.journal) <= model.journal_offset:
+            return model
+        if not self.update_lock.acquire(blocking=not min_interval):
+            return model
+        try:
+            self.current = self.current.synced(self.journal)
+            return self.current
+        finally:
+            self.update_lock.release()
+
+    def commit_update(self, op, movie_id, movie=None):
+        """Apply one catalog update, journal it and publish the result; returns the new model
+
+        The update is applied before it is journalled, so one the model
+        refuses (KeyError or ValueError) is never written and never replayed.
+        """
+        entry = {'op': op, 'id': int(movie_id)}
+        if movie is not None:
+            entry['movie'] = movie
+        with self.update_lock:
+            model = self.sync_journal()
+            applied = model.updated([entry])
+            start, end = append_entry(entry, self.journal)
+            if start == model.journal_offset:
+                applied.journal_offset = end
+                self.current = applied
+            else:
+                # Another process journalled updates first; replay them in journal order
+                self.current = model.synced(self.journal)
+            return self.current
+
+    @property
+    def reloading(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def check(self):
+        """Throttled per-request check for catalog updates and new data
+
+        Updates journalled by other processes are published as a new model;
+        a reload starts when the CSVs or the published snapshot changed.
+        """
+        self.sync_journal(min_interval=JOURNAL_CHECK_INTERVAL)
+        if not self.check_interval or self.current is None or self.reloading:
+            return
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        if (self._source_fingerprint(), self._published_version()) != self._fingerprint:
+            self.reload()
+
+    @staticmethod
+    def _stage_status(info):
+        if info['state'] == 'running':
+            return {'state': 'running', 'seconds': round(time.perf_counter() - info['started'], 3)}
+        return info
+
+    def not_ready(self):
+        """Error payload for data requests while no model is loaded"""
+        if self.state == FAILED:
+            return {'error': 'Movie database failed to load', 'status': FAILED, 'detail': self.last_error}
+        return {'error': 'Movie database is still loading', 'status': LOADING}
+
+    def status(self):
+        model = self.current
+        return {
+            'state': self.state,
+            'stages': [dict(self._stage_status(info), stage=name) for name, info in self.stages.items()],
+            'model_version': model.tag if model is not None else None,
+            'built_at': _iso(model.built_at) if model is not None else None,
+            'neighbors': model.neighbor_index.info if model is not None else None,
+            'loaded_at': _iso(self.loaded_at),
+            'reloading': self.reloading,
+            'reloads': self.reloads,
+            'last_reload_error': self.last_error,
+        }
@@ -0,0 +1,377 @@
+"""
+Sparse top-K neighbor index for the movie recommender
+Keeps only the K most similar movies per title instead of a dense N x N matrix
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+DEFAULT_K = 50
+
+# How neighbor lists are built; only 'exact' (every pair scored) is served. The
+# MinHash/LSH build in lsh.py is not offered until it is faster than the exact one:
+# it was slower at every catalog size measured, see there
+NEIGHBOR_BACKEND = 'exact'
+
+# Upper bound on the dense scratch block (rows x catalog size) used while building
+BLOCK_CELLS = 8_000_000
+
+# Processes computing neighbor blocks in parallel; 0 or 1 builds in-process.
+# Each worker holds one scratch block at a time, so peak memory grows by BLOCK_CELLS per worker
+NEIGHBOR_WORKERS = int(os.environ.get('NEIGHBOR_WORKERS', '0'))
+
+
+def l2_normalize(vectors):
+    """Row-normalise a sparse matrix to unit length (zero rows stay zero)"""
+    normed = sp.csr_matrix(vectors, dtype=np.float64, copy=True)
+    norms = np.sqrt(np.asarray(normed.multiply(normed).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    normed.data /= np.repeat(norms, np.diff(normed.indptr))
+    return normed
+
+
+def select_top_n(scores, n, exclude=None):
+    """Return the positions of the n highest scores, best first
+
+    Ties are broken by position, as a stable descending sort of these scores
+    would. Scores computed another way (e.g. sklearn's cosine_similarity)
+    can differ in the last bit and so break float-equal ties differently.
+    Positions in exclude (e.g. the seed movie) are never returned.
+    """
+    scores = np.asarray(scores)
+    if exclude is not None:
+        exclude = np.unique(np.atleast_1d(exclude))
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        available = scores.shape[0] - exclude.shape[0]
+    else:
+        available = scores.shape[0]
+
+    n = max(0, min(int(n), available))
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if n < scores.shape[0]:
+        part = np.argpartition(-scores, n - 1)[:n]
+        kth = scores[part].min()
+        # argpartition picks arbitrarily among ties at the cut-off, so keep the lowest positions
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[:n - above.shape[0]]
+        candidates = np.concatenate([above, tied])
+    else:
+        candidates = np.arange(scores.shape[0])
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def _lowest_ties(top, above, tied):
+    """Fix up argpartition's top n columns per row where the n-th score is tied
+
+    argpartition picks arbitrarily among ties at the cut-off. above marks the
+    entries of top that beat it (all of the row's such columns), tied the
+    row's columns equal to it; the tied entries of top are replaced by the
+    lowest tied columns. Ties are often the zero scores of a movie with few
+    neighbors, which the first columns hold plenty of, so each row is only
+    searched in full when that prefix falls short.
+    """
+    n = top.shape[1]
+    # Columns above the cut-off first (the order within a row does not matter here)
+    top = np.take_along_axis(top, np.argsort(~above, axis=1, kind='stable'), axis=1)
+    count = above.sum(axis=1)
+    room = n - count
+
+    pending = np.arange(top.shape[0])
+    for width in (min(4 * n, tied.shape[1]), tied.shape[1]):
+        window = tied[pending, :width]
+        enough = np.count_nonzero(window, axis=1) >= room[pending]
+        rows = pending[enough]
+        at, columns = np.divmod(np.flatnonzero(window[enough]), width)
+        # Rank of each tied column within its row
+        position = np.arange(at.shape[0]) - np.searchsorted(at, at)
+        keep = position < room[rows[at]]
+        at = rows[at[keep]]
+        top[at, count[at] + position[keep]] = columns[keep]
+        pending = pending[~enough]
+        if not pending.shape[0]:
+            break
+    return top
+
+
+def select_top_n_rows(block, n):
+    """Row-wise select_top_n over a dense 2-D block of scores"""
+    n_rows, size = block.shape
+    n = max(0, min(int(n), size))
+    if n == 0:
+        return np.empty((n_rows, 0), dtype=np.int64)
+
+    if n < size:
+        top = np.argpartition(-block, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        kth = top_scores.min(axis=1)
+        above = top_scores > kth[:, None]
+        tied = block == kth[:, None]
+        tied_rows = np.flatnonzero(above.sum(axis=1) + np.count_nonzero(tied, axis=1) > n)
+        if tied_rows.shape[0]:
+            top[tied_rows] = _lowest_ties(top[tied_rows], above[tied_rows], tied[tied_rows])
+    else:
+        top = np.broadcast_to(np.arange(size), (n_rows, size)).copy()
+
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class NeighborIndex:
+    """Top-K neighbor rows and cosine scores stored as compact int32/float32 arrays
+
+    The normalised feature matrix is kept so requests for more than K
+    neighbors can still be answered exactly. Rows removed by catalog
+    updates stay in place as tombstones (active is False) until the next
+    full rebuild.
+    """
+
+    def __init__(self, indices, scores, normed=None, active=None, info=None):
+        self.indices = indices
+        self.scores = scores
+        self.normed = normed
+        self.active = active
+        # How the lists were built (backend, and recall for approximate ones)
+        self.info = info or {'backend': 'exact'}
+
+    @property
+    def k(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def _available(self):
+        return (int(self.active.sum()) if self.active is not None else len(self)) - 1
+
+    def score_rows(self, seeds):
+        """Dense cosine scores of the seed rows against every row, seeds and tombstones excluded"""
+        seeds = np.asarray(seeds, dtype=np.int64)
+        block = (self.normed[seeds] @ self.normed.T).toarray()
+        block[np.arange(len(seeds)), seeds] = -np.inf
+        if self.active is not None:
+            block[:, ~self.active] = -np.inf
+        return block
+
+    def recommend(self, movie_idx, n):
+        """Return up to n (row, score) pairs for a movie, most similar first"""
+        n = max(0, int(n))
+        if n > self.k and self.normed is not None:
+            return self.exact(movie_idx, n)
+        rows = self.indices[movie_idx, :n].tolist()
+        scores = self.scores[movie_idx, :n].tolist()
+        return list(zip(rows, scores))
+
+    def exact(self, movie_idx, n):
+        """Score one movie against the whole catalog and keep the top n"""
+        row_scores = self.score_rows([movie_idx])[0]
+        top = select_top_n(row_scores, min(n, self._available()))
+        return [(int(i), float(row_scores[i])) for i in top]
+
+    def recommend_filtered(self, movie_idx, n, mask):
+        """Top n neighbors among rows where mask is True
+
+        The precomputed neighbors answer when enough of them pass the filter;
+        otherwise the seed is scored against the whole catalog. Either way
+        exactly n results come back unless fewer movies match the filter.
+        """
+        n = max(0, int(n))
+        rows = self.indices[movie_idx]
+        passing = np.flatnonzero(mask[rows])
+        if passing.shape[0] >= n or self.normed is None:
+            picked = passing[:n]
+            return list(zip(rows[picked].tolist(), self.scores[movie_idx, picked].tolist()))
+
+        row_scores = self.score_rows([movie_idx])[0]
+        row_scores[~mask] = -np.inf
+        available = int(np.isfinite(row_scores).sum())
+        top = select_top_n(row_scores, min(n, available))
+        return [(int(i), float(row_scores[i])) for i in top]
+
+    def recommend_batch(self, movie_idxs, n):
+        """recommend() for many seeds at once, one list of (row, score) pairs per seed"""
+        movie_idxs = np.asarray(movie_idxs, dtype=np.int64)
+        n = max(0, int(n))
+        if n <= self.k or self.normed is None:
+            rows = self.indices[movie_idxs, :n].tolist()
+            scores = self.scores[movie_idxs, :n].tolist()
+            return [list(zip(r, s)) for r, s in zip(rows, scores)]
+
+        # Score every seed against the catalog with one product per block of seeds
+        results = []
+        block_size = max(1, BLOCK_CELLS // max(len(self), 1))
+        for start in range(0, len(movie_idxs), block_size):
+            block = self.score_rows(movie_idxs[start:start + block_size])
+            top = select_top_n_rows(block, min(n, self._available()))
+            top_scores = np.take_along_axis(block, top, axis=1)
+            results.extend(list(zip(r, s)) for r, s in zip(top.tolist(), top_scores.tolist()))
+        return results
+
+    # -------------------------
+    # Incremental updates
+    # -------------------------
+    def copy(self):
+        """An index the update methods can change without affecting this one
+
+        The updates replace the arrays rather than modifying them, so the copy
+        shares them until then.
+        """
+        return NeighborIndex(self.indices, self.scores, self.normed, self.active, self.info)
+
+    def _writable(self):
+        """Copies of the (possibly memory-mapped) arrays that updates can modify"""
+        indices = np.array(self.indices, dtype=np.int32)
+        scores = np.array(self.scores, dtype=np.float32)
+        active = np.ones(len(self), dtype=bool) if self.active is None else self.active.copy()
+        return indices, scores, active
+
+    def refresh(self, rows, indices, scores):
+        """Recompute the neighbor lists of rows in place"""
+        rows = np.asarray(rows, dtype=np.int64)
+        block_size = max(1, BLOCK_CELLS // max(len(self), 1))
+        for start in range(0, len(rows), block_size):
+            chunk = rows[start:start + block_size]
+            block = self.score_rows(chunk)
+            top = select_top_n_rows(block, self.k)
+            indices[chunk] = top
+            scores[chunk] = np.take_along_axis(block, top, axis=1)
+
+    def _splice(self, indices, scores, rows, row, row_scores):
+        """Merge row, at its new score, into the lists of rows (dropping its old entry, or else the last)
+
+        Exact when row now ranks ahead of each list's last entry, which bounds
+        every score outside the list.
+        """
+        merged_rows = np.hstack([indices[rows], np.full((rows.shape[0], 1), row, dtype=np.int32)])
+        merged_scores = np.hstack([scores[rows], row_scores[rows, None].astype(np.float32)])
+        merged_scores[:, :-1][merged_rows[:, :-1] == row] = -np.inf
+        order = np.lexsort((merged_rows, -merged_scores), axis=1)[:, :self.k]
+        indices[rows] = np.take_along_axis(merged_rows, order, axis=1)
+        scores[rows] = np.take_along_axis(merged_scores, order, axis=1)
+
+    def add_row(self, vector):
+        """Append a normalised feature row; returns its row position
+
+        Only the lists the new movie enters are touched: each existing row
+        whose K-th score it beats gets it spliced in.
+        """
+        if self._available() < self.k:
+            raise ValueError("catalog too small for incremental updates, rebuild instead")
+
+        row = len(self)
+        indices, scores, active = self._writable()
+        row_scores = (self.normed @ vector.T).toarray().ravel()
+        row_scores[~active] = -np.inf
+
+        own = select_top_n(row_scores, self.k)
+        affected = np.flatnonzero(row_scores.astype(np.float32) > scores[:, -1])
+        if affected.shape[0]:
+            self._splice(indices, scores, affected, row, row_scores)
+
+        self.normed = sp.vstack([self.normed, vector], format='csr')
+        self.indices = np.vstack([indices, own[None, :].astype(np.int32)])
+        self.scores = np.vstack([scores, row_scores[own][None, :].astype(np.float32)])
+        self.active = np.append(active, True)
+        return row
+
+    def update_row(self, row, vector):
+        """Replace a row's features, touching only the lists it was in or now enters
+
+        Lists the row still ranks in, at its new score, or newly enters get
+        it spliced in. Only those it falls out of are scored against the
+        whole catalog again, since the movie that replaces it is not in them.
+        """
+        indices, scores, active = self._writable()
+        self.normed = sp.vstack([self.normed[:row], vector, self.normed[row + 1:]], format='csr')
+
+        row_scores = (self.normed @ vector.T).toarray().ravel()
+        row_scores[row] = -np.inf
+        row_scores[~active] = -np.inf
+        new_scores = row_scores.astype(np.float32)
+        # Ranked ahead of the last entry (ties go to the lower row), as the list order breaks them
+        ahead = (new_scores > scores[:, -1]) | ((new_scores == scores[:, -1]) & (row < indices[:, -1]))
+        held = np.any(indices == row, axis=1) & active
+        self._splice(indices, scores, np.flatnonzero(ahead & active), row, row_scores)
+        self.refresh(np.flatnonzero(held & ~ahead), indices, scores)
+
+        own = select_top_n(row_scores, self.k)
+        indices[row] = own
+        scores[row] = row_scores[own]
+        self.indices, self.scores, self.active = indices, scores, active
+
+    def remove_row(self, row):
+        """Tombstone a row and repair every list that contained it"""
+        indices, scores, active = self._writable()
+        active[row] = False
+        if int(active.sum()) - 1 < self.k:
+            raise ValueError("catalog too small for incremental updates, rebuild instead")
+        self.active = active
+
+        affected = np.flatnonzero(np.any(indices == row, axis=1) & active)
+        self.refresh(affected, indices, scores)
+        self.indices, self.scores = indices, scores
+
+
+def _block_top_k(normed, normed_t, start, stop, k):
+    """Top-k neighbor rows and scores for rows [start, stop) from one dense scratch block"""
+    block = (normed[start:stop] @ normed_t).toarray()
+
+    # A movie is never its own recommendation
+    block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+    top = select_top_n_rows(block, k)
+    return top.astype(np.int32), np.take_along_axis(block, top, axis=1).astype(np.float32)
+
+
+# Per-process state for pool workers, set once by _init_worker
+_worker_matrices = None
+
+
+def _init_worker(normed):
+    global _worker_matrices
+    _worker_matrices = (normed, normed.T.tocsc())
+
+
+def _worker_block(task):
+    start, stop, k = task
+    return start, _block_top_k(*_worker_matrices, start, stop, k)
+
+
+def build_neighbor_index(vectors, k=DEFAULT_K, workers=NEIGHBOR_WORKERS):
+    """Compute the top-k cosine neighbors of every row of a sparse feature matrix
+
+    Rows are processed in blocks of at most BLOCK_CELLS scores; with
+    workers > 1 the blocks are spread over a process pool. Each list is in
+    stable descending order of this normalised product. It can differ from
+    a stable argsort of sklearn's cosine_similarity on float-equal ties,
+    which the two products round differently.
+    """
+    n_rows = vectors.shape[0]
+    k = max(0, min(k, n_rows - 1))
+    normed = l2_normalize(vectors)
+
+    indices = np.empty((n_rows, k), dtype=np.int32)
+    scores = np.empty((n_rows, k), dtype=np.float32)
+
+    block_size = max(1, BLOCK_CELLS // max(n_rows, 1))
+    tasks = [(start, min(start + block_size, n_rows), k) for start in range(0, n_rows, block_size)]
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(normed,)) as pool:
+            for start, (top, top_scores) in pool.map(_worker_block, tasks):
+                indices[start:start + top.shape[0]] = top
+                scores[start:start + top.shape[0]] = top_scores
+    else:
+        normed_t = normed.T.tocsc()
+        for start, stop, _ in tasks:
+            indices[start:stop], scores[start:stop] = _block_top_k(normed, normed_t, start, stop, k)
+
+    return NeighborIndex(indices, scores, normed)
@@ -0,0 +1,300 @@
+"""
+Precomputed recommendations for the busiest traffic
+An offline job runs the same model.recommend() the APIs use for every movie,
+spread over a process pool, and writes each movie's display record and
+top-N (row, score) list into a SQLite store keyed by row, TMDB id and
+normalised title. With SERVING_MODE=precomputed the Flask backends answer
+/api/recommend with one indexed query (seed, neighbor list and neighbor
+records joined in SQLite) and never load the model or its similarity data.
+
+Usage:
+    python backend/precompute.py build [--n 20] [--out recommendations.sqlite] [--workers 4]
+    python backend/precompute.py info [--out recommendations.sqlite]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+
+    def _dumps(value):
+        return orjson.dumps(value).decode()
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(value):
+        return json.dumps(value, separators=(',', ':'))
+    _loads = json.loads
+
+from catalog import CATALOG_JOURNAL
+from features import CREDITS_CSV, MOVIES_CSV
+from neighbors import DEFAULT_K
+from title_index import TitleIndex, normalize_title
+
+# 'model' ranks at request time; 'precomputed' serves /api/recommend from PRECOMPUTED_STORE only
+SERVING_MODE = os.environ.get('SERVING_MODE', 'model')
+PRECOMPUTED_STORE = os.environ.get('PRECOMPUTED_STORE', 'recommendations.sqlite')
+
+# Recommendations stored per movie; requests asking for more get this many
+PRECOMPUTE_N = int(os.environ.get('PRECOMPUTE_N', '20'))
+
+# Seconds between checks for a rebuilt store file; 0 disables
+STORE_CHECK_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', '30'))
+
+# Movies per pool task
+PRECOMPUTE_CHUNK_ROWS = 2000
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE movies (row INTEGER PRIMARY KEY, movie_id INTEGER NOT NULL, record TEXT NOT NULL);
+CREATE TABLE recommendations (row INTEGER PRIMARY KEY, neighbors TEXT NOT NULL);
+CREATE TABLE titles (title_key TEXT PRIMARY KEY, row INTEGER NOT NULL) WITHOUT ROWID;
+"""
+
+# Seed record, then each stored neighbor's record and score in rank order
+LOOKUP_QUERY = """
+SELECT seed.record, movie.record, json_extract(neighbor.value, '$[1]')
+FROM {seed}
+JOIN recommendations ON recommendations.row = seed.row
+LEFT JOIN json_each(recommendations.neighbors) AS neighbor
+LEFT JOIN movies AS movie ON movie.row = json_extract(neighbor.value, '$[0]')
+WHERE {where}
+ORDER BY neighbor.key
+"""
+BY_ID = LOOKUP_QUERY.format(
+    seed="(SELECT * FROM movies WHERE movie_id = ? ORDER BY row LIMIT 1) AS seed", where="1")
+BY_TITLE = LOOKUP_QUERY.format(
+    seed="titles JOIN movies AS seed ON seed.row = titles.row", where="titles.title_key = ?")
+
+
+# -------------------------
+# Offline job
+# -------------------------
+# Model shared with forked pool workers, set before the pool starts
+_worker_model = None
+
+
+def chunk_rows(model, rows, n):
+    """(row, TMDB id, record JSON, neighbors JSON) for each row; neighbors are [row, score] pairs"""
+    return [(row, model.records[row]['id'], _dumps(model.records[row]), _dumps(model.recommend(row, n)))
+            for row in rows]
+
+
+def _worker_chunk(task):
+    rows, n = task
+    return chunk_rows(_worker_model, rows, n)
+
+
+def _chunks(model, n):
+    rows = [row for row, record in enumerate(model.records) if record is not None]
+    return [(rows[start:start + PRECOMPUTE_CHUNK_ROWS], n) for start in range(0, len(rows), PRECOMPUTE_CHUNK_ROWS)]
+
+
+def precompute(model, path=PRECOMPUTED_STORE, n=PRECOMPUTE_N, workers=None):
+    """Write every active movie's top-n recommendations to a fresh SQLite store at path
+
+    The store is written beside path and renamed over it, so servers never
+    read a half-written file. Workers are forked, sharing the loaded model
+    copy-on-write; where fork is unavailable the job runs serially.
+    """
+    global _worker_model
+    tasks = _chunks(model, n)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+
+        def insert(results):
+            connection.executemany("INSERT INTO movies (row, movie_id, record) VALUES (?, ?, ?)",
+                                   [result[:3] for result in results])
+            connection.executemany("INSERT INTO recommendations (row, neighbors) VALUES (?, ?)",
+                                   [(result[0], result[3]) for result in results])
+
+        use_pool = workers and workers > 1 and len(tasks) > 1 and \
+            'fork' in multiprocessing.get_all_start_methods()
+        if use_pool:
+            _worker_model = model
+            try:
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                    for results in pool.map(_worker_chunk, tasks):
+                        insert(results)
+            finally:
+                _worker_model = None
+        else:
+            for rows, _ in tasks:
+                insert(chunk_rows(model, rows, n))
+
+        connection.execute("CREATE INDEX movies_movie_id ON movies (movie_id)")
+        connection.executemany("INSERT INTO titles (title_key, row) VALUES (?, ?)",
+                               [(key, row) for key, row in model.movie_lookup.title_rows.items()
+                                if key and model.records[row] is not None])
+        meta = {
+            'version': model.tag,
+            'n': n,
+            'built_at': time.time(),
+            'movie_count': sum(len(rows) for rows, _ in tasks),
+            'neighbors': model.neighbor_index.info,
+        }
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                               [(key, json.dumps(value)) for key, value in meta.items()])
+        connection.commit()
+    except BaseException:
+        connection.close()
+        os.remove(tmp_path)
+        raise
+    connection.close()
+    os.replace(tmp_path, path)
+    return meta
+
+
+# -------------------------
+# Serving
+# -------------------------
+class RecommendationStore:
+    """Read-only keyed access to a precomputed store, one SQLite connection per thread
+
+    lookup() answers a TMDB id or an exact (normalised) title with a single
+    indexed query. Misspelt titles fall back to fuzzy matching over the
+    stored titles, loaded on first use.
+    """
+
+    def __init__(self, path=PRECOMPUTED_STORE, check_interval=STORE_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stamp = self._file_stamp()
+        self._checked = time.monotonic()
+        self._title_keys = None
+        self._title_index = None
+        self.meta = self._read_meta()
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            if getattr(local, 'connection', None) is not None:
+                local.connection.close()
+            local.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            local.generation = self._generation
+        return local.connection
+
+    def _read_meta(self):
+        rows = self._connection().execute("SELECT key, value FROM meta").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def check(self):
+        """Throttled per-request check; reopens the store when the job has replaced the file"""
+        if not self.check_interval:
+            return
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            return
+        if stamp != self._stamp:
+            with self._lock:
+                self._stamp = stamp
+                self._generation += 1
+                self._title_keys = self._title_index = None
+            self.meta = self._read_meta()
+
+    @property
+    def tag(self):
+        return self.meta.get('version')
+
+    def _fuzzy_key(self, name):
+        with self._lock:
+            if self._title_index is None:
+                keys = [key for key, in self._connection().execute("SELECT title_key FROM titles")]
+                self._title_keys, self._title_index = keys, TitleIndex(keys)
+            keys, title_index = self._title_keys, self._title_index
+        match = title_index.best_match(name)
+        return (keys[match[2]], match[1]) if match else (None, 0)
+
+    @staticmethod
+    def _entry(rows):
+        if not rows:
+            return None
+        return {
+            'movie': _loads(rows[0][0]),
+            'recommendations': [[_loads(record), score] for _, record, score in rows if record is not None],
+        }
+
+    def lookup(self, name=None, movie_id=None):
+        """(entry, match score) for a TMDB id or title, or None
+
+        entry is {'movie': record, 'recommendations': [[record, score], ...]}.
+        """
+        connection = self._connection()
+        if movie_id is not None:
+            try:
+                movie_id = int(movie_id)
+            except (TypeError, ValueError):
+                return None
+            entry = self._entry(connection.execute(BY_ID, (movie_id,)).fetchall())
+            return (entry, 100) if entry else None
+        if not name:
+            return None
+
+        key, score = normalize_title(name), 100
+        entry = self._entry(connection.execute(BY_TITLE, (key,)).fetchall()) if key else None
+        if entry is None:
+            key, score = self._fuzzy_key(name)
+            entry = self._entry(connection.execute(BY_TITLE, (key,)).fetchall()) if key else None
+        return (entry, score) if entry else None
+
+    def info(self):
+        return dict(self.meta, path=self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute every movie's recommendations into a SQLite store")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="compute and write the store")
+    build.add_argument('--movies', default=MOVIES_CSV)
+    build.add_argument('--credits', default=CREDITS_CSV)
+    build.add_argument('--journal', default=CATALOG_JOURNAL, help="catalog update journal to apply")
+    build.add_argument('--k', type=int, default=DEFAULT_K, help="neighbors kept per movie in the model")
+    build.add_argument('--n', type=int, default=PRECOMPUTE_N, help="recommendations stored per movie")
+    build.add_argument('--out', default=PRECOMPUTED_STORE)
+    build.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+
+    info = sub.add_parser('info', help="describe a store")
+    info.add_argument('--out', default=PRECOMPUTED_STORE)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from snapshot import load_model
+
+        start = time.perf_counter()
+        model = load_model(args.movies, args.credits, k=args.k, journal=args.journal)
+        loaded = time.perf_counter()
+        meta = precompute(model, args.out, n=args.n, workers=args.workers)
+        print(f"Wrote {meta['movie_count']} movies x {args.n} recommendations to {args.out} "
+              f"(model {loaded - start:.1f}s, precompute {time.perf_counter() - loaded:.1f}s)")
+    else:
+        print(json.dumps(RecommendationStore(args.out).info(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+In-process result cache for the recommendation and search endpoints
+Bounded LRU with a per-entry TTL; everything is dropped when the model version changes
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from title_index import normalize_title
+
+CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '1024'))
+CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', '600'))
+
+
+def request_key(endpoint, name=None, movie_id=None, *params):
+    """Cache key for a request; titles are normalised so trivial variants share an entry"""
+    if movie_id:
+        return (endpoint, 'id', str(movie_id).strip()) + params
+    return (endpoint, 'title', normalize_title(name) or name) + params
+
+
+class ResultCache:
+    """Thread-safe LRU cache of response payloads keyed on normalised request parameters"""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        """Cached value for key under the given model version, or None"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'model_version': self.version,
+            }
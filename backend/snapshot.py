@@ -0,0 +1,303 @@
+"""
+Persisted model snapshots for instant startup
+A snapshot is a directory of .npy arrays (memory-mapped on load, so worker
+processes share pages), the display catalog as a SQLite file (read per row)
+and a manifest, named after a hash of the input CSVs. The title, filter and
+listing indexes are saved as arrays too, so loading never rebuilds them.
+
+Usage:
+    python backend/snapshot.py build [--movies CSV] [--credits CSV] [--out DIR] [--journal JSONL]
+
+Run build on a schedule to fold incremental catalog updates into a fresh
+snapshot (new vocabulary terms included).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from catalog import CATALOG_JOURNAL, journal_size, read_entries
+from catalog_store import CatalogStore
+from features import CREDITS_CSV, HASHING_FEATURES, MOVIES_CSV, VECTORIZER
+from metrics import StageTimer, build_metrics
+from model import MovieModel, build_model
+from neighbors import DEFAULT_K, NEIGHBOR_BACKEND, NeighborIndex
+
+SNAPSHOT_DIR = os.environ.get('MODEL_SNAPSHOT_DIR', 'model_snapshot')
+
+# Bump when the on-disk layout or the feature pipeline changes
+SNAPSHOT_FORMAT = 7
+
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+CATALOG_FILE = 'catalog.sqlite'
+VOCABULARY_FILE = 'vocabulary.json'
+# MovieModel.index_arrays(), one <index>.<array>.npy file per array
+INDEX_DIR = 'indexes'
+ARRAY_FILES = {
+    'neighbor_indices': 'neighbor_indices.npy',
+    'neighbor_scores': 'neighbor_scores.npy',
+    'features_data': 'features_data.npy',
+    'features_indices': 'features_indices.npy',
+    'features_indptr': 'features_indptr.npy',
+}
+
+
+def source_fingerprints(paths):
+    """Cheap size/mtime fingerprints used to skip rehashing unchanged CSVs"""
+    fingerprints = []
+    for path in paths:
+        stat = os.stat(path)
+        fingerprints.append({'name': os.path.basename(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return fingerprints
+
+
+def dataset_fingerprint(sources=(MOVIES_CSV, CREDITS_CSV)):
+    """Hashable size/mtime stamp of the input CSVs (None without them), for keying caches on the dataset"""
+    try:
+        return tuple((f['name'], f['size'], f['mtime_ns']) for f in source_fingerprints(sources))
+    except OSError:
+        return None
+
+
+def vectorizer_setting():
+    """Configured vectorizer as recorded in manifests and version hashes"""
+    return f"hashing:{HASHING_FEATURES}" if VECTORIZER == 'hashing' else VECTORIZER
+
+
+def neighbor_setting():
+    """Configured neighbor backend as recorded in manifests and version hashes"""
+    return NEIGHBOR_BACKEND
+
+
+def dataset_version(paths, k=DEFAULT_K, journal_offset=0):
+    """Content hash of the input CSVs plus the pipeline settings
+
+    The append-only catalog journal is identified by how much of it was folded in.
+    """
+    settings = (f"format={SNAPSHOT_FORMAT};k={k};vectorizer={vectorizer_setting()};"
+                f"neighbors={neighbor_setting()};journal={journal_offset}")
+    digest = hashlib.sha256(settings.encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def save_snapshot(model, root=SNAPSHOT_DIR, sources=()):
+    """Write a model to root/<version>/ and point root/CURRENT at it"""
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, model.version)
+
+    if not os.path.isdir(target):
+        tmp_dir = tempfile.mkdtemp(prefix=f".{model.version}-", dir=root)
+        try:
+            index = model.neighbor_index
+            normed = index.normed.tocsr()
+            arrays = {
+                'neighbor_indices': index.indices,
+                'neighbor_scores': index.scores,
+                'features_data': normed.data,
+                'features_indices': normed.indices,
+                'features_indptr': normed.indptr,
+            }
+            for name, filename in ARRAY_FILES.items():
+                np.save(os.path.join(tmp_dir, filename), arrays[name])
+            indexes = model.index_arrays()
+            os.mkdir(os.path.join(tmp_dir, INDEX_DIR))
+            for index_name, index_arrays in indexes.items():
+                for name, values in index_arrays.items():
+                    np.save(os.path.join(tmp_dir, INDEX_DIR, f"{index_name}.{name}.npy"), values)
+
+            model.records.save(os.path.join(tmp_dir, CATALOG_FILE))
+            with open(os.path.join(tmp_dir, VOCABULARY_FILE), 'w') as f:
+                json.dump(model.vocabulary, f)
+
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': model.version,
+                'built_at': model.built_at,
+                'movie_count': len(model),
+                'k': index.k,
+                'features_shape': list(normed.shape),
+                'vectorizer': vectorizer_setting(),
+                'neighbors': dict(index.info, setting=neighbor_setting()),
+                'sources': source_fingerprints(sources) if sources else [],
+                'journal_offset': model.journal_offset,
+                'indexes': {index_name: sorted(index_arrays) for index_name, index_arrays in indexes.items()},
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            # Another process may have published the same version meanwhile
+            try:
+                os.rename(tmp_dir, target)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    _write_current(root, model.version)
+    return target
+
+
+def _write_current(root, version):
+    fd, tmp_path = tempfile.mkstemp(prefix='.current-', dir=root)
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def load_snapshot(path, mmap=True):
+    """Load a snapshot directory; arrays (the saved indexes' included) are memory-mapped read-only"""
+    manifest = read_manifest(path)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"snapshot {path} has format {manifest.get('format')}, expected {SNAPSHOT_FORMAT}")
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+              for name, filename in ARRAY_FILES.items()}
+    normed = sp.csr_matrix(
+        (arrays['features_data'], arrays['features_indices'], arrays['features_indptr']),
+        shape=tuple(manifest['features_shape']),
+        copy=False,
+    )
+    info = {key: value for key, value in manifest.get('neighbors', {'backend': 'exact'}).items() if key != 'setting'}
+    neighbor_index = NeighborIndex(arrays['neighbor_indices'], arrays['neighbor_scores'], normed, info=info)
+
+    indexes = {index_name: {name: np.load(os.path.join(path, INDEX_DIR, f"{index_name}.{name}.npy"),
+                                          mmap_mode=mmap_mode)
+                            for name in names}
+               for index_name, names in manifest['indexes'].items()}
+
+    records = CatalogStore(os.path.join(path, CATALOG_FILE))
+    with open(os.path.join(path, VOCABULARY_FILE)) as f:
+        vocabulary = json.load(f)
+
+    return MovieModel(records, neighbor_index, vocabulary, version=manifest['version'], built_at=manifest['built_at'],
+                      journal_offset=manifest.get('journal_offset', 0), indexes=indexes)
+
+
+def find_snapshot(root, sources, k=DEFAULT_K, journal=CATALOG_JOURNAL):
+    """Path of a snapshot matching the input CSVs, or None
+
+    Without the CSVs on disk the CURRENT snapshot is trusted as is. A
+    snapshot that folded in more of the catalog journal than exists now
+    (the journal was reset) no longer matches.
+    """
+    current = None
+    current_path = os.path.join(root, CURRENT_FILE)
+    if os.path.exists(current_path):
+        with open(current_path) as f:
+            current = os.path.join(root, f.read().strip())
+        if not os.path.isdir(current):
+            current = None
+
+    if not sources or not all(os.path.exists(path) for path in sources):
+        return current
+
+    if current is not None:
+        manifest = read_manifest(current)
+        if (manifest.get('format') == SNAPSHOT_FORMAT and manifest.get('k') == k
+                and manifest.get('sources') == source_fingerprints(sources)
+                and manifest.get('vectorizer', 'count') == vectorizer_setting()
+                and manifest.get('neighbors', {}).get('setting', 'exact') == neighbor_setting()
+                and manifest.get('journal_offset', 0) <= journal_size(journal)):
+            return current
+
+    candidate = os.path.join(root, dataset_version(sources, k))
+    return candidate if os.path.isdir(candidate) else None
+
+
+def load_model(movies_path=MOVIES_CSV, credits_path=CREDITS_CSV, root=SNAPSHOT_DIR, k=DEFAULT_K,
+               journal=CATALOG_JOURNAL, progress=None):
+    """Memory-map the matching snapshot, building and saving one if needed
+
+    Catalog updates journalled after the snapshot was built are replayed on top.
+    progress is passed to build_model; a snapshot load only reports 'load'.
+    """
+    sources = (movies_path, credits_path)
+    timer = StageTimer()
+    path = find_snapshot(root, sources, k, journal)
+    if path is not None:
+        print(f"Loading model snapshot {path}...")
+        if progress is not None:
+            progress('load')
+        with timer.stage('snapshot_load'):
+            model = load_snapshot(path)
+        with timer.stage('journal'):
+            model = model.synced(journal)
+        if model.revision:
+            print(f"Applied {model.revision} catalog updates")
+        build_metrics.record(timer)
+        return model
+
+    model = build_model(movies_path, credits_path, k=k, journal=journal, progress=progress, timer=timer)
+    model.version = dataset_version(sources, k, model.journal_offset)
+    try:
+        with timer.stage('snapshot_save'):
+            save_snapshot(model, root, sources)
+    except OSError as e:
+        print(f"Could not save model snapshot: {e}")
+    build_metrics.record(timer)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect model snapshots")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="build a snapshot from the TMDB CSVs")
+    build.add_argument('--movies', default=MOVIES_CSV)
+    build.add_argument('--credits', default=CREDITS_CSV)
+    build.add_argument('--out', default=SNAPSHOT_DIR)
+    build.add_argument('--k', type=int, default=DEFAULT_K, help="neighbors kept per movie")
+    build.add_argument('--journal', default=CATALOG_JOURNAL, help="catalog update journal to fold in")
+    build.add_argument('--force', action='store_true', help="rebuild even if a matching snapshot exists")
+
+    info = sub.add_parser('info', help="describe the current snapshot")
+    info.add_argument('--out', default=SNAPSHOT_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sources = (args.movies, args.credits)
+        _, journal_offset = read_entries(args.journal)
+        version = dataset_version(sources, args.k, journal_offset)
+        existing = os.path.join(args.out, version)
+        if os.path.isdir(existing) and not args.force:
+            _write_current(args.out, version)
+            print(f"Snapshot {existing} is already up to date")
+            return
+        if args.force:
+            shutil.rmtree(existing, ignore_errors=True)
+
+        start = time.perf_counter()
+        model = build_model(args.movies, args.credits, k=args.k, journal=args.journal)
+        model.version = dataset_version(sources, args.k, model.journal_offset)
+        path = save_snapshot(model, args.out, sources)
+        print(f"Wrote snapshot {path} ({len(model)} movies) in {time.perf_counter() - start:.1f}s")
+    else:
+        path = find_snapshot(args.out, ())
+        if path is None:
+            print(f"No snapshot in {args.out}")
+            return
+        print(json.dumps(read_manifest(path), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BACKEND_DIR), 'scripts'))
+
+from features import movie_from_payload  # noqa: E402
+from generate_dataset import generate  # noqa: E402
+from model_holder import ModelHolder  # noqa: E402
+
+ROWS = 300
+K = 10
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    """Synthetic CSVs and a snapshot directory shared by every test"""
+    root = tmp_path_factory.mktemp('dataset')
+    movies_path, credits_path = generate(ROWS, str(root), seed=1)
+    return movies_path, credits_path, str(root / 'model_snapshot')
+
+
+@pytest.fixture
+def holder(dataset, tmp_path):
+    """A loaded ModelHolder with its own, empty catalog journal"""
+    movies_path, credits_path, snapshot_dir = dataset
+    holder = ModelHolder(movies_path, credits_path, root=snapshot_dir, k=K,
+                         journal=str(tmp_path / 'catalog_updates.jsonl'), check_interval=0)
+    holder.load()
+    return holder
+
+
+def make_movie(movie_id, title, **fields):
+    """Catalog row for movie_id as the catalog endpoints build it from a request body"""
+    payload = {'id': movie_id, 'title': title, 'genres': ['Drama', 'Action'], 'keywords': ['space', 'heist'],
+               'cast': ['Actor 1', 'Actor 2'], 'director': 'Director 3', 'popularity': 12.5,
+               'vote_average': 6.5, 'vote_count': 40, 'release_date': '2004-05-06', 'original_language': 'en'}
+    payload.update(fields)
+    return movie_from_payload(payload)
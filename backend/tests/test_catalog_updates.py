@@ -0,0 +1,179 @@
+import random
+import threading
+
+import numpy as np
+import pytest
+
+import catalog
+from catalog import append_entry, journal_size
+from conftest import K, make_movie
+from neighbors import select_top_n_rows
+
+
+def live_ids(model):
+    return [movie_id for movie_id in model.columns['id'] if movie_id is not None]
+
+
+def assert_neighbors_exact(model):
+    """Every active row's neighbor list holds the k best scores against the current catalog"""
+    index = model.neighbor_index
+    for row in np.flatnonzero(index.active):
+        expected = np.sort(index.score_rows([row])[0])[::-1][:K]
+        rows, scores = index.indices[row], index.scores[row]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5, atol=1e-6)
+        actual = (index.normed[row] @ index.normed[rows].T).toarray().ravel()
+        np.testing.assert_allclose(scores, actual, rtol=1e-5, atol=1e-6)
+        assert index.active[rows].all()
+
+
+def random_updates(holder, steps, seed):
+    rng = random.Random(seed)
+    for step in range(steps):
+        op = rng.choice(['add', 'update', 'remove'])
+        if op == 'add':
+            movie_id = 900000 + step
+            holder.commit_update(op, movie_id, make_movie(movie_id, f"Added Movie {step}",
+                                                          popularity=rng.random() * 50))
+            continue
+        movie_id = rng.choice(live_ids(holder.current))
+        movie = None
+        if op == 'update':
+            movie = make_movie(movie_id, f"Updated Movie {step}", keywords=['kw%d' % rng.randrange(5)],
+                               vote_average=rng.choice([None, 4.0, 8.5]))
+        holder.commit_update(op, movie_id, movie)
+
+
+def test_updates_keep_neighbor_lists_exact(holder):
+    random_updates(holder, 24, seed=3)
+    model = holder.current
+    assert model.revision == 24
+    assert_neighbors_exact(model)
+
+
+def test_updates_splice_tied_scores_in_list_order(holder):
+    """Updated rows tie with each other, so the spliced lists must break ties by row like a rescore"""
+    ids = live_ids(holder.current)
+    for step, movie_id in enumerate(ids[:6] + ids[:3]):
+        holder.commit_update('update', movie_id, make_movie(movie_id, f"Twin {step}", keywords=['twin']))
+    holder.commit_update('update', ids[1], make_movie(ids[1], 'Single', keywords=['single'], genres=['Western']))
+
+    index = holder.current.neighbor_index
+    rows = np.flatnonzero(index.active)
+    block = index.score_rows(rows)
+    expected = select_top_n_rows(block, K)
+    np.testing.assert_array_equal(index.indices[rows], expected)
+    np.testing.assert_allclose(index.scores[rows], np.take_along_axis(block, expected, axis=1), rtol=1e-6, atol=1e-7)
+
+
+def test_loaded_model_is_ready_for_updates(holder):
+    assert holder.current._vectorizer is not None
+
+
+def test_update_leaves_published_model_untouched(holder):
+    before = holder.current
+    row = before.resolve(movie_id=live_ids(before)[0])[0]
+    neighbors = before.recommend(row, K)
+    page = before.list_movies('popularity', limit=20)
+
+    random_updates(holder, 9, seed=5)
+
+    assert holder.current is not before
+    assert before.revision == 0
+    assert before.recommend(row, K) == neighbors
+    assert before.list_movies('popularity', limit=20) == page
+
+
+def test_update_and_remove_are_visible_in_lookups(holder):
+    movie_id = live_ids(holder.current)[3]
+    model = holder.commit_update('update', movie_id, make_movie(movie_id, 'Completely Renamed'))
+    row = model.resolve(movie_id=movie_id)[0]
+    assert model.resolve(name='Completely Renamed') == (row, 100)
+    assert model.records[row]['title'] == 'Completely Renamed'
+
+    model = holder.commit_update('remove', movie_id)
+    assert model.resolve(movie_id=movie_id) is None
+    assert all(row not in rows for rows in model.neighbor_index.indices[model.neighbor_index.active].tolist())
+
+
+def test_refused_update_is_not_journalled(holder):
+    before = holder.current
+    movie = make_movie(950000, 'Broken Movie')
+    del movie['original_title']
+    with pytest.raises(KeyError):
+        holder.commit_update('add', 950000, movie)
+    assert journal_size(holder.journal) == 0
+    assert holder.current is before
+
+
+def test_replay_skips_invalid_journal_entries(holder):
+    before = holder.current
+    append_entry({'op': 'add', 'id': 950001, 'movie': {'id': 950001}}, holder.journal)
+    append_entry({'op': 'remove', 'id': live_ids(before)[0]}, holder.journal)
+
+    model = holder.sync_journal()
+    assert model.journal_offset == journal_size(holder.journal)
+    assert model.revision == 2
+    assert model.resolve(movie_id=950001) is None
+    assert model.resolve(movie_id=live_ids(before)[0]) is None
+
+
+def test_catalog_endpoint_rejections_leave_journal_alone(holder, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, 'model_holder', holder)
+    monkeypatch.setattr(catalog, 'CATALOG_API_TOKEN', 'secret')
+    client = api.app.test_client()
+    headers = {'X-Catalog-Token': 'secret'}
+    existing = live_ids(holder.current)[0]
+
+    response = client.post('/api/catalog/movies', json={'id': existing, 'title': 'Duplicate'}, headers=headers)
+    assert response.status_code == 409
+    response = client.put('/api/catalog/movies/123456789', json={'title': 'Missing'}, headers=headers)
+    assert response.status_code == 404
+    response = client.post('/api/catalog/movies', json={'title': 'No id'}, headers=headers)
+    assert response.status_code == 400
+    response = client.post('/api/catalog/movies', json={'id': 950002, 'title': 'No token'})
+    assert response.status_code == 403
+    assert journal_size(holder.journal) == 0
+
+    response = client.post('/api/catalog/movies', json={'id': 950002, 'title': 'Accepted'}, headers=headers)
+    assert response.status_code == 201
+    assert response.get_json()['revision'] == 1
+    assert journal_size(holder.journal) > 0
+
+
+def test_reads_during_updates(holder):
+    errors = []
+    done = threading.Event()
+
+    def read(seed):
+        rng = random.Random(seed)
+        while not done.is_set():
+            try:
+                model = holder.current
+                filters = {'genres': ('drama',)} if rng.random() < 0.5 else None
+                sort = rng.choice(['popularity', 'rating', 'release_date', 'title'])
+                rows, cursor, _ = model.list_movies(sort, limit=25, filters=filters)
+                if cursor:
+                    model.list_movies(sort, limit=25, filters=filters, cursor=cursor)
+                model.autocomplete('a')
+                model.title_index.search('Moive')
+                movie_id = rng.choice(live_ids(model))
+                row = model.resolve(movie_id=movie_id)[0]
+                model.recommend(row, K)
+                model.recommend(row, K, {'min_rating': 6.0})
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read, args=(seed,)) for seed in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        random_updates(holder, 30, seed=7)
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+    assert errors == []
+    assert_neighbors_exact(holder.current)
@@ -0,0 +1,83 @@
+import pytest
+
+from conftest import make_movie
+from listing import DEFAULT_PAGE_SIZE, SORT_FIELDS, parse_listing, sort_values
+
+
+def expected_rows(model, sort, descending, filters=None):
+    """Brute-force listing order: by key (ties by row), reversed when descending, keyless rows last"""
+    keys = sort_values(model.columns, sort)
+    mask = model.attributes.mask(**filters) if filters else None
+    rows = [row for row, movie_id in enumerate(model.columns['id'])
+            if movie_id is not None and (mask is None or mask[row])]
+    known = sorted((row for row in rows if keys[row] is not None), key=lambda row: (keys[row], row))
+    if descending:
+        known.reverse()
+    return known + [row for row in rows if keys[row] is None]
+
+
+def walk(model, sort, descending, filters=None, limit=17):
+    """Every row of a listing, following next cursors page by page"""
+    rows, cursor, total = model.list_movies(sort, descending, limit, filters)
+    while cursor:
+        page, cursor, _ = model.list_movies(sort, descending, limit, filters, cursor=cursor)
+        assert page
+        rows += page
+    return rows, total
+
+
+@pytest.mark.parametrize('sort', SORT_FIELDS)
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_pages_cover_listing_in_order(holder, sort, descending):
+    model = holder.current
+    for filters in (None, {'genres': ('drama',)}, {'year_from': 1990, 'min_rating': 5.0}):
+        rows, total = walk(model, sort, descending, filters)
+        expected = expected_rows(model, sort, descending, filters)
+        assert rows == expected
+        assert total == len(expected)
+
+
+@pytest.mark.parametrize('sort', SORT_FIELDS)
+def test_cursor_pages_follow_catalog_updates(holder, sort):
+    ids = [movie_id for movie_id in holder.current.columns['id'] if movie_id is not None]
+    holder.commit_update('add', 960000, make_movie(960000, 'Zebra Crossing', popularity=999.0))
+    holder.commit_update('add', 960001, make_movie(960001, 'Aardvark', vote_average=None, release_date=None))
+    holder.commit_update('update', ids[0], make_movie(ids[0], 'Middle Of The Road', popularity=0.0))
+    holder.commit_update('remove', ids[1])
+
+    model = holder.current
+    for descending in (False, True):
+        rows, total = walk(model, sort, descending)
+        assert rows == expected_rows(model, sort, descending)
+        assert total == len(rows) == len(ids) + 1
+
+
+def test_offset_pages_match_cursor_pages(holder):
+    model = holder.current
+    rows, _ = walk(model, 'rating', True, limit=20)
+    for offset in (0, 20, 140):
+        page, _, _ = model.list_movies('rating', True, 20, offset=offset)
+        assert page == rows[offset:offset + 20]
+
+
+def test_cursor_from_another_sort_is_refused(holder):
+    model = holder.current
+    _, cursor, _ = model.list_movies('title', False, 10)
+    with pytest.raises(ValueError):
+        model.list_movies('popularity', True, 10, cursor=cursor)
+    with pytest.raises(ValueError):
+        model.list_movies('title', False, 10, cursor='not-a-cursor')
+
+
+def test_listing_defaults_to_catalog_order(holder, monkeypatch):
+    import api
+
+    assert parse_listing({}) == {'sort': 'catalog', 'descending': False, 'limit': DEFAULT_PAGE_SIZE,
+                                 'cursor': None, 'offset': 0}
+    monkeypatch.setattr(api, 'model_holder', holder)
+    body = api.app.test_client().get('/api/movies?limit=15').get_json()
+    assert (body['sort'], body['order']) == ('catalog', 'asc')
+    assert [movie['id'] for movie in body['movies']] == holder.current.columns['id'][:15]
+
+    body = api.app.test_client().get(f"/api/movies?limit=15&cursor={body['nextCursor']}").get_json()
+    assert [movie['id'] for movie in body['movies']] == holder.current.columns['id'][15:30]
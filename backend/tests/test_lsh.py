@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from conftest import K
+from features import make_vectorizer, stream_catalog
+from generate_dataset import generate
+from lsh import build_lsh_neighbor_index
+from neighbors import build_neighbor_index
+
+ROWS = 2000
+
+# Measured 0.980 on this catalog at K=10; buckets are capped at 50 rows so that most
+# pairs are never scored and recall depends on the MinHash candidates
+MAX_BUCKET = 50
+MIN_RECALL = 0.95
+
+
+@pytest.fixture(scope='module')
+def vectors(tmp_path_factory):
+    movies_path, credits_path = generate(ROWS, str(tmp_path_factory.mktemp('lsh')), seed=1)
+    df, _ = stream_catalog(movies_path, credits_path)
+    return make_vectorizer('count').fit_transform(df['combined_features'])
+
+
+def test_lsh_recall_against_exact_build(vectors):
+    index = build_lsh_neighbor_index(vectors, K, max_bucket=MAX_BUCKET, recall_sample=ROWS)
+    exact = build_neighbor_index(vectors, K)
+    assert index.indices.shape == exact.indices.shape == (ROWS, K)
+
+    # Kept neighbors carry their true cosine score, and no row lists itself
+    normed = exact.normed
+    true_scores = np.asarray(normed[np.repeat(np.arange(ROWS), K)]
+                             .multiply(normed[index.indices.ravel()]).sum(axis=1)).reshape(ROWS, K)
+    np.testing.assert_allclose(index.scores, true_scores, atol=1e-6)
+    assert not (index.indices == np.arange(ROWS)[:, None]).any()
+
+    # A kept neighbor is a hit when it reaches the exact K-th best score
+    hits = index.scores >= exact.scores[:, -1:] - 1e-6
+    recall = hits.mean()
+    assert recall >= MIN_RECALL
+    assert index.info['recall'] == pytest.approx(recall, abs=1e-4)
+    assert recall < 1.0, "buckets no longer prune: the test does not exercise approximation"
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from conftest import K
+from features import make_vectorizer, stream_catalog
+from neighbors import build_neighbor_index, select_top_n, select_top_n_rows
+
+
+def stable_top(scores, n):
+    """Reference: the first n positions of a stable descending sort"""
+    return np.argsort(-scores, axis=-1, kind='stable')[..., :n]
+
+
+def tie_heavy_block(rng, n_rows, width):
+    """Rows of a few distinct scores, mostly-zero rows (ties at 0) and excluded (-inf) entries"""
+    block = rng.integers(0, 4, size=(n_rows, width)).astype(np.float64)
+    sparse = rng.random((n_rows, width)) < 0.9
+    block[: n_rows // 3][sparse[: n_rows // 3]] = 0.0
+    block[rng.random((n_rows, width)) < 0.05] = -np.inf
+    # For n = 2 the ties at the cut-off (two 5s) lie past the first 4n columns of the row
+    block[n_rows // 2: n_rows // 2 + 3] = 0.0
+    block[n_rows // 2: n_rows // 2 + 3, [-10, -5, -2]] = [9.0, 5.0, 5.0]
+    return block
+
+
+@pytest.mark.parametrize('n', [0, 1, 3, 7, 39, 40, 41, 100])
+def test_select_top_n_matches_stable_sort(n):
+    rng = np.random.default_rng(n)
+    for _ in range(20):
+        scores = rng.integers(0, 3, size=40).astype(np.float64)
+        assert select_top_n(scores, n).tolist() == stable_top(scores, n).tolist()
+
+        exclude = rng.choice(40, size=3, replace=False)
+        masked = scores.copy()
+        masked[exclude] = -np.inf
+        top = select_top_n(scores, n, exclude=exclude)
+        assert top.tolist() == stable_top(masked, min(n, 37)).tolist()
+        assert not set(top.tolist()) & set(exclude.tolist())
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 5, 10, 59, 60, 61, 200])
+def test_select_top_n_rows_matches_stable_sort(n):
+    rng = np.random.default_rng(100 + n)
+    block = tie_heavy_block(rng, 30, 60)
+    top = select_top_n_rows(block, n)
+    assert top.shape == (30, min(n, 60))
+    np.testing.assert_array_equal(top, stable_top(block, n))
+
+
+def test_select_top_n_rows_all_tied():
+    block = np.zeros((4, 25))
+    np.testing.assert_array_equal(select_top_n_rows(block, 6), np.tile(np.arange(6), (4, 1)))
+    assert select_top_n_rows(block, 0).shape == (4, 0)
+
+
+@pytest.fixture(scope='module')
+def vectors(dataset):
+    movies_path, credits_path, _ = dataset
+    df, _ = stream_catalog(movies_path, credits_path)
+    return make_vectorizer('count').fit_transform(df['combined_features'])
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_build_neighbor_index_matches_dense_cosine(vectors, workers):
+    index = build_neighbor_index(vectors, K, workers=workers)
+    assert index.indices.dtype == np.int32 and index.scores.dtype == np.float32
+    assert index.indices.shape == index.scores.shape == (vectors.shape[0], K)
+
+    dense = vectors.toarray().astype(np.float64)
+    norms = np.linalg.norm(dense, axis=1)
+    norms[norms == 0] = 1.0
+    cosine = (dense / norms[:, None]) @ (dense / norms[:, None]).T
+    np.fill_diagonal(cosine, -np.inf)
+    expected = stable_top(cosine, K)
+
+    # Each kept neighbor has its dense cosine score, and the lists hold the K best scores in order
+    np.testing.assert_allclose(index.scores, np.take_along_axis(cosine, index.indices, axis=1), atol=1e-6)
+    np.testing.assert_allclose(index.scores, np.take_along_axis(cosine, expected, axis=1), atol=1e-6)
+    # Apart from the order among float-equal scores, which the two products round differently,
+    # the lists hold the same rows; at the cut-off score any of the tied rows may be kept
+    rounded = cosine.astype(np.float32)
+
+    def by_score_then_row(rows):
+        scores = np.take_along_axis(rounded, rows, axis=1)
+        order = np.lexsort((rows, -scores), axis=1)
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    rows, _ = by_score_then_row(index.indices)
+    expected_rows, expected_scores = by_score_then_row(expected)
+    above = expected_scores > expected_scores[:, -1:]
+    np.testing.assert_array_equal(rows[above], expected_rows[above])
@@ -0,0 +1,36 @@
+import pytest
+
+from precompute import RecommendationStore, precompute
+
+STORED = 5
+
+
+@pytest.fixture
+def client(holder, tmp_path, monkeypatch):
+    """scripts/api_backend.py test client serving /api/recommend from a store of STORED per movie"""
+    import api_backend
+
+    path = str(tmp_path / 'recommendations.sqlite')
+    precompute(holder.current, path, n=STORED)
+    monkeypatch.setattr(api_backend, 'store', RecommendationStore(path, check_interval=0))
+    return api_backend.app.test_client()
+
+
+def test_precomputed_recommendations_up_to_stored_n(client, holder):
+    title = holder.current.columns['title'][0]
+    body = client.get('/api/recommend', query_string={'movie': title, 'n': STORED}).get_json()
+    assert body['matched_movie']['title'] == title
+    assert len(body['recommendations']) == STORED
+
+    response = client.get('/api/recommend', query_string={'movie': title, 'n': STORED + 1})
+    assert response.status_code == 400
+    assert str(STORED) in response.get_json()['error']
+
+
+def test_precomputed_weak_title_match_is_not_found(client):
+    from api_backend import store
+
+    # The closest stored title scores below 60
+    assert store.lookup(name='Zorro quintet')[1] < 60
+    response = client.get('/api/recommend', query_string={'movie': 'Zorro quintet'})
+    assert response.status_code == 404
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import filters
+import listing
+import title_index
+from conftest import K, make_movie
+from model import MovieModel
+from snapshot import find_snapshot, load_snapshot
+
+
+@pytest.fixture
+def snapshot_path(dataset, holder):
+    movies_path, credits_path, snapshot_dir = dataset
+    return find_snapshot(snapshot_dir, (movies_path, credits_path), K, holder.journal)
+
+
+def rebuilt(model):
+    """A model over the same records and neighbors with every index built from the columns"""
+    return MovieModel(model.records, model.neighbor_index, model.vocabulary, model.version, model.built_at)
+
+
+def assert_same_indexes(model, expected):
+    title, other = model.title_index, expected.title_index
+    assert title.titles == other.titles
+    assert title.postings.keys() == other.postings.keys()
+    assert all(np.array_equal(rows, other.postings[gram]) for gram, rows in title.postings.items())
+    assert np.array_equal(title.gram_counts, other.gram_counts)
+
+    lookup, other = model.movie_lookup, expected.movie_lookup
+    for name in ('title_rows', 'id_rows', 'keys', 'ids', 'ranks', 'shared_rows'):
+        assert getattr(lookup, name) == getattr(other, name), name
+
+    prefix, other = model.prefix_index, expected.prefix_index
+    assert prefix.keys == other.keys and prefix.hot == other.hot
+    for name in ('rows', 'offsets', 'popularity', 'vote_count'):
+        assert np.array_equal(getattr(prefix, name), getattr(other, name)), name
+
+    assert model.listing.active == expected.listing.active and model.listing.total == expected.listing.total
+    for field, order in model.listing.orders.items():
+        other = expected.listing.orders[field]
+        assert order.keys == other.keys and order.sorted_keys == other.sorted_keys, field
+        assert np.array_equal(order.rows, other.rows) and np.array_equal(order.missing, other.missing), field
+
+    attributes, other = model.attributes, expected.attributes
+    for name in ('genres', 'languages'):
+        bitmaps, others = getattr(attributes, name), getattr(other, name)
+        assert bitmaps.keys() == others.keys()
+        assert all(np.array_equal(bitmap, others[key]) for key, bitmap in bitmaps.items()), name
+    for name in ('years', 'year_order', 'sorted_years', 'ratings', 'rating_order', 'sorted_ratings'):
+        assert np.array_equal(getattr(attributes, name), getattr(other, name), equal_nan=True), name
+
+
+def test_load_reads_indexes_instead_of_building_them(snapshot_path, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("index rebuilt on snapshot load")
+
+    for module, name in ((title_index, 'TitleIndex'), (title_index, 'MovieLookup'), (title_index, 'PrefixIndex'),
+                         (listing, 'CatalogListing'), (filters, 'AttributeIndex')):
+        monkeypatch.setattr(getattr(module, name), '__init__', refuse)
+    model = load_snapshot(snapshot_path)
+    monkeypatch.undo()
+
+    assert_same_indexes(model, rebuilt(model))
+
+
+def test_loaded_indexes_follow_catalog_updates(snapshot_path):
+    model = load_snapshot(snapshot_path)
+    ids = [movie_id for movie_id in model.columns['id'] if movie_id is not None]
+    entries = [
+        {'op': 'add', 'id': 970000, 'movie': make_movie(970000, 'Snapshot Added', genres=['Western'])},
+        {'op': 'update', 'id': ids[0], 'movie': make_movie(ids[0], model.columns['title'][1], popularity=500.0)},
+        {'op': 'remove', 'id': ids[2]},
+    ]
+    expected = rebuilt(model).updated(entries)
+    model = model.updated(entries)
+
+    assert_same_indexes(model, expected)
+    assert model.resolve(name='Snapshot Added')[1] == 100
+    row = model.resolve(movie_id=970000)[0]
+    assert model.attributes.mask(genres=('western',))[row]
@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+from fuzzywuzzy import process
+
+from title_index import PrefixIndex, TitleIndex, normalize_title
+
+
+def typo(title, rng):
+    """title with two neighbouring letters swapped"""
+    i = rng.randrange(len(title) - 1)
+    return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+
+
+def test_typo_queries_find_the_full_scan_best_score(holder):
+    titles = holder.current.columns['title']
+    index = TitleIndex(titles, max_candidates=25)
+    everything = dict(enumerate(titles))
+    rng = random.Random(4)
+    for title in rng.sample(titles, 40):
+        query = typo(title, rng)
+        assert len(index.candidates(query)) <= 25
+        best = index.search(query, limit=1)
+        assert best[0][1] == process.extractOne(query, everything)[1], query
+
+
+def test_large_tied_level_is_cut_to_max_candidates():
+    titles = ['Dark City'] * 300 + ['Dark Citadel', 'Bright City']
+    index = TitleIndex(titles, max_candidates=10)
+
+    rows = index.candidates('Dark City')
+    assert rows.tolist() == list(range(10))
+    title, score, _ = index.search('Drak City', limit=1)[0]
+    assert (title, score) == process.extractOne('Drak City', titles)[:2]
+
+    # 'Dark Citadel' shares more of the query than 'Bright City', so it is kept first
+    index = TitleIndex(titles[295:], max_candidates=6)
+    assert index.candidates('Dark City').tolist() == [0, 1, 2, 3, 4, 5]
+    index = TitleIndex(titles[295:], max_candidates=7)
+    assert index.candidates('Dark City').tolist() == [0, 1, 2, 3, 4, 5, 6]
+
+
+def test_query_sharing_no_trigram_finds_nothing():
+    index = TitleIndex(['Dark City', 'Avatar'])
+    assert index.candidates('zzzz').shape[0] == 0
+    assert index.search('zzzz') == []
+    assert index.search('   ') == []
+
+
+def test_set_title_updates_candidates():
+    index = TitleIndex(['Dark City', 'Avatar'])
+    index.set_title(2, 'Dark Shadows')
+    index.set_title(0, None)
+    assert index.candidates('dark').tolist() == [2]
+    assert index.search('Avatr', limit=1)[0][2] == 1
+    assert np.array_equal(index.candidates('Dark Shadows'), [2])
+
+
+def test_prefix_suggestions_stay_exact_through_updates(holder):
+    columns = holder.current.columns
+    titles, popularity, votes = list(columns['title']), list(columns['popularity']), list(columns['vote_count'])
+    index = PrefixIndex(titles, popularity, votes, hot_entries=8)
+    assert index.hot
+
+    rng = random.Random(6)
+    for step in range(40):
+        row = rng.randrange(len(titles) + 1)
+        title = None if rng.random() < 0.3 else rng.choice(titles[:50] + [f"Added {step}"])
+        if row == len(titles):
+            titles.append(None)
+            popularity.append(0.0)
+            votes.append(0.0)
+            title = title or f"Added {step}"
+        titles[row], popularity[row], votes[row] = title, rng.random() * 100, rng.randrange(1000)
+        index.set_row(row, title, popularity[row], votes[row])
+
+    rebuilt = PrefixIndex(titles, popularity, votes, hot_entries=8)
+    prefixes = {normalize_title(title)[:end] for title in titles if title for end in (1, 2, 3, 5)}
+    for prefix in sorted(prefixes):
+        assert index.suggest(prefix, 20) == rebuilt.suggest(prefix, 20), prefix
+
+
+def test_suggest_does_not_modify_the_index(holder):
+    columns = holder.current.columns
+    index = PrefixIndex(columns['title'], columns['popularity'], columns['vote_count'], hot_entries=8)
+    expected = {prefix: index.suggest(prefix) for prefix in ('a', 'ka', 'lo', 'mi', 'zen')}
+    # Large ranges without precomputed suggestions are ranked per request, not cached
+    index.hot = {}
+    assert {prefix: index.suggest(prefix) for prefix in expected} == expected
+    assert index.hot == {}
@@ -0,0 +1,505 @@
+"""
+Title search and lookup for the movie recommender
+Character-trigram postings narrow the catalog to a few candidates,
+which are then scored with the same fuzzywuzzy scorer as before.
+Exact titles and TMDB ids resolve to rows through plain dict lookups.
+"""
+
+import copy
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
+from fuzzywuzzy import process, utils
+
+DEFAULT_CANDIDATES = 200
+
+# Most suggestions an autocomplete request can ask for
+MAX_SUGGESTIONS = 20
+
+# Prefixes matching more index entries than this get their suggestions precomputed
+HOT_PREFIX_ENTRIES = 256
+
+
+def pack_keys(keys, dtype=str):
+    """(values, missing) arrays for a list of keys and Nones, for saving in a snapshot"""
+    fill = np.dtype(dtype).type()
+    return (np.array([fill if key is None else key for key in keys], dtype=dtype),
+            np.array([key is None for key in keys], dtype=bool))
+
+
+def unpack_keys(values, missing):
+    """The list pack_keys was given"""
+    keys = np.asarray(values).tolist()
+    for row in np.flatnonzero(missing).tolist():
+        keys[row] = None
+    return keys
+
+
+def _slices(values, offsets):
+    """values[offsets[i]:offsets[i + 1]] for each i"""
+    values = np.asarray(values)
+    bounds = np.asarray(offsets).tolist()
+    return [values[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+
+def _concatenated(groups, dtype):
+    """(values, offsets) for a list of sequences, as _slices reads them back"""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(group) for group in groups])
+    values = np.concatenate([np.asarray(group, dtype=dtype) for group in groups]) if groups else np.empty(0, dtype)
+    return values, offsets
+
+
+def trigrams(text):
+    """Distinct character trigrams of an already normalised string"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Trigram inverted index over movie titles, built once at startup"""
+
+    def __init__(self, titles, max_candidates=DEFAULT_CANDIDATES):
+        self.titles = list(titles)
+        self.max_candidates = max_candidates
+
+        postings = defaultdict(list)
+        gram_counts = np.zeros(len(self.titles), dtype=np.int32)
+        for row, title in enumerate(self.titles):
+            grams = trigrams(utils.full_process(str(title)))
+            gram_counts[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.gram_counts = gram_counts
+
+    @classmethod
+    def from_arrays(cls, titles, arrays, max_candidates=DEFAULT_CANDIDATES):
+        """An index over titles from the arrays() of one built over them"""
+        index = cls.__new__(cls)
+        index.titles = list(titles)
+        index.max_candidates = max_candidates
+        index.postings = dict(zip(np.asarray(arrays['grams']).tolist(),
+                                  _slices(arrays['posting_rows'], arrays['posting_offsets'])))
+        index.gram_counts = np.asarray(arrays['gram_counts'])
+        return index
+
+    def arrays(self):
+        """The postings and trigram counts as arrays, for from_arrays"""
+        grams = sorted(self.postings)
+        rows, offsets = _concatenated([self.postings[gram] for gram in grams], np.int32)
+        return {'grams': np.array(grams, dtype=str), 'posting_rows': rows, 'posting_offsets': offsets,
+                'gram_counts': self.gram_counts}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def set_title(self, row, title):
+        """Index a new row (row == len) or retitle an existing one; None removes it"""
+        if row < len(self.titles):
+            self._unindex(row)
+        else:
+            self.titles.append(None)
+            self.gram_counts = np.append(self.gram_counts, np.int32(0))
+        self.titles[row] = title
+        if title is None:
+            return
+
+        grams = trigrams(utils.full_process(str(title)))
+        self.gram_counts = self.gram_counts.copy()
+        self.gram_counts[row] = len(grams)
+        for gram in grams:
+            rows = self.postings.get(gram)
+            if rows is None:
+                self.postings[gram] = np.array([row], dtype=np.int32)
+            else:
+                self.postings[gram] = np.insert(rows, np.searchsorted(rows, row), row)
+
+    def copy(self):
+        """An index set_title can change without affecting this one (arrays are replaced, not modified)"""
+        index = copy.copy(self)
+        index.titles = list(self.titles)
+        index.postings = dict(self.postings)
+        return index
+
+    def _unindex(self, row):
+        title = self.titles[row]
+        if title is None:
+            return
+        for gram in trigrams(utils.full_process(str(title))):
+            rows = self.postings[gram]
+            rows = rows[rows != row]
+            if rows.shape[0]:
+                self.postings[gram] = rows
+            else:
+                del self.postings[gram]
+        self.gram_counts = self.gram_counts.copy()
+        self.gram_counts[row] = 0
+
+    def candidates(self, query):
+        """At most max_candidates rows most like the query by trigram containment, in catalog order
+
+        Containment is the larger of the shares of the query's and of the
+        title's trigrams the two have in common, so a short title inside a
+        longer query ranks high, as the scorer rates it. Rows tied on it are
+        ranked by shared trigrams, then by row. Titles sharing no trigram
+        with the query are never candidates.
+        """
+        query_grams = trigrams(utils.full_process(query))
+        hits = [self.postings[gram] for gram in query_grams if gram in self.postings]
+        if not hits:
+            return np.empty(0, dtype=np.int32)
+
+        rows, shared = np.unique(np.concatenate(hits), return_counts=True)
+        if rows.shape[0] > self.max_candidates:
+            containment = np.maximum(shared / len(query_grams), shared / np.maximum(self.gram_counts[rows], 1))
+            best = np.lexsort((rows, -shared, -containment))[:self.max_candidates]
+            rows = np.sort(rows[best])
+        return rows
+
+    def search(self, query, limit=5):
+        """Return up to limit (title, score, row) matches, best first"""
+        if not utils.full_process(query):
+            return []
+        choices = {int(row): self.titles[row] for row in self.candidates(query)}
+        if not choices:
+            return []
+        return process.extract(query, choices, limit=limit)
+
+    def best_match(self, query):
+        """Closest (title, score, row) for a query, or None"""
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
+
+
+def normalize_title(title):
+    """Canonical form used for exact title lookups"""
+    return utils.full_process(str(title))
+
+
+class MovieLookup:
+    """Constant-time mapping from normalised title or TMDB id to row position
+
+    When several movies share a title the most popular one wins, then the
+    one with more votes, then the earliest row.
+    """
+
+    def __init__(self, titles, ids, popularity=None, vote_count=None):
+        titles = list(titles)
+        n_rows = len(titles)
+        if popularity is None:
+            popularity = np.zeros(n_rows)
+        if vote_count is None:
+            vote_count = np.zeros(n_rows)
+        popularity = np.nan_to_num(np.asarray(popularity, dtype=np.float64))
+        vote_count = np.nan_to_num(np.asarray(vote_count, dtype=np.float64))
+
+        self.title_rows = {}
+        for row in np.lexsort((np.arange(n_rows), -vote_count, -popularity)).tolist():
+            self.title_rows.setdefault(normalize_title(titles[row]), row)
+
+        self.id_rows = {}
+        for row, movie_id in enumerate(ids):
+            self.id_rows.setdefault(int(movie_id), row)
+
+        # Kept for incremental updates, which re-rank titles shared with other rows
+        self.keys = [normalize_title(title) for title in titles]
+        self.ids = [int(movie_id) for movie_id in ids]
+        self.ranks = list(zip(popularity.tolist(), vote_count.tolist()))
+        # Rows whose title another row resolves to, per title
+        self.shared_rows = {}
+        for row, key in enumerate(self.keys):
+            if self.title_rows[key] != row:
+                self.shared_rows[key] = self.shared_rows.get(key, ()) + (row,)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """A lookup from the arrays() of another"""
+        lookup = cls.__new__(cls)
+        lookup.keys = unpack_keys(arrays['keys'], arrays['key_missing'])
+        lookup.ids = unpack_keys(arrays['ids'], arrays['id_missing'])
+        lookup.ranks = list(zip(np.asarray(arrays['popularity']).tolist(), np.asarray(arrays['vote_count']).tolist()))
+        title_rows, id_rows = np.asarray(arrays['title_rows']), np.asarray(arrays['id_rows'])
+        lookup.title_rows = dict(zip(np.asarray(arrays['keys'])[title_rows].tolist(), title_rows.tolist()))
+        lookup.id_rows = dict(zip(np.asarray(arrays['ids'])[id_rows].tolist(), id_rows.tolist()))
+        lookup.shared_rows = {}
+        for row in np.asarray(arrays['shared_rows']).tolist():
+            key = lookup.keys[row]
+            lookup.shared_rows[key] = lookup.shared_rows.get(key, ()) + (row,)
+        return lookup
+
+    def arrays(self):
+        """The keys, ids, rankings and resolved rows as arrays, for from_arrays"""
+        keys, key_missing = pack_keys(self.keys)
+        ids, id_missing = pack_keys(self.ids, np.int64)
+        popularity, vote_count = zip(*self.ranks) if self.ranks else ((), ())
+        return {
+            'keys': keys,
+            'key_missing': key_missing,
+            'ids': ids,
+            'id_missing': id_missing,
+            'popularity': np.array(popularity, dtype=np.float64),
+            'vote_count': np.array(vote_count, dtype=np.float64),
+            'title_rows': np.array(list(self.title_rows.values()), dtype=np.int64),
+            'id_rows': np.array(list(self.id_rows.values()), dtype=np.int64),
+            # Runners-up in rank order, so each title's tuple is rebuilt as it was
+            'shared_rows': np.array([row for rows in self.shared_rows.values() for row in rows], dtype=np.int64),
+        }
+
+    def copy(self):
+        """A lookup set_row and remove can change without affecting this one"""
+        lookup = copy.copy(self)
+        lookup.title_rows = dict(self.title_rows)
+        lookup.id_rows = dict(self.id_rows)
+        lookup.keys = list(self.keys)
+        lookup.ids = list(self.ids)
+        lookup.ranks = list(self.ranks)
+        lookup.shared_rows = dict(self.shared_rows)
+        return lookup
+
+    def _rank(self, row):
+        popularity, votes = self.ranks[row]
+        return (-popularity, -votes, row)
+
+    def _rerank(self, key, rows):
+        """Make the best of rows the one key resolves to; the others are kept as runners-up"""
+        rows = sorted(rows, key=self._rank)
+        if rows:
+            self.title_rows[key] = rows[0]
+        else:
+            self.title_rows.pop(key, None)
+        if len(rows) > 1:
+            self.shared_rows[key] = tuple(rows[1:])
+        else:
+            self.shared_rows.pop(key, None)
+
+    def _rows(self, key):
+        """Every row with a normalised title"""
+        best = self.title_rows.get(key)
+        return (best, *self.shared_rows.get(key, ())) if best is not None else ()
+
+    def set_row(self, row, title, movie_id, popularity=None, vote_count=None):
+        """Add a row (row == len) or replace an existing row's title, id and ranking"""
+        if row < len(self.keys):
+            self.remove(row)
+        else:
+            self.keys.append(None)
+            self.ids.append(None)
+            self.ranks.append((0.0, 0.0))
+
+        key = normalize_title(title)
+        self.keys[row] = key
+        self.ids[row] = int(movie_id)
+        self.ranks[row] = (float(np.nan_to_num(popularity or 0.0)), float(np.nan_to_num(vote_count or 0.0)))
+        self._rerank(key, self._rows(key) + (row,))
+        self.id_rows.setdefault(int(movie_id), row)
+
+    def remove(self, row):
+        """Forget a row; a title it shared falls back to the next best row"""
+        movie_id = self.ids[row]
+        if movie_id is not None and self.id_rows.get(movie_id) == row:
+            del self.id_rows[movie_id]
+        key = self.keys[row]
+        self.keys[row] = self.ids[row] = None
+        if key is not None:
+            self._rerank(key, [other for other in self._rows(key) if other != row])
+
+    def by_title(self, title):
+        key = normalize_title(title)
+        return self.title_rows.get(key) if key else None
+
+    def by_id(self, movie_id):
+        try:
+            return self.id_rows.get(int(movie_id))
+        except (TypeError, ValueError):
+            return None
+
+
+class PrefixIndex:
+    """Typeahead over normalised titles, ranked by popularity then vote count
+
+    A flattened prefix trie: every title is entered at each of its word
+    starts ("dark knight" also as "knight"), and the entries are kept in
+    sorted order, so every trie node is a contiguous range found with two
+    bisections. Ranges too large to rank per request (short prefixes) have
+    their top suggestions precomputed, and kept exact by catalog updates;
+    the rest are ranked on the fly. suggest() never modifies the index.
+    """
+
+    def __init__(self, titles, popularity=None, vote_count=None, hot_entries=HOT_PREFIX_ENTRIES):
+        self.keys = [normalize_title(title) if title is not None else None for title in titles]
+        n_rows = len(self.keys)
+        self.popularity = np.nan_to_num(np.asarray(popularity if popularity is not None else np.zeros(n_rows),
+                                                   dtype=np.float64))
+        self.vote_count = np.nan_to_num(np.asarray(vote_count if vote_count is not None else np.zeros(n_rows),
+                                                   dtype=np.float64))
+        self.hot_entries = hot_entries
+
+        entries = [(row, offset) for row, key in enumerate(self.keys) if key for offset in self._word_starts(key)]
+        entries.sort(key=lambda entry: self.keys[entry[0]][entry[1]:])
+        self.rows = np.array([row for row, _ in entries], dtype=np.int32)
+        self.offsets = np.array([offset for _, offset in entries], dtype=np.int32)
+        self._precompute()
+
+    @classmethod
+    def from_arrays(cls, arrays, hot_entries=HOT_PREFIX_ENTRIES):
+        """An index from the arrays() of another, precomputed suggestions included"""
+        index = cls.__new__(cls)
+        index.keys = unpack_keys(arrays['keys'], arrays['key_missing'])
+        index.popularity = np.asarray(arrays['popularity'])
+        index.vote_count = np.asarray(arrays['vote_count'])
+        index.hot_entries = hot_entries
+        index.rows = np.asarray(arrays['rows'])
+        index.offsets = np.asarray(arrays['offsets'])
+        hot_rows = np.asarray(arrays['hot_rows']).tolist()
+        bounds = np.asarray(arrays['hot_offsets']).tolist()
+        index.hot = {prefix: hot_rows[start:stop]
+                     for prefix, start, stop in zip(np.asarray(arrays['hot_prefixes']).tolist(), bounds, bounds[1:])}
+        return index
+
+    def arrays(self):
+        """The sorted entries and precomputed suggestions as arrays, for from_arrays"""
+        keys, key_missing = pack_keys(self.keys)
+        prefixes = sorted(self.hot)
+        hot_rows, hot_offsets = _concatenated([self.hot[prefix] for prefix in prefixes], np.int32)
+        return {'keys': keys, 'key_missing': key_missing, 'popularity': self.popularity,
+                'vote_count': self.vote_count, 'rows': self.rows, 'offsets': self.offsets,
+                'hot_prefixes': np.array(prefixes, dtype=str), 'hot_rows': hot_rows, 'hot_offsets': hot_offsets}
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    def __getitem__(self, position):
+        """Entry text at a sorted position, so bisect can search the index directly"""
+        return self.keys[self.rows[position]][self.offsets[position]:]
+
+    def copy(self):
+        """An index set_row can change without affecting this one (entry arrays are replaced, not modified)"""
+        index = copy.copy(self)
+        index.keys = list(self.keys)
+        index.popularity = self.popularity.copy()
+        index.vote_count = self.vote_count.copy()
+        index.hot = dict(self.hot)
+        return index
+
+    @staticmethod
+    def _word_starts(key):
+        return [0] + [i + 1 for i, char in enumerate(key[:-1]) if char == ' ' and key[i + 1] != ' ']
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self) if hi is None else hi
+        lo = bisect_left(self, prefix, lo, hi)
+        return lo, bisect_left(self, prefix + '\U0010ffff', lo, hi)
+
+    def _rank(self, rows, limit):
+        """Distinct rows, most popular first (ties: more votes, then earlier row)"""
+        order = np.lexsort((rows, -self.vote_count[rows], -self.popularity[rows]))
+        ranked = rows[order]
+        _, first = np.unique(ranked, return_index=True)
+        return ranked[np.sort(first)][:limit].tolist()
+
+    def _precompute(self):
+        """Top suggestions of every prefix whose range exceeds hot_entries, walking the trie top down"""
+        self.hot = {}
+        stack = [('', 0, len(self))]
+        while stack:
+            prefix, lo, hi = stack.pop()
+            if hi - lo <= self.hot_entries:
+                continue
+            if prefix:
+                self.hot[prefix] = self._rank(self.rows[lo:hi], MAX_SUGGESTIONS)
+            # Children are the runs of entries sharing the next character
+            depth = len(prefix)
+            position = bisect_right(self, prefix, lo, hi)
+            while position < hi:
+                child = self[position][:depth + 1]
+                end = bisect_left(self, child + '\U0010ffff', position, hi)
+                stack.append((child, position, end))
+                position = end
+
+    def suggest(self, prefix, limit=10):
+        """Up to limit rows whose title (or a word in it) starts with prefix"""
+        key = normalize_title(prefix)
+        if not key:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        hot = self.hot.get(key)
+        if hot is not None:
+            return hot[:limit]
+        lo, hi = self._range(key)
+        return self._rank(self.rows[lo:hi], limit) if hi > lo else []
+
+    def set_row(self, row, title, popularity=None, vote_count=None):
+        """Index a new row (row == len) or replace an existing row's title and ranking; None removes it"""
+        if row < len(self.keys):
+            self.remove(row)
+        else:
+            self.keys.append(None)
+            self.popularity = np.append(self.popularity, 0.0)
+            self.vote_count = np.append(self.vote_count, 0.0)
+        if title is None:
+            return
+
+        key = normalize_title(title)
+        self.keys[row] = key
+        self.popularity[row] = float(np.nan_to_num(popularity or 0.0))
+        self.vote_count[row] = float(np.nan_to_num(vote_count or 0.0))
+        if not key:
+            return
+        for offset in self._word_starts(key):
+            position = bisect_left(self, key[offset:])
+            self.rows = np.insert(self.rows, position, row)
+            self.offsets = np.insert(self.offsets, position, offset)
+        # The row is in no precomputed list now (remove() took it out), so merging it in is exact
+        for prefix in self._hot_prefixes(key):
+            self.hot[prefix] = self._rank(np.array(self.hot[prefix] + [row], dtype=np.int32), MAX_SUGGESTIONS)
+
+    def remove(self, row):
+        key = self.keys[row]
+        if key is None:
+            return
+        if key:
+            positions = []
+            for offset in self._word_starts(key):
+                text = key[offset:]
+                lo = bisect_left(self, text)
+                hi = bisect_right(self, text, lo)
+                match = (self.rows[lo:hi] == row) & (self.offsets[lo:hi] == offset)
+                positions.append(lo + int(np.flatnonzero(match)[0]))
+            self.rows = np.delete(self.rows, positions)
+            self.offsets = np.delete(self.offsets, positions)
+        self.keys[row] = None
+        # Lists the row was in are ranked again from their range to find the next best row
+        for prefix in self._hot_prefixes(key):
+            if row in self.hot[prefix]:
+                lo, hi = self._range(prefix)
+                self.hot[prefix] = self._rank(self.rows[lo:hi], MAX_SUGGESTIONS)
+
+    def _hot_prefixes(self, key):
+        """Precomputed prefixes a title's entries fall under (prefixes of each word start)"""
+        prefixes = {key[offset:end] for offset in self._word_starts(key) for end in range(offset + 1, len(key) + 1)}
+        return [prefix for prefix in prefixes if prefix in self.hot]
+
+
+
+def resolve_movie(lookup, title_index, name=None, movie_id=None):
+    """Find the row for an id or a (possibly misspelt) title
+
+    Returns (row, match score) or None. Ids and exact titles skip fuzzy matching.
+    """
+    if movie_id is not None:
+        row = lookup.by_id(movie_id)
+        return (row, 100) if row is not None else None
+    if not name:
+        return None
+
+    row = lookup.by_title(name)
+    if row is not None:
+        return row, 100
+
+    match = title_index.best_match(name)
+    if match is None:
+        return None
+    return lookup.by_title(match[0]), match[1]
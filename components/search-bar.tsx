@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, type FormEvent } from "react"
+import { useEffect, useState, type FormEvent } from "react"
 import { Search } from "lucide-react"
 import { Input } from "@/components/ui/input"
 import { Button } from "@/components/ui/button"
@@ -10,8 +10,30 @@ interface SearchBarProps {
   isLoading?: boolean
 }
 
+interface Suggestion {
+  id: number
+  title: string
+  year: string | null
+}
+
 export function SearchBar({ onSearch, isLoading }: SearchBarProps) {
   const [query, setQuery] = useState("")
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([])
+
+  // Typeahead from the prefix index; stale responses are dropped when the query changes
+  useEffect(() => {
+    const prefix = query.trim()
+    if (!prefix) {
+      setSuggestions([])
+      return
+    }
+    const controller = new AbortController()
+    fetch(`/api/autocomplete?prefix=${encodeURIComponent(prefix)}`, { signal: controller.signal })
+      .then((response) => (response.ok ? response.json() : { suggestions: [] }))
+      .then((data) => setSuggestions(data.suggestions || []))
+      .catch(() => {})
+    return () => controller.abort()
+  }, [query])
 
   const handleSubmit = (e: FormEvent) => {
     e.preventDefault()
@@ -31,7 +53,16 @@ export function SearchBar({ onSearch, isLoading }: SearchBarProps) {
           onChange={(e) => setQuery(e.target.value)}
           className="h-12 pl-10 text-base"
           disabled={isLoading}
+          list="movie-suggestions"
+          autoComplete="off"
         />
+        <datalist id="movie-suggestions">
+          {suggestions.map((suggestion) => (
+            <option key={suggestion.id} value={suggestion.title}>
+              {suggestion.year ?? ""}
+            </option>
+          ))}
+        </datalist>
       </div>
       <Button type="submit" size="lg" disabled={isLoading || !query.trim()} className="h-12 px-8">
         {isLoading ? "Searching..." : "Search"}
@@ -0,0 +1,52 @@
+export const FLASK_API_URL = process.env.FLASK_API_URL || "http://localhost:5000"
+
+interface CachedResponse {
+  etag: string
+  cacheControl: string | null
+  data: any
+}
+
+// Last response per Flask URL; it is revalidated with If-None-Match, so an
+// unchanged result comes back as an empty 304 without any ranking work
+const MAX_CACHED_RESPONSES = 500
+const responses = new Map<string, CachedResponse>()
+
+export interface FlaskResponse {
+  ok: boolean
+  status: number
+  data: any
+  cacheControl: string | null
+}
+
+export async function fetchFlask(path: string): Promise<FlaskResponse> {
+  const url = `${FLASK_API_URL}${path}`
+  const cached = responses.get(url)
+  const response = await fetch(url, {
+    cache: "no-store",
+    headers: cached ? { "If-None-Match": cached.etag } : undefined,
+  })
+
+  if (response.status === 304 && cached) {
+    // Most recently used last, so eviction drops the oldest entry
+    responses.delete(url)
+    responses.set(url, cached)
+    return { ok: true, status: 200, data: cached.data, cacheControl: cached.cacheControl }
+  }
+
+  const data = await response.json()
+  const etag = response.headers.get("ETag")
+  const cacheControl = response.headers.get("Cache-Control")
+  if (response.ok && etag) {
+    responses.delete(url)
+    responses.set(url, { etag, cacheControl, data })
+    if (responses.size > MAX_CACHED_RESPONSES) {
+      responses.delete(responses.keys().next().value as string)
+    }
+  }
+  return { ok: response.ok, status: response.status, data, cacheControl }
+}
+
+// Headers passing Flask's caching policy on to the browser
+export function cacheHeaders(response: FlaskResponse): HeadersInit | undefined {
+  return response.cacheControl ? { "Cache-Control": response.cacheControl } : undefined
+}
@@ -3,171 +3,400 @@ Flask API Backend for Movie Recommendation System
 Exposes the Python recommendation function as REST API endpoints
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import pandas as pd
-import json
-from fuzzywuzzy import process
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import sys
+
+# Shared recommender modules live in backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from catalog import check_token
+from features import movie_from_payload
+from filters import parse_filters
+import http_cache
+from listing import parse_listing
+import metrics
+from metrics import request_phase
+from model import MAX_BATCH_SIZE, MAX_RECOMMENDATIONS
+from model_holder import READY, STARTUP_RETRY_AFTER, ModelHolder
+from precompute import PRECOMPUTE_N, PRECOMPUTED_STORE, SERVING_MODE, RecommendationStore
+from result_cache import ResultCache, request_key
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
+metrics.instrument(app)  # Request timings, registered before the readiness check
 
-# Global variables for data
-df = None
-similarity = None
+# Live recommender model and response cache; handlers read model_holder.current
+# once per request so a hot reload never swaps the model mid-request
+model_holder = ModelHolder()
+result_cache = ResultCache()
 
-def parse_json_column(col, key=None, top_n=None):
-    """Parse JSON columns from TMDB dataset"""
-    parsed = []
-    for item in col:
-        try:
-            data = json.loads(item.replace("'", '"'))
-            if isinstance(data, list):
-                if key:
-                    data = [d.get(key, '') for d in data]
-                if top_n:
-                    data = data[:top_n]
-                parsed.append(" ".join(data))
-            else:
-                parsed.append(str(data))
-        except:
-            parsed.append("")
-    return parsed
+# In precomputed mode /api/recommend is answered from the offline store
+# (see backend/precompute.py) and the model is never loaded
+store = None
+
+# Fields served for each movie, read from the model's prebuilt records
+MOVIE_FIELDS = ('id', 'title', 'genres', 'rating', 'overview', 'release_date',
+                'homepage', 'cast', 'director', 'poster_url')
+
+# Fields served for each typeahead suggestion
+SUGGESTION_FIELDS = ('id', 'title', 'year', 'poster_url')
+
+def movie_payload(record):
+    """Response fields for one movie"""
+    return {field: record[field] for field in MOVIE_FIELDS}
 
 def initialize_data():
-    """Load and process movie datasets"""
-    global df, similarity
-    
-    print("Loading datasets...")
-    movies = pd.read_csv("tmdb_5000_movies.csv")
-    credits = pd.read_csv("tmdb_5000_credits.csv")
-    
-    # Merge datasets
-    df = movies.merge(credits, left_on='id', right_on='movie_id')
-    
-    # Parse JSON columns
-    df['genres'] = parse_json_column(df['genres'], key='name')
-    df['keywords'] = parse_json_column(df['keywords'], key='name')
-    df['production_companies'] = parse_json_column(df['production_companies'], key='name')
-    df['cast'] = parse_json_column(df['cast'], key='name', top_n=3)
-    df['director'] = parse_json_column(df['crew'], key='name')
-    
-    # Get poster paths
-    df['poster_path'] = df.apply(
-        lambda row: f"https://image.tmdb.org/t/p/w500{json.loads(row['genres'].replace(\"'\", '\"'))[0].get('poster_path', '')}" 
-        if row['genres'] else "/placeholder.svg?height=450&width=300",
-        axis=1
-    )
-    
-    # Combine features for similarity
-    df['combined_features'] = (
-        df['genres'] + " " + 
-        df['keywords'] + " " + 
-        df['production_companies'] + " " + 
-        df['cast'] + " " + 
-        df['director']
-    )
-    
-    # Compute similarity matrix
-    print("Computing similarity matrix...")
-    cv = CountVectorizer(stop_words='english')
-    vectors = cv.fit_transform(df['combined_features'])
-    similarity = cosine_similarity(vectors)
-    
-    print("Initialization complete!")
+    """Open the precomputed store, or start loading the model snapshot (building it if needed) in the background"""
+    global store
+    if SERVING_MODE == 'precomputed':
+        store = RecommendationStore(PRECOMPUTED_STORE)
+    else:
+        model_holder.start()
+
+# Endpoints that answer before the model is ready
+READY_EXEMPT = {'health_check', 'get_status', 'get_metrics', 'reload_model'}
+
+# Endpoints served in precomputed mode
+PRECOMPUTED_ENDPOINTS = {'health_check', 'get_status', 'get_metrics', 'get_recommendations'}
+
+@app.before_request
+def require_model():
+    """Fast 503 for data endpoints until the model is loaded; keep a loaded model current"""
+    if store is not None:
+        if request.method == 'OPTIONS' or request.endpoint is None or request.endpoint in PRECOMPUTED_ENDPOINTS:
+            store.check()
+            return None
+        return jsonify({"error": "Not available in precomputed mode"}), 501
+    
+    model = model_holder.current
+    if model is None:
+        if request.method == 'OPTIONS' or request.endpoint in READY_EXEMPT:
+            return None
+        response = jsonify(model_holder.not_ready())
+        response.headers['Retry-After'] = str(STARTUP_RETRY_AFTER)
+        return response, 503
+    
+    # Pick up catalog updates made through other worker processes, and new data
+    model_holder.check()
+
+def served_version():
+    """Tag of the data being served: the model's, or the precomputed store's"""
+    return store.tag if store is not None else model_holder.current.tag
+
+# Endpoints whose responses depend only on the request and the served version.
+# Registered after require_model, so conditional GETs are answered once the data
+# is current and before any matching or ranking
+CACHEABLE_ENDPOINTS = {'search_movies', 'autocomplete', 'get_recommendations', 'get_all_movies'}
+http_cache.enable(app, served_version, CACHEABLE_ENDPOINTS)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Movie Recommender API is running"})
+    return jsonify({
+        "status": "healthy",
+        "message": "Movie Recommender API is running",
+        "mode": SERVING_MODE,
+        "model": model_holder.status() if store is None else None,
+        "precomputed": store.info() if store is not None else None,
+        "cache": result_cache.stats()
+    })
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """Readiness: loading, ready or failed, with per-stage load progress"""
+    model = model_holder.current
+    if store is not None:
+        return jsonify({
+            "status": READY,
+            "mode": SERVING_MODE,
+            "movie_count": store.meta.get('movie_count', 0),
+            "precomputed": store.info()
+        })
+    return jsonify({
+        "status": model_holder.state,
+        "mode": SERVING_MODE,
+        "movie_count": len(model) if model is not None else 0,
+        "model": model_holder.status()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Build stage timings, request latency histograms and cache counters in Prometheus text format"""
+    return Response(metrics.render(model_holder, result_cache), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/search', methods=['GET'])
 def search_movies():
     """Search for movies by name (fuzzy matching)"""
+    model = model_holder.current
     query = request.args.get('q', '')
     limit = int(request.args.get('limit', 10))
     
     if not query:
         return jsonify({"error": "Query parameter 'q' is required"}), 400
     
-    all_titles = df['original_title'].tolist()
-    matches = process.extract(query, all_titles, limit=limit)
+    key = request_key('search', query, None, limit)
+    payload = result_cache.get(key, model.tag)
+    if payload is None:
+        with request_phase('match'):
+            matches = model.title_index.search(query, limit=limit)
+        with request_phase('serialize'):
+            results = [{"title": m[0], "score": m[1], "id": model.records[m[2]]['id']} for m in matches]
+            payload = {"results": results}
+            result_cache.put(key, payload, model.tag)
+    with request_phase('serialize'):
+        return jsonify(payload)
+
+@app.route('/api/autocomplete', methods=['GET'])
+def autocomplete():
+    """Typeahead suggestions for a title prefix, most popular first
+    
+    Falls back to fuzzy search (and sets "fuzzy") only when no title starts with the prefix.
+    """
+    model = model_holder.current
+    prefix = request.args.get('prefix', '')
+    try:
+        limit = max(1, int(request.args.get('limit', 8)))
+    except ValueError:
+        return jsonify({"error": "Query parameter 'limit' must be an integer"}), 400
+    
+    if not prefix.strip():
+        return jsonify({"error": "Query parameter 'prefix' is required"}), 400
+    
+    with request_phase('match'):
+        rows, fuzzy = model.autocomplete(prefix, limit)
+    with request_phase('serialize'):
+        suggestions = [{field: model.records[row][field] for field in SUGGESTION_FIELDS} for row in rows]
+        return jsonify({'prefix': prefix, 'suggestions': suggestions, 'fuzzy': fuzzy})
+
+def precomputed_recommendations(movie_name, movie_id, n_recommendations, filters):
+    """Answer /api/recommend from the precomputed store with one keyed read
+    
+    n can be at most the number of recommendations the store was built with
+    (the model is not loaded to rank more); titles matching below 60 are not found.
+    """
+    if filters:
+        return jsonify({"error": "Filters are not available in precomputed mode"}), 400
+    stored = store.meta.get('n', PRECOMPUTE_N)
+    if n_recommendations > stored:
+        return jsonify({"error": f"Query parameter 'n' must be at most {stored} in precomputed mode"}), 400
+    with request_phase('match'):
+        found = store.lookup(name=movie_name, movie_id=movie_id or None)
+    if not found or found[1] < 60:
+        return jsonify({"error": "Movie not found"}), 404
     
-    results = [{"title": match[0], "score": match[1]} for match in matches]
-    return jsonify({"results": results})
+    entry = found[0]
+    with request_phase('serialize'):
+        payload = {
+            'matched_movie': movie_payload(entry['movie']),
+            'recommendations': [
+                dict(movie_payload(record), similarity_score=score)
+                for record, score in entry['recommendations'][:n_recommendations]
+            ]
+        }
+        return jsonify(payload)
 
 @app.route('/api/recommend', methods=['GET'])
 def get_recommendations():
-    """Get movie recommendations based on a movie name"""
+    """Get movie recommendations based on a movie name or TMDB id
+    
+    Optional filters: genre (comma-separated, all required), year_from,
+    year_to, min_rating and language.
+    """
+    model = model_holder.current
     movie_name = request.args.get('movie', '')
-    n_recommendations = int(request.args.get('n', 3))
+    movie_id = request.args.get('id')
+    
+    if not movie_name and not movie_id:
+        return jsonify({"error": "Query parameter 'movie' or 'id' is required"}), 400
+    try:
+        n_recommendations = int(request.args.get('n', 3))
+    except ValueError:
+        return jsonify({"error": "Query parameter 'n' must be an integer"}), 400
+    if not 0 <= n_recommendations <= MAX_RECOMMENDATIONS:
+        return jsonify({"error": f"Query parameter 'n' must be between 0 and {MAX_RECOMMENDATIONS}"}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "year, year_from, year_to and min_rating must be numbers"}), 400
     
-    if not movie_name:
-        return jsonify({"error": "Query parameter 'movie' is required"}), 400
+    if store is not None:
+        return precomputed_recommendations(movie_name, movie_id, n_recommendations, filters)
+    
+    key = request_key('recommend', movie_name, movie_id, n_recommendations, tuple(sorted(filters.items())))
+    payload = result_cache.get(key, model.tag)
+    if payload is not None:
+        return jsonify(payload)
     
     try:
-        # Find closest match
-        all_titles = df['original_title'].tolist()
-        closest_match = process.extractOne(movie_name, all_titles)[0]
-        
-        # Get movie index
-        movie_idx = df[df['original_title'] == closest_match].index[0]
-        
-        # Get matched movie details
-        matched_movie = df.iloc[movie_idx]
-        
-        # Calculate similarity scores
-        sim_scores = list(enumerate(similarity[movie_idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+        # Exact id/title lookup, falling back to the closest fuzzy match
+        with request_phase('match'):
+            match = model.resolve(name=movie_name, movie_id=movie_id or None)
+        if match is None:
+            return jsonify({"error": "Movie not found"}), 404
+        movie_idx = match[0]
         
         # Get recommendations
-        recommendations = []
-        for i, score in sim_scores[1:n_recommendations+1]:
-            movie = df.iloc[i]
-            recommendations.append({
-                'title': movie['original_title'],
-                'genres': movie['genres'],
-                'rating': float(movie['vote_average']),
-                'overview': movie['overview'],
-                'release_date': movie['release_date'],
-                'homepage': movie['homepage'] if pd.notna(movie['homepage']) else None,
-                'cast': movie['cast'],
-                'director': movie['director'],
-                'poster_url': f"https://image.tmdb.org/t/p/w500{movie['poster_path']}" if pd.notna(movie['poster_path']) else None,
-                'similarity_score': float(score)
-            })
-        
-        return jsonify({
-            'matched_movie': {
-                'title': matched_movie['original_title'],
-                'genres': matched_movie['genres'],
-                'rating': float(matched_movie['vote_average']),
-                'overview': matched_movie['overview'],
-                'release_date': matched_movie['release_date'],
-                'homepage': matched_movie['homepage'] if pd.notna(matched_movie['homepage']) else None,
-                'cast': matched_movie['cast'],
-                'director': matched_movie['director'],
-                'poster_url': f"https://image.tmdb.org/t/p/w500{matched_movie['poster_path']}" if pd.notna(matched_movie['poster_path']) else None
-            },
-            'recommendations': recommendations
-        })
+        with request_phase('rank'):
+            ranked = model.recommend(movie_idx, n_recommendations, filters)
+        with request_phase('serialize'):
+            recommendations = []
+            for i, score in ranked:
+                recommendations.append(dict(movie_payload(model.records[i]), similarity_score=float(score)))
+            
+            payload = {
+                'matched_movie': movie_payload(model.records[movie_idx]),
+                'recommendations': recommendations
+            }
+            result_cache.put(key, payload, model.tag)
+            return jsonify(payload)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """Get recommendations for a list of movie names and/or TMDB ids"""
+    model = model_holder.current
+    body = request.get_json(silent=True) or {}
+    seeds = body.get('movies')
+    
+    if not isinstance(seeds, list) or not seeds:
+        return jsonify({"error": "Body field 'movies' must be a non-empty list"}), 400
+    if len(seeds) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} movies per batch"}), 400
+    try:
+        n_recommendations = int(body.get('n', 3))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Body field 'n' must be an integer"}), 400
+    if not 0 <= n_recommendations <= MAX_RECOMMENDATIONS:
+        return jsonify({"error": f"Body field 'n' must be between 0 and {MAX_RECOMMENDATIONS}"}), 400
+    
+    # Resolve every seed, then rank all matched movies together
+    with request_phase('match'):
+        matches = model.resolve_many(seeds)
+    with request_phase('rank'):
+        ranked = iter(model.recommend_batch([match[0] for match in matches if match is not None], n_recommendations))
+    
+    with request_phase('serialize'):
+        results = []
+        for seed, match in zip(seeds, matches):
+            if match is None:
+                results.append({'query': seed, 'error': 'Movie not found'})
+                continue
+            results.append({
+                'query': seed,
+                'matched_movie': movie_payload(model.records[match[0]]),
+                'recommendations': [
+                    dict(movie_payload(model.records[i]), similarity_score=float(score))
+                    for i, score in next(ranked)
+                ]
+            })
+        
+        return jsonify({'results': results})
+
 @app.route('/api/movies', methods=['GET'])
 def get_all_movies():
-    """Get list of all available movies"""
-    limit = int(request.args.get('limit', 100))
-    offset = int(request.args.get('offset', 0))
+    """List movies one page at a time, in catalog order or sorted by popularity, rating, release_date or title
     
-    movies = df[['original_title', 'vote_average', 'release_date']].iloc[offset:offset+limit]
-    return jsonify({
-        'movies': movies.to_dict('records'),
-        'total': len(df)
-    })
+    sort defaults to catalog (CSV) order. Pass the previous page's next_cursor
+    as cursor to continue; order is asc or desc. Optional filters: genre, year, year_from, year_to, min_rating and
+    language. Served from the model's in-memory columns, no catalog reads.
+    """
+    model = model_holder.current
+    try:
+        page = parse_listing(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "year, year_from, year_to and min_rating must be numbers"}), 400
+    
+    try:
+        with request_phase('rank'):
+            rows, next_cursor, total = model.list_movies(filters=filters, **page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    with request_phase('serialize'):
+        columns = model.columns
+        movies = [
+            {
+                'id': columns['id'][row],
+                'original_title': columns['title'][row],
+                'vote_average': columns['rating'][row],
+                'popularity': columns['popularity'][row],
+                'release_date': columns['release_date'][row]
+            }
+            for row in rows
+        ]
+        return jsonify({
+            'movies': movies,
+            'total': total,
+            'next_cursor': next_cursor,
+            'sort': page['sort'],
+            'order': 'desc' if page['descending'] else 'asc'
+        })
+
+def catalog_write(op, movie_id, body=None):
+    """Validate, journal and apply one catalog update"""
+    if not check_token(request.headers):
+        return jsonify({"error": "Invalid catalog token"}), 403
+    
+    movie = None
+    if op != 'remove':
+        if isinstance(body, dict) and movie_id is not None:
+            body = dict(body, id=movie_id)
+        try:
+            movie = movie_from_payload(body)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        movie_id = movie['id']
+    
+    with model_holder.update_lock:
+        model = model_holder.sync_journal()
+        exists = model.movie_lookup.by_id(movie_id) is not None
+        if op == 'add' and exists:
+            return jsonify({"error": f"Movie {movie_id} already exists"}), 409
+        if op != 'add' and not exists:
+            return jsonify({"error": "Movie not found"}), 404
+        try:
+            model = model_holder.commit_update(op, movie_id, movie)
+        except (KeyError, ValueError) as e:
+            return jsonify({"error": str(e)}), 409
+    
+    if op == 'remove':
+        return jsonify({'removed': movie_id, 'revision': model.revision})
+    payload = {
+        'movie': movie_payload(model.records[model.movie_lookup.by_id(movie_id)]),
+        'revision': model.revision
+    }
+    return jsonify(payload), 201 if op == 'add' else 200
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_model():
+    """Rebuild the model in the background and swap it in when ready"""
+    if not check_token(request.headers):
+        return jsonify({"error": "Invalid catalog token"}), 403
+    if not model_holder.reload():
+        return jsonify({"error": "A reload is already running"}), 409
+    return jsonify({"reloading": True}), 202
+
+@app.route('/api/catalog/movies', methods=['POST'])
+def add_movie():
+    """Add a movie to the running catalog"""
+    return catalog_write('add', None, request.get_json(silent=True))
+
+@app.route('/api/catalog/movies/<int:movie_id>', methods=['PUT'])
+def update_movie(movie_id):
+    """Replace a movie's details"""
+    return catalog_write('update', movie_id, request.get_json(silent=True))
+
+@app.route('/api/catalog/movies/<int:movie_id>', methods=['DELETE'])
+def remove_movie(movie_id):
+    """Remove a movie from the running catalog"""
+    return catalog_write('remove', movie_id)
 
 if __name__ == '__main__':
     initialize_data()
@@ -0,0 +1,255 @@
+"""
+Benchmark suite for the movie recommender backend
+For each dataset size it generates synthetic TMDB CSVs (see
+generate_dataset.py), then in a fresh process per measurement:
+  - cold start: builds the model from the CSVs (per-stage timings, peak memory)
+  - warm start: loads the snapshot the cold start saved
+  - requests: /api/search, /api/recommend and /api/autocomplete through the Flask test client
+    (latency percentiles and throughput, result cache disabled)
+
+Results go to a JSON file; pass --compare with an earlier file to print the
+change per metric, e.g. between two commits.
+
+Usage:
+    python scripts/benchmark.py --sizes 5k 50k --out bench.json
+    python scripts/benchmark.py --sizes 5k --out new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(SCRIPTS_DIR, '..', 'backend')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from generate_dataset import SIZES, generate
+
+DEFAULT_REQUESTS = 500
+
+
+# -------------------------
+# Measurements (child process)
+# -------------------------
+def memory_mb():
+    """Current and peak resident set size in MB"""
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    usage[line[:5]] = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['VmHWM'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return {'rss_mb': round(usage.get('VmRSS', 0), 1), 'peak_rss_mb': round(usage.get('VmHWM', 0), 1)}
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': pick(50),
+        'p90_ms': pick(90),
+        'p99_ms': pick(99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'throughput_rps': round(len(ordered) / sum(ordered), 1),
+    }
+
+
+def _typo(title, rng):
+    """Drop one character so searches exercise the fuzzy path"""
+    if len(title) < 4:
+        return title
+    position = rng.randrange(1, len(title) - 1)
+    return title[:position] + title[position + 1:]
+
+
+def time_requests(client, paths):
+    samples = []
+    statuses = {}
+    for path in paths:
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    return dict(percentiles(samples), statuses=statuses)
+
+
+def run_child(phase, requests, seed):
+    """Start the API in this process and print one JSON result"""
+    from urllib.parse import quote
+
+    sys.path.insert(0, BACKEND_DIR)
+    import_start = time.perf_counter()
+    import api
+
+    holder = api.model_holder
+    while holder.state == 'loading':
+        time.sleep(0.01)
+    ready_seconds = time.perf_counter() - import_start
+    if holder.current is None:
+        raise SystemExit(f"Model failed to load: {holder.last_error}")
+
+    status = holder.status()
+    result = {
+        'seconds': round(ready_seconds, 3),
+        'stages': {info['stage']: info.get('seconds') for info in status['stages'] if info['state'] == 'done'},
+        'memory': memory_mb(),
+        'movies': len(holder.current),
+        'neighbors': status['neighbors'],
+    }
+    if phase == 'warm':
+        print(json.dumps(result))
+        return
+
+    model = holder.current
+    rng = random.Random(seed)
+    movies = [record for record in model.records if record is not None]
+    picks = [rng.choice(movies) for _ in range(requests)]
+    client = api.app.test_client()
+    client.get('/api/search?q=warmup')
+
+    result['requests'] = {
+        'search_exact': time_requests(client, [f"/api/search?q={quote(m['title'])}" for m in picks]),
+        'search_typo': time_requests(client, [f"/api/search?q={quote(_typo(m['title'], rng))}" for m in picks]),
+        'recommend_title': time_requests(client, [f"/api/recommend?movie={quote(m['title'])}" for m in picks]),
+        'recommend_typo': time_requests(
+            client, [f"/api/recommend?movie={quote(_typo(m['title'], rng))}" for m in picks]),
+        'recommend_id': time_requests(client, [f"/api/recommend?id={m['id']}" for m in picks]),
+        'autocomplete': time_requests(
+            client, [f"/api/autocomplete?prefix={quote(m['title'][:rng.randint(1, 6)])}" for m in picks]),
+    }
+    result['memory_after_requests'] = memory_mb()
+    print(json.dumps(result))
+
+
+# -------------------------
+# Orchestration (parent process)
+# -------------------------
+def measure(phase, data_dir, requests, seed):
+    env = dict(
+        os.environ,
+        MOVIES_CSV=os.path.join(data_dir, 'tmdb_5000_movies.csv'),
+        CREDITS_CSV=os.path.join(data_dir, 'tmdb_5000_credits.csv'),
+        MODEL_SNAPSHOT_DIR=os.path.join(data_dir, 'model_snapshot'),
+        CATALOG_JOURNAL=os.path.join(data_dir, 'catalog_updates.jsonl'),
+        RESULT_CACHE_SIZE='0',
+        MODEL_RELOAD_INTERVAL='0',
+    )
+    command = [sys.executable, os.path.abspath(__file__), '--child', phase,
+               '--requests', str(requests), '--seed', str(seed)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode:
+        raise SystemExit(f"{phase} run failed:\n{completed.stderr}")
+    # The server prints progress lines; the result is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def benchmark_size(label, rows, workdir, requests, seed):
+    data_dir = os.path.join(workdir, label)
+    if not os.path.exists(os.path.join(data_dir, 'tmdb_5000_credits.csv')):
+        print(f"[{label}] generating {rows} rows")
+        generate(rows, data_dir, seed)
+
+    snapshot_dir = os.path.join(data_dir, 'model_snapshot')
+    if os.path.isdir(snapshot_dir):
+        import shutil
+        shutil.rmtree(snapshot_dir)
+
+    print(f"[{label}] cold start and requests")
+    cold = measure('cold', data_dir, requests, seed)
+    print(f"[{label}] warm start")
+    warm = measure('warm', data_dir, requests, seed)
+    return {
+        'rows': rows,
+        'csv_mb': round(sum(os.path.getsize(os.path.join(data_dir, name)) for name in
+                            ('tmdb_5000_movies.csv', 'tmdb_5000_credits.csv')) / 2 ** 20, 1),
+        'cold_start': {key: value for key, value in cold.items() if key not in ('requests', 'memory_after_requests')},
+        'warm_start': warm,
+        'requests': cold['requests'],
+        'memory_after_requests': cold['memory_after_requests'],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(value, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numbers only"""
+    flat = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}{key}."))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix[:-1]] = value
+    return flat
+
+
+def compare(old, new):
+    """Print every numeric metric present in both result files with its relative change"""
+    before = flatten(old['sizes'])
+    after = flatten(new['sizes'])
+    print(f"\n{'metric':<55}{old.get('commit') or 'old':>12}{new.get('commit') or 'new':>12}{'change':>10}")
+    for key in sorted(before.keys() & after.keys()):
+        change = f"{(after[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else ''
+        print(f"{key:<55}{before[key]:>12}{after[key]:>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model startup, memory and API latency")
+    parser.add_argument('--sizes', nargs='+', default=['5k'], help="row counts or " + ", ".join(SIZES))
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="requests per endpoint scenario")
+    parser.add_argument('--workdir', default='benchmark_data', help="where generated datasets are kept")
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier results file to diff against")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.requests, args.seed)
+        return
+
+    results = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'requests_per_scenario': args.requests,
+        'sizes': {},
+    }
+    for label in args.sizes:
+        rows = SIZES.get(label) or int(label)
+        results['sizes'][label] = benchmark_size(label, rows, args.workdir, args.requests, args.seed)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()